@@ -0,0 +1,704 @@
+"""
+ASGI serving mode for the face-verification endpoints.
+
+/check_in, /api/check-out-verify and /api/submit-late-request are served here
+with the same request and response contract as backend.py, but CompreFace
+calls go through httpx.AsyncClient and the database through an aiomysql pool,
+so a request waiting on I/O holds no thread and one process can keep hundreds
+of verifications in flight. Every other path is passed to the Flask app, so
+this can run in place of the WSGI server or beside it:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+This mode needs packages the WSGI server does not, on top of backend.py's own:
+
+    pip install starlette httpx aiomysql uvicorn
+
+The nightly jobs are not started here unless ASGI_START_SCHEDULER=1. Set it
+for exactly one process (see backend.create_app): under `uvicorn --workers N`
+it applies to every worker, and each would run every job.
+
+Caches, store policies, rate limiters, headcounts and the live feed are the
+ones in backend.py; calls into them that can touch the database or disk run
+in a worker thread.
+"""
+import asyncio
+import json
+import math
+import os
+import time as _time
+from contextlib import asynccontextmanager
+from datetime import datetime, time, timedelta
+
+import aiomysql
+import httpx
+from starlette.applications import Starlette
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import backend
+from backend import (
+    CRITICAL, HOT_QUERIES, api_log, day_bounds, employee_cache, face_template_cache, headcounts,
+    publish_event, store_local_time, store_policies
+)
+
+ASGI_DB_POOL_MIN_SIZE = int(os.getenv("ASGI_DB_POOL_MIN_SIZE", "2"))
+ASGI_DB_POOL_MAX_SIZE = int(os.getenv("ASGI_DB_POOL_MAX_SIZE", "50"))
+ASGI_DB_ACQUIRE_TIMEOUT = float(os.getenv("ASGI_DB_ACQUIRE_TIMEOUT", str(backend.DB_POOL_ACQUIRE_TIMEOUT)))
+ASGI_COMPREFACE_MAX_CONCURRENCY = int(os.getenv("ASGI_COMPREFACE_MAX_CONCURRENCY", "256"))
+ASGI_COMPREFACE_TIMEOUT = float(os.getenv("ASGI_COMPREFACE_TIMEOUT", "30"))
+# Opt-in: set to 1 in the one process that should run the nightly jobs
+ASGI_START_SCHEDULER = os.getenv("ASGI_START_SCHEDULER", "0") == "1"
+
+ASYNC_PATHS = {'/check_in', '/api/check-out-verify', '/api/submit-late-request'}
+
+db_pool = None
+http_client = None
+compreface_slots = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global db_pool, http_client, compreface_slots
+    config = backend.DB_CONFIG
+    db_pool = await aiomysql.create_pool(
+        host=config['host'],
+        port=config.get('port', 3306),
+        user=config['user'],
+        password=config['password'],
+        db=config['database'],
+        charset=config['charset'],
+        autocommit=True,
+        connect_timeout=config['connect_timeout'],
+        sql_mode=config['sql_mode'],
+        minsize=ASGI_DB_POOL_MIN_SIZE,
+        maxsize=ASGI_DB_POOL_MAX_SIZE
+    )
+    http_client = httpx.AsyncClient(
+        timeout=ASGI_COMPREFACE_TIMEOUT,
+        limits=httpx.Limits(max_connections=ASGI_COMPREFACE_MAX_CONCURRENCY)
+    )
+    compreface_slots = asyncio.Semaphore(ASGI_COMPREFACE_MAX_CONCURRENCY)
+    try:
+        yield
+    finally:
+        await http_client.aclose()
+        db_pool.close()
+        await db_pool.wait_closed()
+
+
+# CompreFace
+
+async def _compreface_post(url, api_key, files=None, **kwargs):
+    # A slot is held for the HTTP call only, like backend.compreface_slot
+    try:
+        await asyncio.wait_for(compreface_slots.acquire(), backend.COMPREFACE_SLOT_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        raise backend.CompreFaceBusy() from None
+    try:
+        started = _time.monotonic()
+        response = await http_client.post(url, files=files, headers={'x-api-key': api_key}, **kwargs)
+    finally:
+        compreface_slots.release()
+    backend.compreface_latency_ms.add((_time.monotonic() - started) * 1000)
+    return response
+
+
+async def is_face_detected(image):
+    files = {'file': ('image.jpg', image, 'image/jpeg')}
+    response = await _compreface_post(backend.COMPRE_FACE_DETECT_URL, backend.COMPRE_FACE_DETECT_API_KEY, files)
+    if response.status_code != 200:
+        return False
+    return bool(response.json().get('result'))
+
+
+async def verify_faces(source_image, target_image):
+    files = {
+        'source_image': ('stored.jpg', source_image, 'image/jpeg'),
+        'target_image': ('uploaded.jpg', target_image, 'image/jpeg')
+    }
+    return await _compreface_post(backend.COMPRE_FACE_URL, backend.COMPRE_FACE_API_KEY, files)
+
+
+async def detect_face_embeddings(image):
+    files = {'file': ('image.jpg', image, 'image/jpeg')}
+    response = await _compreface_post(backend.COMPRE_FACE_DETECT_URL, backend.COMPRE_FACE_DETECT_API_KEY, files,
+                                      params={'face_plugins': 'calculator'})
+    if response.status_code != 200:
+        return None
+    return [face for face in response.json().get('result') or [] if face.get('embedding')]
+
+
+async def verify_embedding(probe, template):
+    return await _compreface_post(backend.embedding_verify_url(), backend.COMPRE_FACE_API_KEY,
+                                  json={'source': probe, 'targets': template})
+
+
+async def check_employee_face(employee, template, photo):
+    """
+    Async twin of backend.check_employee_face. The caller looks the template up
+    (see face_template) so no database connection is held during the CompreFace calls.
+    """
+    check = {'face_detected': False, 'similarity': None, 'match': False,
+             'method': 'template' if template else 'pair', 'error': None}
+    if template:
+        faces = await detect_face_embeddings(photo)
+        if not faces:
+            return check
+        check['face_detected'] = True
+        response = await verify_embedding(faces[0]['embedding'], template)
+        if response.status_code != 200:
+            check['error'] = response.text
+            return check
+        similarity = max(target['similarity'] for target in response.json()['result'])
+    else:
+        if not await is_face_detected(photo):
+            return check
+        check['face_detected'] = True
+        stored = await asyncio.to_thread(backend.load_stored_photo, employee['photo_url'])
+        response = await verify_faces(stored, photo)
+        if response.status_code != 200:
+            check['error'] = response.text
+            return check
+        similarity = response.json()['result'][0]['face_matches'][0]['similarity']
+
+    check['similarity'] = similarity
+    check['match'] = similarity >= backend.FACE_MATCH_THRESHOLD
+    backend.record_face_verification(employee['employee_id'], check['match'], check['method'])
+    return check
+
+
+# Database
+
+async def lookup_employee(cursor, employee_id):
+    """Async twin of backend.lookup_employee, sharing its cache"""
+    key = str(employee_id)
+    employee = employee_cache.get(key)
+    if employee is None:
+        await cursor.execute(HOT_QUERIES['employee_by_id'], (employee_id,))
+        employee = await cursor.fetchone()
+        if employee is not None:
+            employee_cache.put(key, employee)
+    return employee
+
+
+async def face_template(cursor, employee_id):
+    """Async twin of backend.face_template, sharing its cache"""
+    key = str(employee_id)
+    template = face_template_cache.get(key)
+    if template is None:
+        await cursor.execute(HOT_QUERIES['face_template'], (employee_id,))
+        row = await cursor.fetchone()
+        template = json.loads(row['template']) if row else []
+        face_template_cache.put(key, template)
+    return template
+
+
+@asynccontextmanager
+async def db_cursor():
+    """
+    A dict cursor on a pooled connection for one short block of queries.
+    Waits at most ASGI_DB_ACQUIRE_TIMEOUT for a free connection.
+    """
+    try:
+        conn = await asyncio.wait_for(db_pool.acquire(), ASGI_DB_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise backend.PoolTimeoutError(
+            f"No connection available in the ASGI pool after {ASGI_DB_ACQUIRE_TIMEOUT:.1f}s") from None
+    try:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            yield cursor
+    finally:
+        db_pool.release(conn)
+
+
+async def fetch_one(cursor, name, params):
+    await cursor.execute(HOT_QUERIES[name], params)
+    return await cursor.fetchone()
+
+
+# Admission: the same per-employee, per-client and per-store buckets as
+# backend.rate_limited; CompreFace calls take an asyncio semaphore slot in
+# place of the thread one (see _compreface_post)
+
+def verification_endpoint(handler):
+    async def endpoint(request):
+        form = await request.form()
+        checks = [('client', backend.client_limiter,
+                   request.headers.get('X-Device-Id') or (request.client.host if request.client else None))]
+        if form.get('employee_id'):
+            checks.append(('employee', backend.employee_limiter, form['employee_id']))
+        try:
+            store = await asyncio.to_thread(
+                backend.find_nearest_store, float(form['latitude']), float(form['longitude'])
+            )
+        except (KeyError, TypeError, ValueError):
+            store = None
+        if store:
+            checks.append(('store', backend.store_limiter, store))
+
+        refused = backend.take_tokens(checks)
+        if refused:
+            return _too_many_requests(*refused)
+
+        with backend._load_stats_lock:
+            backend.load_shedding_stats['in_flight'][CRITICAL] += 1
+        try:
+            return await handler(request, form)
+        except backend.CompreFaceBusy:
+            return _too_many_requests('compreface_busy', backend.COMPREFACE_SLOT_WAIT_SECONDS)
+        finally:
+            with backend._load_stats_lock:
+                backend.load_shedding_stats['in_flight'][CRITICAL] -= 1
+            await form.close()
+    return endpoint
+
+
+def _too_many_requests(reason, retry_after):
+    with backend._rate_limit_stats_lock:
+        backend.rate_limit_rejections[reason] += 1
+    retry_after = max(1, math.ceil(retry_after))
+    return JSONResponse({
+        'error': 'Too many requests, please retry shortly',
+        'reason': reason,
+        'retry_after': retry_after
+    }, status_code=429, headers={'Retry-After': str(retry_after)})
+
+
+def _photo_missing(form):
+    photo = form.get('photo')
+    if photo is None or isinstance(photo, str) or 'employee_id' not in form:
+        return JSONResponse({'error': 'Missing photo or employee_id'}, status_code=400)
+    if photo.filename == '':
+        return JSONResponse({'error': 'No selected file'}, status_code=400)
+    return None
+
+
+# Endpoints
+
+async def check_in(request, form):
+    missing = _photo_missing(form)
+    if missing:
+        return missing
+
+    employee_id = form['employee_id']
+    user_lat = form.get('latitude')
+    user_lon = form.get('longitude')
+    timestamp = form.get('timestamp')
+
+    try:
+        # Check if employee exists. Connections are borrowed per block of queries and
+        # never held across a CompreFace call
+        async with db_cursor() as cursor:
+            result = await lookup_employee(cursor, employee_id)
+            template = await face_template(cursor, employee_id) if result else None
+        if result is None:
+            return JSONResponse({'error': 'Employee not found'}, status_code=404)
+
+        stored_photo_path = result['photo_url']
+        emp_name = result['name']
+
+        if not os.path.exists(stored_photo_path):
+            return JSONResponse({'error': 'Stored photo not found'}, status_code=404)
+
+        # Detect the face and compare it with the employee's references
+        face = await check_employee_face(result, template, await form['photo'].read())
+        if not face['face_detected']:
+            return JSONResponse({'error': 'No face detected in uploaded photo'}, status_code=400)
+
+        if face['error'] is not None:
+            return JSONResponse({'error': 'CompreFace verification failed', 'details': face['error']},
+                                status_code=500)
+
+        similarity = face['similarity']
+        is_match = face['match']
+
+        response_data = {
+            'match': is_match,
+            'similarity': similarity,
+            'face_verification': 'success' if is_match else 'failed',
+            'location_check': None,
+            'time_check': None,
+            'attendance_recorded': False,
+            'message': None
+        }
+
+        if not is_match:
+            response_data['message'] = 'Face verification failed - attendance not recorded'
+            return JSONResponse(response_data)
+
+        # Location validation
+        if not user_lat or not user_lon:
+            response_data['location_check'] = 'missing_coordinates'
+            response_data['message'] = 'Location coordinates missing - attendance not recorded'
+            return JSONResponse(response_data)
+
+        try:
+            user_lat = float(user_lat)
+            user_lon = float(user_lon)
+        except (ValueError, TypeError):
+            response_data['location_check'] = 'invalid_coordinates'
+            response_data['message'] = 'Invalid location coordinates - attendance not recorded'
+            return JSONResponse(response_data)
+
+        store_location = await asyncio.to_thread(backend.find_nearest_store, user_lat, user_lon)
+
+        if not store_location:
+            response_data['location_check'] = 'too_far_from_store'
+            response_data['message'] = 'You are not within range of any store location - attendance not recorded'
+            return JSONResponse(response_data)
+
+        response_data['location_check'] = 'success'
+        response_data['store_location'] = store_location
+
+        # Time validation, against the store's own timezone and cutoff
+        store_policy = await asyncio.to_thread(store_policies.get, store_location)
+        check_time = store_local_time(store_policy, timestamp)
+        cutoff = store_policy['checkin_cutoff']
+
+        is_on_time = check_time.time() <= cutoff
+
+        has_approved_late_request = False
+        if not is_on_time:
+            async with db_cursor() as cursor:
+                late_request = await fetch_one(
+                    cursor, 'late_request_for_day', (employee_id, *day_bounds(check_time.date()))
+                )
+            has_approved_late_request = bool(late_request and late_request['status'] == 'Accepted')
+
+        if is_on_time:
+            attendance_status = 'Present'
+            response_data['time_check'] = 'on_time'
+        elif has_approved_late_request:
+            attendance_status = 'Late'
+            response_data['time_check'] = 'late_with_approval'
+        else:
+            response_data['time_check'] = 'late_without_approval'
+            response_data['message'] = f"Check-in after {cutoff.strftime('%I:%M %p')} without approved late arrival request - attendance not recorded"
+            return JSONResponse(response_data)
+
+        # Record attendance
+        async with db_cursor() as cursor:
+            await cursor.execute(HOT_QUERIES['upsert_attendance'], (
+                employee_id, store_location, check_time.date(), attendance_status, check_time.time(), None
+            ))
+        headcounts.record(check_time.date(), employee_id, store_location, attendance_status)
+
+        publish_event('attendance.check_in', {
+            'employee_id': employee_id,
+            'name': emp_name,
+            'date': check_time.date().isoformat(),
+            'status': attendance_status,
+            'check_in': check_time.strftime('%H:%M:%S')
+        }, store=store_location)
+
+        response_data.update({
+            'attendance_recorded': True,
+            'attendance_status': attendance_status,
+            'check_in_time': check_time.strftime('%H:%M:%S'),
+            'message': f'Attendance successfully recorded as {attendance_status} at {store_location}'
+        })
+
+        return JSONResponse(response_data)
+
+    except backend.CompreFaceBusy:
+        raise
+    except Exception:
+        api_log.exception("Error during check-in")
+        return JSONResponse({'error': 'Internal server error during check-in'}, status_code=500)
+
+
+async def submit_late_request(request, form):
+    missing = _photo_missing(form)
+    if missing:
+        return missing
+
+    employee_id = form['employee_id']
+    user_lat = form.get('latitude')
+    user_lon = form.get('longitude')
+    requested_time = form.get('time')
+
+    if not requested_time:
+        return JSONResponse({'error': 'Requested time is required'}, status_code=400)
+
+    try:
+        # Check if employee exists. Connections are borrowed per block of queries and
+        # never held across a CompreFace call
+        async with db_cursor() as cursor:
+            result = await lookup_employee(cursor, employee_id)
+            template = await face_template(cursor, employee_id) if result else None
+        if result is None:
+            return JSONResponse({'error': 'Employee not found'}, status_code=404)
+
+        stored_photo_path = result['photo_url']
+        emp_name = result['name']
+        emp_branch = result['permanent_location']
+
+        if not os.path.exists(stored_photo_path):
+            return JSONResponse({'error': 'Stored photo not found'}, status_code=404)
+
+        # Detect the face and compare it with the employee's references
+        face = await check_employee_face(result, template, await form['photo'].read())
+        if not face['face_detected']:
+            return JSONResponse({'error': 'No face detected in uploaded photo'}, status_code=400)
+
+        if face['error'] is not None:
+            return JSONResponse({'error': 'CompreFace verification failed', 'details': face['error']},
+                                status_code=500)
+
+        similarity = face['similarity']
+        is_match = face['match']
+
+        response_data = {
+            'success': False,
+            'match': is_match,
+            'similarity': similarity,
+            'face_verification': 'success' if is_match else 'failed',
+            'location_check': None,
+            'request_submitted': False,
+            'message': None
+        }
+
+        if not is_match:
+            response_data['message'] = 'Face verification failed - late arrival request not submitted'
+            return JSONResponse(response_data)
+
+        # Location validation
+        if not user_lat or not user_lon:
+            response_data['location_check'] = 'missing_coordinates'
+            response_data['message'] = 'Location coordinates missing - late arrival request not submitted'
+            return JSONResponse(response_data)
+
+        try:
+            user_lat = float(user_lat)
+            user_lon = float(user_lon)
+        except (ValueError, TypeError):
+            response_data['location_check'] = 'invalid_coordinates'
+            response_data['message'] = 'Invalid location coordinates - late arrival request not submitted'
+            return JSONResponse(response_data)
+
+        store_location = await asyncio.to_thread(backend.find_nearest_store, user_lat, user_lon)
+
+        if not store_location:
+            response_data['location_check'] = 'too_far_from_store'
+            response_data['message'] = 'You are not within range of any store location - late arrival request not submitted'
+            return JSONResponse(response_data)
+
+        response_data['location_check'] = 'success'
+        response_data['store_location'] = store_location
+
+        # Check existing request for today
+        store_policy = await asyncio.to_thread(store_policies.get, store_location)
+        today = store_local_time(store_policy).date()
+        async with db_cursor() as cursor:
+            existing = await fetch_one(cursor, 'late_request_for_day', (employee_id, *day_bounds(today)))
+        if existing:
+            response_data['message'] = 'Late arrival request already submitted for today'
+            return JSONResponse(response_data, status_code=400)
+
+        # Parse time
+        try:
+            if len(requested_time.split(':')) == 2:
+                requested_time += ":00"
+
+            time_obj = datetime.strptime(requested_time, "%H:%M:%S").time()
+            requested_datetime = datetime.combine(today, time_obj)
+
+        except ValueError:
+            response_data['message'] = 'Invalid time format. Use HH:MM or HH:MM:SS'
+            return JSONResponse(response_data, status_code=400)
+
+        # Insert request
+        async with db_cursor() as cursor:
+            await cursor.execute("""
+                INSERT INTO LateArrivalRequests (employee_id, requested_at, status)
+                VALUES (%s, %s, %s)
+            """, (employee_id, requested_datetime, 'Pending'))
+            request_id = cursor.lastrowid
+
+        publish_event('late_request.submitted', {
+            'request_id': request_id,
+            'employee_id': employee_id,
+            'name': emp_name,
+            'branch': emp_branch,
+            'requested_at': requested_datetime.strftime('%H:%M:%S'),
+            'status': 'Pending'
+        }, store=store_location)
+
+        response_data.update({
+            'success': True,
+            'request_submitted': True,
+            'message': f'Late arrival request submitted successfully for {emp_name}',
+            'request_id': request_id,
+            'employee_name': emp_name,
+            'requested_time': requested_time,
+            'status': 'Pending',
+            'requested_at': requested_datetime.strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+        return JSONResponse(response_data, status_code=201)
+
+    except backend.CompreFaceBusy:
+        raise
+    except Exception:
+        api_log.exception("Error submitting late arrival request")
+        return JSONResponse({'success': False, 'error': 'Failed to submit request'}, status_code=500)
+
+
+async def check_out_verify(request, form):
+    missing = _photo_missing(form)
+    if missing:
+        return missing
+
+    employee_id = form['employee_id']
+    timestamp = form.get('timestamp')
+
+    response_data = {
+        'face_verification': None,
+        'check_out_recorded': False,
+        'message': None
+    }
+
+    try:
+        # Check if employee exists. Connections are borrowed per block of queries and
+        # never held across a CompreFace call
+        async with db_cursor() as cursor:
+            result = await lookup_employee(cursor, employee_id)
+            template = await face_template(cursor, employee_id) if result else None
+
+        if result is None:
+            response_data['face_verification'] = 'employee_not_found'
+            response_data['message'] = 'Employee not found'
+            return JSONResponse(response_data, status_code=404)
+
+        stored_photo_path = result['photo_url']
+        emp_name = result['name']
+
+        if not stored_photo_path or not os.path.exists(stored_photo_path):
+            response_data['face_verification'] = 'no_stored_photo'
+            response_data['message'] = 'No stored photo found for employee'
+            return JSONResponse(response_data, status_code=404)
+
+        # Check for active check-in, on the employee's store-local date
+        home_policy = await asyncio.to_thread(store_policies.get, result['permanent_location'])
+        today = store_local_time(home_policy).date()
+        async with db_cursor() as cursor:
+            attendance_record = await fetch_one(cursor, 'attendance_for_day', (employee_id, today))
+
+        if not backend.is_active_shift(attendance_record):
+            response_data['face_verification'] = 'no_active_checkin'
+            response_data['message'] = 'No active check-in found for today. Please check-in first.'
+            return JSONResponse(response_data, status_code=404)
+
+        # Face detection and verification against the employee's references
+        face = await check_employee_face(result, template, await form['photo'].read())
+        if not face['face_detected']:
+            response_data['face_verification'] = 'no_face_detected'
+            response_data['message'] = 'No face detected in uploaded photo'
+            return JSONResponse(response_data, status_code=400)
+
+        if face['error'] is not None:
+            response_data['face_verification'] = 'verification_service_error'
+            response_data['message'] = 'Face verification service failed'
+            response_data['details'] = face['error']
+            return JSONResponse(response_data, status_code=500)
+
+        similarity = face['similarity']
+        is_match = face['match']
+
+        response_data['similarity'] = similarity
+        response_data['match'] = is_match
+
+        if not is_match:
+            response_data['face_verification'] = 'face_mismatch'
+            response_data['message'] = f'Face verification failed. Similarity: {similarity:.2f}'
+            return JSONResponse(response_data)
+
+        response_data['face_verification'] = 'success'
+
+        # Parse timestamp
+        record_policy = await asyncio.to_thread(store_policies.get, attendance_record['current_location'])
+        check_out_time = store_local_time(record_policy, timestamp)
+
+        # Validate check-out time
+        check_in_value = attendance_record['check_in']
+        if isinstance(check_in_value, datetime):
+            check_in_datetime = check_in_value
+        elif isinstance(check_in_value, timedelta):
+            check_in_datetime = datetime.combine(today, time(0, 0)) + check_in_value
+        else:
+            check_in_datetime = datetime.combine(today, check_in_value)
+
+        if check_out_time < check_in_datetime:
+            response_data['time_validation'] = 'invalid_checkout_time'
+            response_data['message'] = f'Check-out time cannot be before check-in time ({check_in_value})'
+            return JSONResponse(response_data, status_code=400)
+
+        response_data['time_validation'] = 'success'
+
+        check_out_time = check_out_time.replace(microsecond=0)
+        worked_seconds = int((check_out_time - check_in_datetime).total_seconds())
+        hours_worked = worked_seconds / 3600
+        async with db_cursor() as cursor:
+            await cursor.execute("""
+                UPDATE Attendance
+                SET check_out = %s, worked_seconds = %s, version = version + 1
+                WHERE attendance_id = %s
+            """, (check_out_time.time(), worked_seconds, attendance_record['attendance_id']))
+        headcounts.record(today, employee_id, attendance_record['current_location'],
+                          attendance_record['status'], checked_out=True)
+
+        publish_event('attendance.check_out', {
+            'employee_id': employee_id,
+            'name': emp_name,
+            'date': today.isoformat(),
+            'status': attendance_record['status'],
+            'check_out': check_out_time.strftime('%H:%M:%S'),
+            'hours_worked': round(hours_worked, 2)
+        }, store=attendance_record['current_location'])
+
+        response_data.update({
+            'check_out_recorded': True,
+            'employee_name': emp_name,
+            'check_in_time': str(attendance_record['check_in']),
+            'check_out_time': check_out_time.strftime('%H:%M:%S'),
+            'attendance_status': attendance_record['status'],
+            'location': attendance_record['current_location'],
+            'hours_worked': round(hours_worked, 2),
+            'message': f'Successfully checked out {emp_name} at {check_out_time.strftime("%H:%M:%S")}'
+        })
+
+        return JSONResponse(response_data, status_code=200)
+
+    except backend.CompreFaceBusy:
+        raise
+    except Exception:
+        api_log.exception("Error during check-out verification")
+        response_data['face_verification'] = 'system_error'
+        response_data['message'] = 'Internal server error during check-out'
+        return JSONResponse(response_data, status_code=500)
+
+
+def _cors_for_async_paths(inner):
+    """Apply the Flask app's CORS policy to the async routes only; Flask handles its own"""
+    cors = CORSMiddleware(inner, allow_origins=backend.CORS_ORIGINS, allow_methods=['*'], allow_headers=['*'])
+
+    async def asgi(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] in ASYNC_PATHS:
+            await cors(scope, receive, send)
+        else:
+            await inner(scope, receive, send)
+    return asgi
+
+
+app = _cors_for_async_paths(Starlette(
+    routes=[
+        Route('/check_in', verification_endpoint(check_in), methods=['POST']),
+        Route('/api/check-out-verify', verification_endpoint(check_out_verify), methods=['POST']),
+        Route('/api/submit-late-request', verification_endpoint(submit_late_request), methods=['POST']),
+        Mount('/', app=WSGIMiddleware(backend.create_app(start_scheduler=ASGI_START_SCHEDULER))),
+    ],
+    lifespan=lifespan
+))
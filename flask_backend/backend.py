@@ -1,26 +1,137 @@
-
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_request_context, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 import os
+import threading
 from werkzeug.utils import secure_filename
 import mysql.connector
-import mysql.connector.pooling
-import requests
 import base64
+import json
+import gzip
 from flask_cors import CORS
 import random
 from datetime import datetime, date, time, timedelta
+from decimal import Decimal
 import math
 from contextlib import contextmanager
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+from functools import wraps
+from collections import deque, OrderedDict
+import time as _time
 import atexit
+import cProfile
+import pstats
+import io
+import marshal
+import hmac
+import mmap
 import logging
+import logging.handlers
+import queue
+import copy
+import sys
+import uuid
 import pytz
 from dotenv import load_dotenv
 
 
 load_dotenv()
 
+# Logging. Records are handed to a queue on the calling thread and formatted
+# and written by a listener thread, so request threads never block on stdout.
+# Installed by create_app(), so importing this module starts no threads.
+# LOG_LEVELS overrides single loggers, e.g. "attendance.db=DEBUG,attendance.jobs.rows=WARNING".
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Per-row job logs (one line per rejected request, ...) keep 1 in this many
+LOG_ROW_SAMPLE_EVERY = max(1, int(os.getenv("LOG_ROW_SAMPLE_EVERY", "100")))
+
+log = logging.getLogger('attendance')
+db_log = logging.getLogger('attendance.db')
+api_log = logging.getLogger('attendance.api')
+jobs_log = logging.getLogger('attendance.jobs')
+row_log = logging.getLogger('attendance.jobs.rows')
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in ('request_id', 'sample_every'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves message and traceback formatting to the listener.
+    The stock prepare() formats on the calling thread; the queue never leaves
+    this process, so the record can be passed through as is.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if getattr(record, 'request_id', None) is None and has_request_context():
+            record.request_id = g.get('request_id')
+        return record
+
+
+class _SampleFilter(logging.Filter):
+    """Let through the first and then every Nth record per message template"""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        self._seen = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        seen = self._seen.get(record.msg, 0)
+        self._seen[record.msg] = seen + 1
+        record.sample_every = self.every
+        return seen % self.every == 0
+
+
+_log_handler = _DeferredQueueHandler(queue.SimpleQueue())
+_log_listener = None
+
+
+def _start_log_listener():
+    """(Re)start the writer thread; called by configure_logging() and in forked workers"""
+    global _log_listener
+    _log_handler.queue = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(
+        '%(asctime)s %(levelname)s %(name)s %(message)s'))
+    _log_listener = logging.handlers.QueueListener(_log_handler.queue, output)
+    _log_listener.start()
+
+
+def configure_logging():
+    """Install the queue handler and start its writer thread; safe to call more than once"""
+    if _log_listener is not None:
+        return
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_log_handler)
+    for item in filter(None, (part.strip() for part in LOG_LEVELS.split(','))):
+        name, _, level = item.partition('=')
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
+    row_log.addFilter(_SampleFilter(LOG_ROW_SAMPLE_EVERY))
+    _start_log_listener()
+    atexit.register(lambda: _log_listener.stop())
+
+
 COMPRE_FACE_API_KEY = os.getenv("COMPRE_FACE_API_KEY")
 COMPRE_FACE_URL = os.getenv("COMPRE_FACE_URL")
 
@@ -28,7 +139,149 @@ COMPRE_FACE_DETECT_API_KEY = os.getenv("COMPRE_FACE_DETECT_API_KEY")
 COMPRE_FACE_DETECT_URL = os.getenv("COMPRE_FACE_DETECT_URL")
 
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": ["http://localhost:5173", "https://attendance-registration.vercel.app"]}})
+CORS_ORIGINS = ["http://localhost:5173", "https://attendance-registration.vercel.app"]
+CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS}})
+
+# JSON encoding. "orjson" is used when installed and falls back to the stdlib
+# encoder otherwise; "stdlib" forces the fallback.
+JSON_PROVIDER = os.getenv("JSON_PROVIDER", "orjson")
+# Compress JSON/text responses at least this large when the client accepts it
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "5"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+COMPRESS_MIMETYPES = {'application/json', 'text/plain', 'text/html', 'text/csv'}
+
+
+def json_default(value):
+    """
+    Encode the column types mysql-connector returns, in the formats the
+    endpoints used to build by hand: dates as YYYY-MM-DD, datetimes as
+    YYYY-MM-DD HH:MM:SS, TIME columns (timedeltas) as H:MM:SS.
+    """
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='seconds')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, time):
+        return value.isoformat(timespec='seconds')
+    if isinstance(value, timedelta):
+        seconds = int(value.total_seconds())
+        sign = '-' if seconds < 0 else ''
+        hours, rest = divmod(abs(seconds), 3600)
+        return f"{sign}{hours}:{rest // 60:02d}:{rest % 60:02d}"
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider that encodes with orjson when it is installed, so endpoints
+    can hand database rows to jsonify() without converting each field first.
+    Keys are not sorted. Dates, times and datetimes are passed through to
+    json_default() rather than using orjson's ISO "T" format, keeping the
+    output identical to the stdlib fallback.
+    """
+    sort_keys = False
+
+    def __init__(self, app, backend=JSON_PROVIDER):
+        super().__init__(app)
+        self._orjson = None
+        if backend == 'orjson':
+            try:
+                import orjson
+                self._orjson = orjson
+                self._options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            except ImportError:
+                log.info("orjson not installed, using the stdlib JSON encoder")
+
+    @property
+    def name(self):
+        return 'orjson' if self._orjson else 'stdlib'
+
+    def dumps_bytes(self, obj):
+        if self._orjson:
+            return self._orjson.dumps(obj, default=json_default, option=self._options)
+        return json.dumps(obj, default=json_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+    def dumps(self, obj, **kwargs):
+        if self._orjson and not kwargs:
+            return self.dumps_bytes(obj).decode()
+        kwargs.setdefault('default', json_default)
+        kwargs.setdefault('ensure_ascii', False)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self._orjson and not kwargs:
+            return self._orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
+app.json = FastJSONProvider(app)
+
+_brotli = None
+
+
+def _brotli_module():
+    """brotli is optional; import it once and remember whether it is there"""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli
+
+
+@app.after_request
+def compress_response(response):
+    """gzip or brotli encode large responses according to Accept-Encoding"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if response.content_length is not None and response.content_length < COMPRESS_MIN_BYTES:
+        return response
+
+    accepted = request.accept_encodings
+    brotli = _brotli_module() if accepted['br'] else None
+    if not brotli and not accepted['gzip']:
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    if brotli:
+        response.set_data(brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    else:
+        response.set_data(gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+@app.before_request
+def assign_request_id():
+    """Tag the request (and its log lines) with the caller's X-Request-Id or a new one"""
+    g.request_id = (request.headers.get('X-Request-Id') or uuid.uuid4().hex[:16])[:64]
+
+
+@app.after_request
+def echo_request_id(response):
+    response.headers['X-Request-Id'] = g.get('request_id', '')
+    return response
 
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -49,62 +302,1130 @@ DB_CONFIG = {
     'sql_mode': 'STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO'
 }
 
-# Create Connection Pool
-try:
-    connection_pool = mysql.connector.pooling.MySQLConnectionPool(
-        pool_name="attendance_pool",
-        pool_size=10,
-        pool_reset_session=True,
-        **DB_CONFIG
-    )
-    print("Database connection pool created successfully")
-except mysql.connector.Error as e:
-    print(f"Error creating connection pool: {e}")
-    raise
+# Read replica used by reporting endpoints. Leave DB_REPLICA_HOST unset to send
+# every query to the primary.
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+DB_REPLICA_CONFIG = {**DB_CONFIG, 'host': DB_REPLICA_HOST, 'port': int(os.getenv("DB_REPLICA_PORT", "3306"))}
+REPLICA_MAX_LAG_SECONDS = int(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_INTERVAL = int(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "10"))
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+# Pool sizing. The pool opens DB_POOL_MIN_SIZE connections up front, grows up
+# to DB_POOL_MAX_SIZE while every connection is busy, and closes connections
+# that sat idle for DB_POOL_IDLE_TIMEOUT seconds. Callers that find the pool
+# at its ceiling queue (first come, first served) for DB_POOL_ACQUIRE_TIMEOUT;
+# once DB_POOL_MAX_WAITERS are already queued, further callers fail at once
+# rather than tying up a request thread each while the database is stalled.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+DB_POOL_MAX_WAITERS = int(os.getenv("DB_POOL_MAX_WAITERS", "50"))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300"))
+DB_POOL_HEALTH_CHECK_AFTER = float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30"))
+# Resetting the session on every return also drops the connection's prepared
+# statements, so it is off unless explicitly requested.
+DB_POOL_RESET_SESSION = os.getenv("DB_POOL_RESET_SESSION", "0") == "1"
+
+# Upper bounds (ms) of the pool wait-time histogram buckets
+POOL_WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class DecayingAverage:
+    """
+    Exponentially weighted moving average that also decays toward zero while
+    no samples arrive, so a burst that has passed stops counting as load.
+    """
+
+    def __init__(self, alpha=0.2, half_life=10.0):
+        self.alpha = alpha
+        self.half_life = half_life
+        self._value = 0.0
+        self._updated = _time.monotonic()
+        self._lock = threading.Lock()
+
+    def _decayed(self, now):
+        return self._value * 0.5 ** ((now - self._updated) / self.half_life)
+
+    def add(self, sample):
+        now = _time.monotonic()
+        with self._lock:
+            value = self._decayed(now)
+            self._value = value + self.alpha * (sample - value)
+            self._updated = now
+
+    @property
+    def value(self):
+        with self._lock:
+            return self._decayed(_time.monotonic())
+
+
+class PoolTimeoutError(mysql.connector.errors.PoolError):
+    """Raised when no connection becomes available within the acquire timeout"""
+
+
+class PoolSaturatedError(PoolTimeoutError):
+    """Raised without waiting when the pool's wait queue is already full"""
+
+
+class _PoolSlot:
+    """A physical connection owned by the pool"""
+    __slots__ = ('raw', 'created_at', 'last_used', 'statements')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = self.last_used = _time.monotonic()
+        self.statements = {}
+
+
+class _PoolWaiter:
+    __slots__ = ('event', 'slot', 'may_open')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.slot = None
+        self.may_open = False
+
+
+class PooledConnection:
+    """A checked-out connection. close() returns it to the pool."""
+
+    def __init__(self, pool, slot):
+        self._pool = pool
+        self._slot = slot
+
+    @property
+    def slot(self):
+        return self._slot
+
+    def __getattr__(self, name):
+        if self._slot is None:
+            raise mysql.connector.errors.InterfaceError("Connection already returned to the pool")
+        return getattr(self._slot.raw, name)
+
+    def is_connected(self):
+        return self._slot is not None and self._slot.raw.is_connected()
+
+    def close(self):
+        if self._slot is not None:
+            slot, self._slot = self._slot, None
+            self._pool._release(slot)
+
+
+class AdaptiveConnectionPool:
+    """
+    Connection pool with a FIFO wait queue, on-demand growth up to a ceiling,
+    idle shrinking, health checks on checkout and wait-time telemetry.
+    """
+
+    def __init__(self, pool_name, min_size, max_size, acquire_timeout, idle_timeout,
+                 health_check_after, reset_session=True, max_waiters=None, **config):
+        self.pool_name = pool_name
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.acquire_timeout = acquire_timeout
+        self.max_waiters = max_waiters
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.reset_session = reset_session
+        self._config = config
+
+        self._lock = threading.Lock()
+        self._idle = deque()
+        self._waiters = deque()
+        self._size = 0
+        self._in_use = 0
+
+        self._wait_counts = [0] * (len(POOL_WAIT_BUCKETS_MS) + 1)
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+        self.recent_wait_ms = DecayingAverage()
+        self._counters = {'acquired': 0, 'timeouts': 0, 'rejected': 0, 'opened': 0, 'closed': 0,
+                          'health_check_failures': 0}
+
+        self.prewarm(min_size)
+
+    def _open(self):
+        raw = mysql.connector.connect(**self._config)
+        with self._lock:
+            self._counters['opened'] += 1
+        return _PoolSlot(raw)
+
+    def _discard(self, slot):
+        try:
+            slot.raw.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._counters['closed'] += 1
+
+    def prewarm(self, count):
+        """Open connections until at least `count` exist (bounded by max_size)"""
+        opened = 0
+        while True:
+            with self._lock:
+                if self._size >= min(count, self.max_size):
+                    break
+                self._size += 1
+            try:
+                slot = self._open()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                raise
+            self._release(slot, returning=False)
+            opened += 1
+        return opened
+
+    def get_connection(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = _time.monotonic()
+        slot = None
+        waiter = None
+        may_open = False
+
+        with self._lock:
+            self._shrink_locked(started)
+            if self._idle and not self._waiters:
+                slot = self._idle.pop()
+                self._in_use += 1
+            elif self._size < self.max_size and not self._waiters:
+                self._size += 1
+                self._in_use += 1
+                may_open = True
+            elif self.max_waiters is not None and len(self._waiters) >= self.max_waiters:
+                self._counters['rejected'] += 1
+                raise PoolSaturatedError(
+                    f"Pool '{self.pool_name}' has {len(self._waiters)} callers waiting already")
+            else:
+                waiter = _PoolWaiter()
+                self._waiters.append(waiter)
+
+        if waiter is not None:
+            if not waiter.event.wait(timeout):
+                with self._lock:
+                    if waiter.slot is None and not waiter.may_open:
+                        self._waiters.remove(waiter)
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"No connection available in pool '{self.pool_name}' after {timeout:.1f}s")
+            slot, may_open = waiter.slot, waiter.may_open
+
+        if may_open:
+            try:
+                slot = self._open()
+            except Exception:
+                self._forget_slot()
+                raise
+
+        try:
+            slot = self._health_check(slot)
+        except Exception:
+            self._forget_slot()
+            raise
+
+        self._record_wait((_time.monotonic() - started) * 1000)
+        return PooledConnection(self, slot)
+
+    def _health_check(self, slot):
+        if _time.monotonic() - slot.last_used < self.health_check_after:
+            return slot
+        try:
+            slot.raw.ping(reconnect=False)
+            return slot
+        except Exception:
+            with self._lock:
+                self._counters['health_check_failures'] += 1
+            self._discard(slot)
+            return self._open()
+
+    def _forget_slot(self):
+        """A checked-out slot could not be (re)opened; free its place for the next waiter"""
+        with self._lock:
+            self._in_use -= 1
+            self._size -= 1
+            self._hand_off_capacity_locked()
+
+    def _hand_off_capacity_locked(self):
+        if self._waiters and self._size < self.max_size:
+            waiter = self._waiters.popleft()
+            self._size += 1
+            self._in_use += 1
+            waiter.may_open = True
+            waiter.event.set()
+
+    def _release(self, slot, returning=True):
+        healthy = True
+        try:
+            if not slot.raw.is_connected():
+                healthy = False
+            else:
+                if slot.raw.in_transaction:
+                    slot.raw.rollback()
+                if self.reset_session:
+                    close_prepared_statements(slot)
+                    slot.raw.reset_session()
+        except Exception:
+            healthy = False
+
+        if not healthy:
+            self._discard(slot)
+            with self._lock:
+                if returning:
+                    self._in_use -= 1
+                self._size -= 1
+                self._hand_off_capacity_locked()
+            return
+
+        slot.last_used = _time.monotonic()
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.slot = slot
+                if not returning:
+                    self._in_use += 1
+                waiter.event.set()
+                return
+            if returning:
+                self._in_use -= 1
+            self._idle.append(slot)
+
+    def _shrink_locked(self, now):
+        """Close connections idle for longer than idle_timeout, keeping min_size open"""
+        while self._idle and self._size > self.min_size and now - self._idle[0].last_used > self.idle_timeout:
+            slot = self._idle.popleft()
+            self._size -= 1
+            self._counters['closed'] += 1
+            try:
+                slot.raw.close()
+            except Exception:
+                pass
+
+    def _record_wait(self, wait_ms):
+        self.recent_wait_ms.add(wait_ms)
+        bucket = len(POOL_WAIT_BUCKETS_MS)
+        for i, bound in enumerate(POOL_WAIT_BUCKETS_MS):
+            if wait_ms <= bound:
+                bucket = i
+                break
+        with self._lock:
+            self._wait_counts[bucket] += 1
+            self._wait_total_ms += wait_ms
+            self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+            self._counters['acquired'] += 1
+
+    def stats(self):
+        with self._lock:
+            acquired = self._counters['acquired']
+            histogram = {f"le_{bound}": count for bound, count in zip(POOL_WAIT_BUCKETS_MS, self._wait_counts)}
+            histogram['inf'] = self._wait_counts[-1]
+            return {
+                'pool_name': self.pool_name,
+                'size': self._size,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiters': len(self._waiters),
+                'max_waiters': self.max_waiters,
+                'wait_ms': {
+                    'avg': round(self._wait_total_ms / acquired, 3) if acquired else 0.0,
+                    'recent': round(self.recent_wait_ms.value, 3),
+                    'max': round(self._wait_max_ms, 3),
+                    'histogram': histogram
+                },
+                **self._counters
+            }
+
+
+# Lazily created shared resources. Nothing here touches the network at import
+# time, so the module can be imported (and workers forked) without a database.
+connection_pool = None
+replica_pool = None
+compreface_session = None
+scheduler = None
+_init_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global connection_pool
+    if connection_pool is None:
+        with _init_lock:
+            if connection_pool is None:
+                try:
+                    connection_pool = AdaptiveConnectionPool(
+                        pool_name="attendance_pool",
+                        min_size=DB_POOL_MIN_SIZE,
+                        max_size=DB_POOL_MAX_SIZE,
+                        acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+                        idle_timeout=DB_POOL_IDLE_TIMEOUT,
+                        health_check_after=DB_POOL_HEALTH_CHECK_AFTER,
+                        reset_session=DB_POOL_RESET_SESSION,
+                        max_waiters=DB_POOL_MAX_WAITERS,
+                        **DB_CONFIG
+                    )
+                    db_log.info("Database connection pool created")
+                except mysql.connector.Error as e:
+                    db_log.error("Error creating connection pool: %s", e)
+                    raise
+    return connection_pool
+
+
+def get_replica_pool():
+    """Return the read replica pool, creating it on first use"""
+    global replica_pool
+    if replica_pool is None:
+        with _init_lock:
+            if replica_pool is None:
+                replica_pool = AdaptiveConnectionPool(
+                    pool_name="attendance_replica_pool",
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+                    idle_timeout=DB_POOL_IDLE_TIMEOUT,
+                    health_check_after=DB_POOL_HEALTH_CHECK_AFTER,
+                    reset_session=DB_POOL_RESET_SESSION,
+                    max_waiters=DB_POOL_MAX_WAITERS,
+                    **DB_REPLICA_CONFIG
+                )
+                db_log.info("Replica connection pool created")
+    return replica_pool
+
+
+def get_compreface_session():
+    """Return the shared HTTP session used for CompreFace calls, creating it on first use"""
+    global compreface_session
+    if compreface_session is None:
+        with _init_lock:
+            if compreface_session is None:
+                import requests
+                compreface_session = requests.Session()
+    return compreface_session
+
+
+def _reset_after_fork():
+    """
+    Drop resources inherited from the parent process so each worker opens its
+    own sockets instead of sharing the parent's
+    """
+    global connection_pool, replica_pool, compreface_session, _init_lock
+    _init_lock = threading.Lock()
+    connection_pool = None
+    replica_pool = None
+    compreface_session = None
+    # The listener thread does not survive fork; give the worker its own
+    if _log_listener is not None:
+        _start_log_listener()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+# Replica health, refreshed at most every REPLICA_LAG_CHECK_INTERVAL seconds
+_replica_state = {'checked_at': float('-inf'), 'healthy': False, 'lag': None}
+_replica_lock = threading.Lock()
+
+# Clients that recently wrote through the API. Each write is recorded under the
+# caller (X-Client-Id / X-Device-Id, else the remote address) and, when the
+# request names one, the employee, so both an admin's own reads and that
+# employee's kiosk reads go to the primary afterwards
+_recent_writers = {}
+_recent_writers_lock = threading.Lock()
+
+
+def _client_keys():
+    client_id = request.headers.get('X-Client-Id') or request.headers.get('X-Device-Id')
+    keys = [f"client:{client_id}" if client_id else f"addr:{request.remote_addr}"]
+    employee_id = (request.form.get('employee_id') or request.args.get('employee_id')
+                   or (request.view_args or {}).get('employee_id'))
+    if not employee_id and request.is_json:
+        employee_id = (request.get_json(silent=True) or {}).get('employee_id')
+    if employee_id:
+        keys.append(f"employee:{employee_id}")
+    return keys
+
+
+def _check_replica_lag():
+    """Return the replica's replication lag in seconds, or None if it is not replicating"""
+    conn = get_replica_pool().get_connection()
+    try:
+        with get_db_cursor(conn) as cursor:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error:
+                cursor.execute("SHOW SLAVE STATUS")
+            status = cursor.fetchone()
+    finally:
+        conn.close()
+    if status is None:
+        # Replication is not configured (or was reset); its data cannot be trusted
+        return None
+    # NULL while the SQL or IO thread is stopped, which must not read as "no lag"
+    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    return None if lag is None else int(lag)
+
+
+def replica_available():
+    """Whether reads may currently be served by the replica"""
+    if not DB_REPLICA_HOST:
+        return False
+
+    now = _time.monotonic()
+    if now - _replica_state['checked_at'] < REPLICA_LAG_CHECK_INTERVAL:
+        return _replica_state['healthy']
+
+    with _replica_lock:
+        if now - _replica_state['checked_at'] < REPLICA_LAG_CHECK_INTERVAL:
+            return _replica_state['healthy']
+        try:
+            lag = _check_replica_lag()
+        except Exception as e:
+            db_log.warning("Replica health check failed: %s", e)
+            lag = None
+        healthy = lag is not None and lag <= REPLICA_MAX_LAG_SECONDS
+        if healthy != _replica_state['healthy']:
+            db_log.info("Replica %s for reads (lag: %s)", 'enabled' if healthy else 'disabled', lag)
+        _replica_state.update(checked_at=_time.monotonic(), healthy=healthy, lag=lag)
+        return healthy
+
+
+def _wrote_recently():
+    keys = _client_keys()
+    now = _time.monotonic()
+    with _recent_writers_lock:
+        return any(now - _recent_writers.get(key, float('-inf')) < READ_YOUR_WRITES_SECONDS
+                   for key in keys)
+
+
+def read_replica(view):
+    """
+    Mark an endpoint as read-only so its queries may be served by the replica.
+    Falls back to the primary when the replica is lagging or unreachable, and
+    for clients that wrote within the last READ_YOUR_WRITES_SECONDS.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@app.after_request
+def remember_writers(response):
+    """Record clients that just mutated data so their next reads go to the primary"""
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and not g.get('db_read_only') and response.status_code < 400:
+        keys = _client_keys()
+        now = _time.monotonic()
+        with _recent_writers_lock:
+            for key in keys:
+                _recent_writers[key] = now
+            if len(_recent_writers) > 1000:
+                for key, written_at in list(_recent_writers.items()):
+                    if now - written_at >= READ_YOUR_WRITES_SECONDS:
+                        del _recent_writers[key]
+    return response
+
+
+def _get_pooled_connection(read_only):
+    if read_only and replica_available() and not _wrote_recently():
+        try:
+            return get_replica_pool().get_connection()
+        except mysql.connector.Error as e:
+            db_log.warning("Replica unavailable, falling back to primary: %s", e)
+            _replica_state.update(checked_at=_time.monotonic(), healthy=False)
+    return get_connection_pool().get_connection()
+
 
 @contextmanager
-def get_db_connection():
-    """Context manager for database connections"""
+def get_db_connection(read_only=None):
+    """
+    Context manager for database connections
+    Args:
+        read_only: Route to the read replica when healthy. Defaults to the
+                   current endpoint's @read_replica marking.
+    """
+    if read_only is None:
+        read_only = has_request_context() and g.get('db_read_only', False)
+
     connection = None
     try:
-        connection = connection_pool.get_connection()
+        connection = _get_pooled_connection(read_only)
         yield connection
     except mysql.connector.Error as e:
         if connection:
             connection.rollback()
-        print(f"Database error: {e}")
+        db_log.error("Database error: %s", e)
         raise
     finally:
-        if connection and connection.is_connected():
+        if connection:
             connection.close()
 
+# Set to a list to record every (statement, params) run through get_db_cursor
+# and the hot-query helpers. Used by plan_check.py to collect the app's SQL.
+sql_capture = None
+
+# Number of requests currently being profiled; their statement timings are
+# collected in g.profile_sql. Cursors are only wrapped while this is non-zero.
+_active_profiles = 0
+
+
+def _capturing():
+    return sql_capture is not None or _active_profiles > 0
+
+
+def _capture_sql(statement, params, started=None):
+    if sql_capture is not None:
+        sql_capture.append((statement, params))
+    if started is not None and _active_profiles and has_request_context() and 'profile_sql' in g:
+        g.profile_sql.append({
+            'sql': ' '.join(statement.split())[:500],
+            'ms': round((_time.perf_counter() - started) * 1000, 3)
+        })
+
+
+class _CapturingCursor:
+    """Cursor proxy that records executed statements and their timings"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=(), **kwargs):
+        started = _time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, **kwargs)
+        finally:
+            _capture_sql(operation, params, started)
+
+    def executemany(self, operation, seq_params):
+        seq_params = list(seq_params)
+        started = _time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params)
+        finally:
+            if seq_params:
+                _capture_sql(operation, seq_params[0], started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
 @contextmanager
 def get_db_cursor(connection):
     """Context manager for database cursors"""
     cursor = None
     try:
         cursor = connection.cursor(dictionary=True)
-        yield cursor
+        yield _CapturingCursor(cursor) if _capturing() else cursor
     finally:
         if cursor:
             cursor.close()
 
 
+# Statements that run on every check-in/check-out/status call. They are
+# executed as server-side prepared statements, prepared once per pooled
+# connection and reused until that connection is replaced.
+HOT_QUERIES = {
+    'employee_by_id': """
+        SELECT employee_id, name, photo_url, permanent_location
+        FROM Employees
+        WHERE employee_id = %s
+    """,
+    'attendance_for_day': """
+        SELECT attendance_id, status, check_in, check_out, current_location
+        FROM Attendance
+        WHERE employee_id = %s AND date = %s
+    """,
+    'late_request_for_day': """
+        SELECT request_id, status, requested_at
+        FROM LateArrivalRequests
+        WHERE employee_id = %s AND requested_at >= %s AND requested_at < %s
+        ORDER BY requested_at DESC
+        LIMIT 1
+    """,
+    'face_template': """
+        SELECT template
+        FROM EmployeeFaceTemplates
+        WHERE employee_id = %s
+    """,
+    'upsert_attendance': """
+        INSERT INTO Attendance (employee_id, current_location, date, status, check_in, check_out)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+        version = version + 1,
+        status = VALUES(status),
+        check_in = VALUES(check_in),
+        current_location = VALUES(current_location)
+    """,
+}
+
+# MySQL error raised when a statement handle no longer exists on the server
+ER_UNKNOWN_STMT_HANDLER = 1243
+
+
+def close_prepared_statements(slot):
+    """Deallocate every statement cached on a pooled connection"""
+    for _, cursor in slot.statements.values():
+        try:
+            cursor.close()
+        except Exception:
+            pass
+    slot.statements.clear()
+
+
+def _prepared_cursor(connection, name):
+    slot = connection.slot
+    connection_id = slot.raw.connection_id
+    cached = slot.statements.get(name)
+    if cached is not None:
+        prepared_for, cursor = cached
+        if prepared_for == connection_id:
+            return cursor
+        # The connection was re-established; the old handle is gone server-side
+        slot.statements.pop(name, None)
+
+    cursor = slot.raw.cursor(prepared=True)
+    slot.statements[name] = (connection_id, cursor)
+    return cursor
+
+
+def _run_hot_query(connection, name, params):
+    if not _capturing():
+        return _execute_hot_query(connection, name, params)
+    started = _time.perf_counter()
+    try:
+        return _execute_hot_query(connection, name, params)
+    finally:
+        _capture_sql(HOT_QUERIES[name], params, started)
+
+
+def _execute_hot_query(connection, name, params):
+    query = HOT_QUERIES[name]
+    if not isinstance(connection, PooledConnection):
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute(query, params)
+            rows = cursor.fetchall() if cursor.with_rows else []
+            return rows, cursor.rowcount, cursor.lastrowid
+        finally:
+            cursor.close()
+
+    for attempt in (1, 2):
+        cursor = _prepared_cursor(connection, name)
+        try:
+            cursor.execute(query, params)
+            rows = []
+            if cursor.with_rows:
+                columns = cursor.column_names
+                rows = [
+                    {col: (val.decode('utf-8') if isinstance(val, (bytes, bytearray)) else val)
+                     for col, val in zip(columns, row)}
+                    for row in cursor.fetchall()
+                ]
+            return rows, cursor.rowcount, cursor.lastrowid
+        except mysql.connector.Error as e:
+            connection.slot.statements.pop(name, None)
+            if attempt == 2 or e.errno != ER_UNKNOWN_STMT_HANDLER:
+                raise
+
+
+def fetch_hot_query(connection, name, params=()):
+    """Run a registered hot SELECT and return its rows as dicts"""
+    rows, _, _ = _run_hot_query(connection, name, params)
+    return rows
+
+
+def fetch_hot_query_one(connection, name, params=()):
+    """Run a registered hot SELECT and return its first row, or None"""
+    rows = fetch_hot_query(connection, name, params)
+    return rows[0] if rows else None
+
+
+def execute_hot_query(connection, name, params=()):
+    """Run a registered hot DML statement and return the affected row count"""
+    _, rowcount, _ = _run_hot_query(connection, name, params)
+    return rowcount
+
+
+def day_bounds(day):
+    """Return the [start, end) datetimes of a calendar day, for sargable range predicates"""
+    start = datetime.combine(day, time(0, 0))
+    return start, start + timedelta(days=1)
+
+
 def to_base64(path):
     with open(path, 'rb') as img:
         return base64.b64encode(img.read()).decode('utf-8')
     
+# In-process caches for the check-in hot path, filled by the pre-rush warm-up.
+# Every worker process holds its own copy, and invalidate() only reaches the
+# calling process: other workers see a change when their entry expires or,
+# for reference photos, when the file's mtime changes.
+EMPLOYEE_CACHE_TTL_SECONDS = int(os.getenv("EMPLOYEE_CACHE_TTL_SECONDS", "900"))
+EMPLOYEE_CACHE_MAX_ENTRIES = int(os.getenv("EMPLOYEE_CACHE_MAX_ENTRIES", "20000"))
+FACE_CACHE_MAX_ENTRIES = int(os.getenv("FACE_CACHE_MAX_ENTRIES", "5000"))
+# Reference JPEGs are large; this bounds each worker's copy (multiply by workers)
+FACE_CACHE_MAX_BYTES = int(os.getenv("FACE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class LruCache:
+    """
+    Thread-safe LRU cache with optional expiry and hit/miss counters. With
+    max_bytes, entries are also evicted once the summed sizeof(value) of all
+    entries exceeds it.
+    """
+
+    def __init__(self, max_entries, ttl=None, max_bytes=None, sizeof=len):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or _time.monotonic() - entry[1] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            self._drop(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (value, _time.monotonic(), size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self.bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._drop(key)
+
+    def reset_counters(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+            if self.max_bytes is not None:
+                stats.update(bytes=self.bytes, max_bytes=self.max_bytes)
+            return stats
+
+
+employee_cache = LruCache(EMPLOYEE_CACHE_MAX_ENTRIES, ttl=EMPLOYEE_CACHE_TTL_SECONDS)
+# Values are (mtime, jpeg bytes)
+face_image_cache = LruCache(FACE_CACHE_MAX_ENTRIES, max_bytes=FACE_CACHE_MAX_BYTES,
+                            sizeof=lambda entry: len(entry[1]))
+
+
+def lookup_employee(conn, employee_id):
+    """Employees row (employee_id, name, photo_url, permanent_location) for the hot path, cached"""
+    key = str(employee_id)
+    employee = employee_cache.get(key)
+    if employee is None:
+        employee = fetch_hot_query_one(conn, 'employee_by_id', (employee_id,))
+        if employee is not None:
+            employee_cache.put(key, employee)
+    return employee
+
+
+def load_stored_photo(path):
+    """Bytes of a stored reference photo, cached and re-read when the file changes"""
+    mtime = os.stat(path).st_mtime
+    cached = face_image_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as stored_image:
+        data = stored_image.read()
+    face_image_cache.put(path, (mtime, data))
+    return data
+
+
+# Uploads. Each uploaded file is read at most once per request: Werkzeug's
+# in-memory buffer is shared directly, a spooled temp file is memory-mapped,
+# and detection, verification and storage all work from that one view.
+upload_stats = {'uploads': 0, 'bytes_received': 0, 'bytes_copied': 0, 'mapped': 0}
+_upload_stats_lock = threading.Lock()
+
+
+class UploadBuffer:
+    """
+    Zero-copy view over one uploaded file. `bytes_copied` counts every full
+    copy of the upload made on its way out (reading a non-seekable stream,
+    building a CompreFace multipart body).
+    """
+
+    def __init__(self, storage):
+        stream = storage.stream
+        # SpooledTemporaryFile keeps the real buffer or file in _file
+        raw = getattr(stream, '_file', stream)
+        self._map = None
+        self.mapped = False
+        self.bytes_copied = 0
+        if hasattr(raw, 'getbuffer'):
+            self.view = raw.getbuffer()
+        elif hasattr(raw, 'fileno'):
+            raw.flush()
+            size = os.fstat(raw.fileno()).st_size
+            if size:
+                self._map = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+                self.view = memoryview(self._map)
+            else:
+                self.view = memoryview(b'')
+            self.mapped = True
+        else:
+            stream.seek(0)
+            self.view = memoryview(stream.read())
+            self.bytes_copied += len(self.view)
+        self.size = len(self.view)
+
+    def payload(self):
+        """The upload for an outgoing request; requests copies it once into the body"""
+        self.bytes_copied += self.size
+        return self.view
+
+    def save(self, path):
+        """Write the upload to `path`, replacing any existing file atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.view)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        self.view.release()
+        if self._map is not None:
+            self._map.close()
+
+
+def upload_buffer(name='photo'):
+    """The current request's upload `name`, opened once and released at teardown"""
+    buffers = g.setdefault('upload_buffers', {})
+    if name not in buffers:
+        buffers[name] = UploadBuffer(request.files[name])
+    return buffers[name]
+
+
+@app.teardown_request
+def release_upload_buffers(exc):
+    buffers = g.pop('upload_buffers', None)
+    if not buffers:
+        return
+    received = sum(b.size for b in buffers.values())
+    copied = sum(b.bytes_copied for b in buffers.values())
+    for buffer in buffers.values():
+        buffer.close()
+    with _upload_stats_lock:
+        upload_stats['uploads'] += len(buffers)
+        upload_stats['bytes_received'] += received
+        upload_stats['bytes_copied'] += copied
+        upload_stats['mapped'] += sum(b.mapped for b in buffers.values())
+    api_log.debug("Upload buffers released: %d bytes received, %d bytes copied", received, copied)
+
+# Recent CompreFace round-trip time, used by load shedding
+compreface_latency_ms = DecayingAverage()
+
 def is_face_detected(image_file):
     detect_url = COMPRE_FACE_DETECT_URL
     headers = {"x-api-key": COMPRE_FACE_DETECT_API_KEY}
     files = {'file': ('image.jpg', image_file, 'image/jpeg')}
 
-    response = requests.post(detect_url, files=files, headers=headers)
-    if response.status_code != 200:
-        return False
+    with compreface_slot():
+        started = _time.monotonic()
+        response = get_compreface_session().post(detect_url, files=files, headers=headers)
+    compreface_latency_ms.add((_time.monotonic() - started) * 1000)
+    if response.status_code != 200:
+        return False
+
+    data = response.json()
+    return bool(data.get('result'))
+
+def verify_faces(source_image, target_image):
+    """Post a stored/uploaded image pair to the CompreFace verification service"""
+    files = {
+        'source_image': ('stored.jpg', source_image, 'image/jpeg'),
+        'target_image': ('uploaded.jpg', target_image, 'image/jpeg')
+    }
+    headers = {'x-api-key': COMPRE_FACE_API_KEY}
+    with compreface_slot():
+        started = _time.monotonic()
+        response = get_compreface_session().post(COMPRE_FACE_URL, files=files, headers=headers)
+    compreface_latency_ms.add((_time.monotonic() - started) * 1000)
+    return response
+
+# Multi-reference enrollment. The embedding of every reference photo (from the
+# detection service's calculator plugin) is stored, and the references are
+# fused into a template: their normalized mean ("mean") or the
+# FACE_TEMPLATE_SIZE references closest to that mean ("ranked"). A probe is
+# compared with the whole template in one embeddings-verify call. Employees
+# without a template are verified against photo_url as before.
+FACE_MATCH_THRESHOLD = float(os.getenv("FACE_MATCH_THRESHOLD", "0.9"))
+FACE_TEMPLATE_MODE = os.getenv("FACE_TEMPLATE_MODE", "mean")
+FACE_TEMPLATE_SIZE = int(os.getenv("FACE_TEMPLATE_SIZE", "3"))
+FACE_REFERENCES_MAX = int(os.getenv("FACE_REFERENCES_MAX", "5"))
+FACE_TEMPLATE_CACHE_TTL_SECONDS = int(os.getenv("FACE_TEMPLATE_CACHE_TTL_SECONDS", "900"))
+# A match this soon after a reject for the same employee counts as a false-reject retry
+FACE_RETRY_WINDOW_SECONDS = int(os.getenv("FACE_RETRY_WINDOW_SECONDS", "300"))
+COMPRE_FACE_EMBEDDING_VERIFY_URL = os.getenv("COMPRE_FACE_EMBEDDING_VERIFY_URL")
+
+# Templates per employee id; [] marks an employee with no template
+face_template_cache = LruCache(EMPLOYEE_CACHE_MAX_ENTRIES, ttl=FACE_TEMPLATE_CACHE_TTL_SECONDS)
+
+
+def embedding_verify_url():
+    if COMPRE_FACE_EMBEDDING_VERIFY_URL or not COMPRE_FACE_URL:
+        return COMPRE_FACE_EMBEDDING_VERIFY_URL
+    from urllib.parse import urlsplit
+    parts = urlsplit(COMPRE_FACE_URL)
+    return f"{parts.scheme}://{parts.netloc}/api/v1/verification/embeddings/verify"
+
+
+def normalize_embedding(vector):
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else list(vector)
+
+
+def fuse_face_template(embeddings, mode=None):
+    """
+    Fuse normalized reference embeddings into a template (a list of
+    embeddings). Returns the template, the reference indexes ranked closest to
+    the mean first, and each reference's cosine similarity to the mean.
+    """
+    mean = normalize_embedding([sum(values) / len(values) for values in zip(*embeddings)])
+    closeness = [sum(a * b for a, b in zip(embedding, mean)) for embedding in embeddings]
+    ranked = sorted(range(len(embeddings)), key=lambda i: -closeness[i])
+    if (mode or FACE_TEMPLATE_MODE) == 'ranked':
+        template = [embeddings[i] for i in ranked[:FACE_TEMPLATE_SIZE]]
+    else:
+        template = [mean]
+    return template, ranked, closeness
+
+
+def detect_face_embeddings(image):
+    """Faces the detection service finds in `image`, each with its embedding; None if the call failed"""
+    files = {'file': ('image.jpg', image, 'image/jpeg')}
+    headers = {"x-api-key": COMPRE_FACE_DETECT_API_KEY}
+    with compreface_slot():
+        started = _time.monotonic()
+        response = get_compreface_session().post(COMPRE_FACE_DETECT_URL, files=files, headers=headers,
+                                                 params={'face_plugins': 'calculator'})
+    compreface_latency_ms.add((_time.monotonic() - started) * 1000)
+    if response.status_code != 200:
+        return None
+    return [face for face in response.json().get('result') or [] if face.get('embedding')]
+
+
+def verify_embedding(probe, template):
+    """Compare a probe embedding with every embedding of a template in one CompreFace call"""
+    headers = {'x-api-key': COMPRE_FACE_API_KEY}
+    with compreface_slot():
+        started = _time.monotonic()
+        response = get_compreface_session().post(embedding_verify_url(), json={'source': probe, 'targets': template},
+                                                 headers=headers)
+    compreface_latency_ms.add((_time.monotonic() - started) * 1000)
+    return response
+
+
+def face_template(conn, employee_id):
+    """The employee's fused template, cached; [] when none is enrolled"""
+    key = str(employee_id)
+    template = face_template_cache.get(key)
+    if template is None:
+        row = fetch_hot_query_one(conn, 'face_template', (employee_id,))
+        template = json.loads(row['template']) if row else []
+        face_template_cache.put(key, template)
+    return template
+
+
+# Verification outcomes per method ("template" or "pair"). A false-reject retry
+# is a match that follows a reject of the same employee within
+# FACE_RETRY_WINDOW_SECONDS; it is counted against the method that rejected.
+face_verification_stats = {
+    method: {'verifications': 0, 'matches': 0, 'rejects': 0, 'false_reject_retries': 0}
+    for method in ('template', 'pair')
+}
+_recent_face_rejects = OrderedDict()
+_face_stats_lock = threading.Lock()
 
-    data = response.json()
-    return bool(data.get('result'))
+
+def record_face_verification(employee_id, matched, method):
+    now = _time.monotonic()
+    key = str(employee_id)
+    with _face_stats_lock:
+        stats = face_verification_stats[method]
+        stats['verifications'] += 1
+        rejected = _recent_face_rejects.pop(key, None)
+        if matched:
+            stats['matches'] += 1
+            if rejected is not None and now - rejected[0] < FACE_RETRY_WINDOW_SECONDS:
+                face_verification_stats[rejected[1]]['false_reject_retries'] += 1
+        else:
+            stats['rejects'] += 1
+            _recent_face_rejects[key] = (now, method)
+            while len(_recent_face_rejects) > EMPLOYEE_CACHE_MAX_ENTRIES:
+                _recent_face_rejects.popitem(last=False)
+
+
+def check_employee_face(conn, employee, upload):
+    """
+    Detect a face in the upload and compare it with the employee's references:
+    the fused template when one is enrolled, otherwise the stored photo.
+    Returns face_detected, similarity, match, method and error (CompreFace's
+    response text when verification failed).
+    """
+    template = face_template(conn, employee['employee_id'])
+    check = {'face_detected': False, 'similarity': None, 'match': False,
+             'method': 'template' if template else 'pair', 'error': None}
+    if template:
+        faces = detect_face_embeddings(upload.payload())
+        if not faces:
+            return check
+        check['face_detected'] = True
+        response = verify_embedding(faces[0]['embedding'], template)
+        if response.status_code != 200:
+            check['error'] = response.text
+            return check
+        similarity = max(target['similarity'] for target in response.json()['result'])
+    else:
+        if not is_face_detected(upload.payload()):
+            return check
+        check['face_detected'] = True
+        response = verify_faces(load_stored_photo(employee['photo_url']), upload.payload())
+        if response.status_code != 200:
+            check['error'] = response.text
+            return check
+        similarity = response.json()['result'][0]['face_matches'][0]['similarity']
+
+    check['similarity'] = similarity
+    check['match'] = similarity >= FACE_MATCH_THRESHOLD
+    record_face_verification(employee['employee_id'], check['match'], check['method'])
+    return check
 
 
 def generate_employee_id():
@@ -118,8 +1439,8 @@ def generate_employee_id():
                     cursor.execute("SELECT 1 FROM Employees WHERE employee_id = %s", (emp_id,))
                     if not cursor.fetchone():
                         return emp_id
-        except Exception as e:
-            print(f"Error generating employee ID: {e}")
+        except Exception:
+            log.exception("Error generating employee ID")
             continue
     
     raise Exception("Could not generate unique employee ID after maximum attempts")
@@ -136,78 +1457,918 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     r = 6371000  # Earth radius in meters
     return c * r
 
+# Per-store policy. Stores without their own settings (or rows read before the
+# 0003 migration) fall back to these values.
+DEFAULT_TIMEZONE = 'Asia/Kolkata'
+DEFAULT_CHECKIN_CUTOFF = time(9, 45)
+DEFAULT_ABSENCE_MARK_TIME = time(21, 10)
+DEFAULT_LATE_REJECT_TIME = time(21, 0)
+DEFAULT_GEOFENCE_RADIUS_M = 500
+STORE_POLICY_TTL_SECONDS = int(os.getenv("STORE_POLICY_TTL_SECONDS", "300"))
+
+# MySQL error for a column that does not exist yet
+ER_BAD_FIELD_ERROR = 1054
+
+
+def _to_time(value, default):
+    """TIME columns come back as timedelta; normalise them to datetime.time"""
+    if value is None:
+        return default
+    if isinstance(value, timedelta):
+        return (datetime.min + value).time()
+    return value
+
+
+def make_store_policy(row=None):
+    row = row or {}
+    tz_name = row.get('timezone') or DEFAULT_TIMEZONE
+    return {
+        'area_name': row.get('area_name'),
+        'latitude': float(row['latitude']) if row.get('latitude') is not None else None,
+        'longitude': float(row['longitude']) if row.get('longitude') is not None else None,
+        'timezone': tz_name,
+        'tz': pytz.timezone(tz_name),
+        'checkin_cutoff': _to_time(row.get('checkin_cutoff'), DEFAULT_CHECKIN_CUTOFF),
+        'absence_mark_time': _to_time(row.get('absence_mark_time'), DEFAULT_ABSENCE_MARK_TIME),
+        'late_reject_time': _to_time(row.get('late_reject_time'), DEFAULT_LATE_REJECT_TIME),
+        'geofence_radius_m': int(row.get('geofence_radius_m') or DEFAULT_GEOFENCE_RADIUS_M),
+    }
+
+
+DEFAULT_STORE_POLICY = make_store_policy()
+
+
+class StorePolicyCache:
+    """StoreLocations rows with their timezone, cutoff, schedule and geofence, refreshed every ttl seconds"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stores = {}
+        self._loaded_at = float('-inf')
+
+    def _load(self):
+        with get_db_connection() as conn:
+            with get_db_cursor(conn) as cursor:
+                try:
+                    cursor.execute("""
+                        SELECT area_name, latitude, longitude, timezone, checkin_cutoff,
+                               absence_mark_time, late_reject_time, geofence_radius_m
+                        FROM StoreLocations
+                    """)
+                except mysql.connector.Error as e:
+                    if e.errno != ER_BAD_FIELD_ERROR:
+                        raise
+                    cursor.execute("SELECT area_name, latitude, longitude FROM StoreLocations")
+                return {row['area_name']: make_store_policy(row) for row in cursor.fetchall()}
+
+    def refresh(self):
+        stores = self._load()
+        with self._lock:
+            self._stores = stores
+            self._loaded_at = _time.monotonic()
+        return stores
+
+    def stores(self):
+        """All store policies, reloading them if the cache is stale"""
+        if _time.monotonic() - self._loaded_at > self.ttl:
+            try:
+                return list(self.refresh().values())
+            except Exception as e:
+                # Keep serving the last good copy rather than failing check-ins
+                log.error("Error loading store policies: %s", e)
+        return list(self._stores.values())
+
+    def get(self, area_name):
+        """Policy for a store, or the default policy for unknown stores"""
+        if area_name is None:
+            return DEFAULT_STORE_POLICY
+        self.stores()
+        return self._stores.get(area_name, DEFAULT_STORE_POLICY)
+
+    def invalidate(self):
+        self._loaded_at = float('-inf')
+
+
+store_policies = StorePolicyCache(STORE_POLICY_TTL_SECONDS)
+
+
+def store_local_time(policy, timestamp=None):
+    """
+    Wall-clock time at a store, as a naive datetime. Uses the client's ISO
+    timestamp when it parses (converted to the store's timezone if it carries
+    an offset), otherwise the current time.
+    """
+    if timestamp:
+        try:
+            parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            if parsed.tzinfo is not None:
+                return parsed.astimezone(policy['tz']).replace(tzinfo=None)
+            return parsed
+        except ValueError:
+            pass
+    return datetime.now(policy['tz']).replace(tzinfo=None)
+
+
 def find_nearest_store(user_lat, user_lon):
-    """Find the nearest store within 50m radius"""
+    """Find the nearest store whose geofence radius contains the given point"""
+    try:
+        nearest = None
+        nearest_distance = None
+        for store in store_policies.stores():
+            if store['latitude'] is None or store['longitude'] is None:
+                continue
+            distance = calculate_distance(user_lat, user_lon, store['latitude'], store['longitude'])
+            if distance <= store['geofence_radius_m'] and (nearest_distance is None or distance < nearest_distance):
+                nearest, nearest_distance = store['area_name'], distance
+
+        return nearest
+    except Exception:
+        log.exception("Error finding nearest store")
+        return None
+
+# Rate limits for the verification endpoints, as "<requests>/<seconds>"
+RATE_LIMIT_EMPLOYEE = os.getenv("RATE_LIMIT_EMPLOYEE", "10/60")
+RATE_LIMIT_CLIENT = os.getenv("RATE_LIMIT_CLIENT", "30/60")
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "600/60")
+# Requests allowed to be talking to CompreFace at the same time, per process
+COMPREFACE_MAX_CONCURRENCY = int(os.getenv("COMPREFACE_MAX_CONCURRENCY", "16"))
+COMPREFACE_SLOT_WAIT_SECONDS = float(os.getenv("COMPREFACE_SLOT_WAIT_SECONDS", "2"))
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by employee, client or store. Each bucket is a
+    (tokens, last_update) tuple; buckets idle long enough to have refilled
+    completely are dropped, since a new bucket starts full anyway.
+    """
+
+    def __init__(self, name, spec):
+        count, seconds = spec.split('/')
+        self.name = name
+        self.capacity = float(count)
+        self.rate = float(count) / float(seconds)
+        self.idle_seconds = self.capacity / self.rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._operations = 0
+
+    def _tokens_locked(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.capacity
+        return min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+
+    def peek(self, key):
+        """Seconds until key could take a token (0 if it can now), without taking one"""
+        with self._lock:
+            tokens = self._tokens_locked(key, _time.monotonic())
+        return 0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def refund(self, key):
+        """Return a token taken by acquire() for a request that was turned away elsewhere"""
+        now = _time.monotonic()
+        with self._lock:
+            self._buckets[key] = (min(self.capacity, self._tokens_locked(key, now) + 1), now)
+
+    def acquire(self, key):
+        """Take a token for key. Returns 0 when allowed, otherwise seconds until a token is available."""
+        now = _time.monotonic()
+        with self._lock:
+            tokens = self._tokens_locked(key, now)
+
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+
+            self._operations += 1
+            if self._operations % 1024 == 0:
+                self._evict_idle_locked(now)
+        return retry_after
+
+    def _evict_idle_locked(self, now):
+        idle = [key for key, (_, updated) in self._buckets.items() if now - updated >= self.idle_seconds]
+        for key in idle:
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+employee_limiter = TokenBucketLimiter('employee', RATE_LIMIT_EMPLOYEE)
+client_limiter = TokenBucketLimiter('client', RATE_LIMIT_CLIENT)
+store_limiter = TokenBucketLimiter('store', RATE_LIMIT_STORE)
+compreface_slots = threading.BoundedSemaphore(COMPREFACE_MAX_CONCURRENCY)
+
+rate_limit_rejections = {'employee': 0, 'client': 0, 'store': 0, 'compreface_busy': 0}
+_rate_limit_stats_lock = threading.Lock()
+_compreface_in_flight = 0
+
+
+def take_tokens(checks):
+    """
+    Take one token from every (reason, limiter, key) in checks, or from none of
+    them, so a request refused by one bucket is not charged to the others.
+    Returns None when allowed, otherwise (reason, retry_after) of the refusing bucket.
+    """
+    for reason, limiter, key in checks:
+        retry_after = limiter.peek(key)
+        if retry_after:
+            return reason, retry_after
+    taken = []
+    for reason, limiter, key in checks:
+        # Another request may have emptied the bucket since the peek
+        retry_after = limiter.acquire(key)
+        if retry_after:
+            for _, taken_limiter, taken_key in taken:
+                taken_limiter.refund(taken_key)
+            return reason, retry_after
+        taken.append((reason, limiter, key))
+    return None
+
+
+class CompreFaceBusy(Exception):
+    """No CompreFace slot became free within COMPREFACE_SLOT_WAIT_SECONDS"""
+
+
+@contextmanager
+def compreface_slot():
+    """Hold one of the COMPREFACE_MAX_CONCURRENCY slots for one CompreFace call"""
+    global _compreface_in_flight
+    if not compreface_slots.acquire(timeout=COMPREFACE_SLOT_WAIT_SECONDS):
+        raise CompreFaceBusy()
+    with _rate_limit_stats_lock:
+        _compreface_in_flight += 1
+    try:
+        yield
+    finally:
+        with _rate_limit_stats_lock:
+            _compreface_in_flight -= 1
+        compreface_slots.release()
+
+
+def _too_many_requests(reason, retry_after):
+    with _rate_limit_stats_lock:
+        rate_limit_rejections[reason] += 1
+    retry_after = max(1, math.ceil(retry_after))
+    response = jsonify({
+        'error': 'Too many requests, please retry shortly',
+        'reason': reason,
+        'retry_after': retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _request_store():
+    """Store the request is being made from, when it carries coordinates"""
+    try:
+        return find_nearest_store(float(request.form['latitude']), float(request.form['longitude']))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def rate_limited(view):
+    """
+    Apply per-employee (form field or URL), per-client (X-Device-Id header or
+    IP) and per-store token buckets to an endpoint, and answer 429 when its
+    CompreFace calls find no free slot (see compreface_slot; views re-raise
+    CompreFaceBusy). Rejected requests get 429 with a Retry-After header.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        checks = [('client', client_limiter, request.headers.get('X-Device-Id') or request.remote_addr)]
+        employee_id = request.form.get('employee_id') or (request.view_args or {}).get('employee_id')
+        if employee_id:
+            checks.append(('employee', employee_limiter, str(employee_id)))
+        store = _request_store()
+        if store:
+            checks.append(('store', store_limiter, store))
+
+        refused = take_tokens(checks)
+        if refused:
+            return _too_many_requests(*refused)
+
+        try:
+            return view(*args, **kwargs)
+        except CompreFaceBusy:
+            return _too_many_requests('compreface_busy', COMPREFACE_SLOT_WAIT_SECONDS)
+    return wrapper
+
+# Load shedding. Critical requests (check-in, check-out, late requests) are
+# always admitted; deferrable ones (reports and dashboards) are refused with
+# 503 and Retry-After while the system is under pressure. They are not held
+# waiting, since a waiting request ties up the worker thread a check-in needs.
+CRITICAL = 'critical'
+DEFERRABLE = 'deferrable'
+LOAD_SHED_POOL_WAIT_MS = float(os.getenv("LOAD_SHED_POOL_WAIT_MS", "100"))
+LOAD_SHED_COMPREFACE_MS = float(os.getenv("LOAD_SHED_COMPREFACE_MS", "2000"))
+LOAD_SHED_RETRY_AFTER = int(os.getenv("LOAD_SHED_RETRY_AFTER", "30"))
+
+load_shedding_stats = {
+    'in_flight': {CRITICAL: 0, DEFERRABLE: 0},
+    'shed': 0
+}
+_load_stats_lock = threading.Lock()
+
+
+def system_pressure():
+    """Names of the signals currently over their threshold (empty when healthy)"""
+    reasons = []
+    pool = connection_pool
+    if pool is not None and (pool.recent_wait_ms.value > LOAD_SHED_POOL_WAIT_MS or pool.stats()['waiters']):
+        reasons.append('db_pool')
+    if compreface_latency_ms.value > LOAD_SHED_COMPREFACE_MS:
+        reasons.append('compreface')
+    return reasons
+
+
+def _admit_deferrable():
+    """Returns a 503 response if the request is shed, None to admit it"""
+    pressure = system_pressure()
+    if not pressure:
+        return None
+
+    with _load_stats_lock:
+        load_shedding_stats['shed'] += 1
+    response = jsonify({
+        'error': 'Server is busy with check-ins, please retry later',
+        'reason': pressure,
+        'retry_after': LOAD_SHED_RETRY_AFTER
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(LOAD_SHED_RETRY_AFTER)
+    return response
+
+
+def request_class(priority):
+    """Tag an endpoint as CRITICAL or DEFERRABLE for admission control"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if priority == DEFERRABLE:
+                shed = _admit_deferrable()
+                if shed is not None:
+                    return shed
+
+            with _load_stats_lock:
+                load_shedding_stats['in_flight'][priority] += 1
+            try:
+                return view(*args, **kwargs)
+            finally:
+                with _load_stats_lock:
+                    load_shedding_stats['in_flight'][priority] -= 1
+        return wrapper
+    return decorator
+
+# On-demand profiling. Off unless PROFILE_ADMIN_TOKEN is set; then an admin
+# can profile a sampled share of one route's requests, or a single request by
+# sending the token in X-Profile. Results go to a small ring buffer.
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+PROFILE_TOP_FUNCTIONS = 40
+
+profile_routes = {}  # URL rule -> percentage of requests to profile
+recent_profiles = deque(maxlen=PROFILE_BUFFER_SIZE)
+_profile_lock = threading.Lock()
+_profile_seq = 0
+
+
+def _is_profile_admin(token):
+    return bool(PROFILE_ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN)
+
+
+def _require_profile_admin():
+    if not PROFILE_ADMIN_TOKEN:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    if not _is_profile_admin(request.headers.get('X-Admin-Token')):
+        return jsonify({"error": "Admin token required"}), 403
+    return None
+
+
+@app.before_request
+def start_profile():
+    """Start profiling this request if its route is sampled or it asked with X-Profile"""
+    global _active_profiles
+    if not PROFILE_ADMIN_TOKEN:
+        return
+    rate = profile_routes.get(request.url_rule.rule) if profile_routes and request.url_rule else None
+    if not (rate and random.random() * 100 < rate) and not _is_profile_admin(request.headers.get('X-Profile')):
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another request on this interpreter already holds the profiler
+        profiler = None
+    with _profile_lock:
+        _active_profiles += 1
+    g.profiler = profiler
+    g.profile_sql = []
+    g.profile_started = _time.perf_counter()
+
+
+@app.after_request
+def finish_profile(response):
+    global _active_profiles, _profile_seq
+    if 'profile_sql' not in g:
+        return response
+
+    duration_ms = (_time.perf_counter() - g.profile_started) * 1000
+    profiler = g.pop('profiler')
+    raw, summary = None, None
+    if profiler is not None:
+        profiler.disable()
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        summary = stats.stream.getvalue()
+        raw = marshal.dumps(stats.stats)
+
+    with _profile_lock:
+        _active_profiles -= 1
+        _profile_seq += 1
+        recent_profiles.append({
+            'id': _profile_seq,
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'status': response.status_code,
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'duration_ms': round(duration_ms, 3),
+            'sql_ms': round(sum(q['ms'] for q in g.profile_sql), 3),
+            'sql': g.pop('profile_sql'),
+            'summary': summary,
+            'raw': raw
+        })
+    response.headers['X-Profile-Id'] = str(_profile_seq)
+    return response
+
+
+@app.teardown_request
+def abandon_profile(exc):
+    """Stop a profile whose request failed before after_request ran"""
+    global _active_profiles
+    if 'profile_sql' in g:
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        g.pop('profile_sql')
+        with _profile_lock:
+            _active_profiles -= 1
+
+# Live feed
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "1000"))
+EVENT_HEARTBEAT_SECONDS = 15
+
+
+class EventBus:
+    """
+    In-process publish/subscribe bus. Keeps the last `capacity` events so
+    reconnecting subscribers can replay everything after their last event id.
+    """
+
+    def __init__(self, capacity):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=capacity)
+        # Millisecond-based start so ids keep increasing across restarts
+        self._next_id = int(_time.time() * 1000)
+
+    def publish(self, event_type, data, store=None):
+        with self._cond:
+            event = {'id': self._next_id, 'type': event_type, 'store': store, 'data': data}
+            self._next_id += 1
+            self._events.append(event)
+            self._cond.notify_all()
+        return event['id']
+
+    def oldest_id(self):
+        with self._cond:
+            return self._events[0]['id'] if self._events else self._next_id
+
+    def latest_id(self):
+        with self._cond:
+            return self._next_id - 1
+
+    def wait_for_events(self, last_id, store=None, timeout=None):
+        """
+        Wait up to timeout for events newer than last_id. Returns the matching
+        events (optionally for one store) and the newest event id seen.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._next_id - 1 > last_id, timeout)
+            events = [
+                e for e in self._events
+                if e['id'] > last_id and (store is None or e['store'] == store)
+            ]
+            return events, max(last_id, self._next_id - 1)
+
+
+event_bus = EventBus(EVENT_BUFFER_SIZE)
+
+
+def publish_event(event_type, data, store=None):
+    """Publish a change to live-feed subscribers; never fails the calling request"""
     try:
+        event_bus.publish(event_type, data, store)
+    except Exception as e:
+        log.warning("Error publishing %s event: %s", event_type, e)
+
+# Live headcounts. Counters are kept in memory for the most recent days, fed by
+# the write paths and periodically rebuilt from Attendance, which also covers
+# writes made by other worker processes.
+HEADCOUNT_DAYS = int(os.getenv("HEADCOUNT_DAYS", "3"))
+HEADCOUNT_RESYNC_SECONDS = int(os.getenv("HEADCOUNT_RESYNC_SECONDS", "300"))
+HEADCOUNT_FIELDS = ('checked_in', 'checked_out', 'late', 'absent', 'on_leave')
+
+
+def _headcount_fields(status, checked_out):
+    if status == 'Absent':
+        return ('absent',)
+    if status == 'On Leave':
+        return ('on_leave',)
+    fields = ('checked_in', 'late') if status == 'Late' else ('checked_in',)
+    return fields + ('checked_out',) if checked_out else fields
+
+
+class HeadcountBoard:
+    """
+    Per store and day counts of checked-in, checked-out, late, absent and
+    on-leave staff. Each employee's contribution to a day is remembered, so
+    recording the same employee again (a repeat check-in, a check-out, an edit)
+    moves them between counters instead of counting them twice.
+    """
+
+    def __init__(self, keep_days):
+        self.keep_days = keep_days
+        self.rebuilt_at = None
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._entries = {}   # day -> {employee_id: (store, fields)}
+        self._counts = {}    # (store, day) -> {field: count}
+        self._journal = None  # writes recorded while a rebuild is loading
+
+    def _apply(self, day, store, fields, delta):
+        counts = self._counts.setdefault((store, day), dict.fromkeys(HEADCOUNT_FIELDS, 0))
+        for field in fields:
+            counts[field] += delta
+
+    def _set(self, day, employee_id, store, status, checked_out):
+        entries = self._entries.setdefault(day, {})
+        previous = entries.pop(employee_id, None)
+        if previous is not None:
+            self._apply(day, previous[0], previous[1], -1)
+            if checked_out is None:
+                checked_out = 'checked_out' in previous[1]
+        if status is not None:
+            fields = _headcount_fields(status, checked_out)
+            entries[employee_id] = (store, fields)
+            self._apply(day, store, fields, 1)
+
+    def _prune(self):
+        while len(self._entries) > self.keep_days:
+            oldest = min(self._entries)
+            del self._entries[oldest]
+            for key in [k for k in self._counts if k[1] == oldest]:
+                del self._counts[key]
+
+    def record(self, day, employee_id, store, status, checked_out=None):
+        """
+        Set one employee's attendance for a day. checked_out=None keeps the
+        previous check-out state; status=None removes the employee from the day.
+        """
+        employee_id = str(employee_id)
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((day, employee_id, store, status, checked_out))
+            self._set(day, employee_id, store, status, checked_out)
+            self._prune()
+
+    def rebuild(self, days, load_rows):
+        """
+        Replace the counters for `days` with load_rows(days), an iterable of
+        (day, employee_id, store, status, checked_out). Writes recorded while
+        the rows load are replayed on top.
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                self._journal = []
+            try:
+                rows = load_rows(days)
+            except Exception:
+                with self._lock:
+                    self._journal = None
+                raise
+
+            with self._lock:
+                journal, self._journal = self._journal, None
+                for day in days:
+                    self._entries[day] = {}
+                    for key in [k for k in self._counts if k[1] == day]:
+                        del self._counts[key]
+                for day, employee_id, store, status, checked_out in rows:
+                    self._set(day, str(employee_id), store, status, checked_out)
+                for day, employee_id, store, status, checked_out in journal:
+                    if day in days:
+                        self._set(day, employee_id, store, status, checked_out)
+                self._prune()
+                self.rebuilt_at = datetime.now()
+
+    def counts(self, store, day):
+        with self._lock:
+            counts = dict(self._counts.get((store, day)) or dict.fromkeys(HEADCOUNT_FIELDS, 0))
+        counts['on_site'] = counts['checked_in'] - counts['checked_out']
+        return counts
+
+    def tracked_days(self):
+        with self._lock:
+            return sorted(self._entries)
+
+
+headcounts = HeadcountBoard(HEADCOUNT_DAYS)
+
+
+def _load_headcount_rows(cursor, where_sql, params):
+    # Absence and leave rows have no location; count them at the home store
+    cursor.execute(f"""
+        SELECT a.date, a.employee_id, COALESCE(a.current_location, e.permanent_location) AS store,
+               a.status, a.check_out IS NOT NULL AS checked_out
+        FROM Attendance a
+        JOIN Employees e ON a.employee_id = e.employee_id
+        WHERE {where_sql}
+    """, params)
+    return [(row['date'], row['employee_id'], row['store'], row['status'], bool(row['checked_out']))
+            for row in cursor.fetchall()]
+
+
+def headcount_days():
+    """Today's date in every store's timezone, plus the server's"""
+    return sorted({date.today()} | {store_local_time(p).date() for p in store_policies.stores()})
+
+
+def rebuild_headcounts(days=None):
+    """Rebuild the live headcounts for `days` (default: every store's today) from Attendance"""
+    days = days or headcount_days()
+
+    def load_rows(days):
         with get_db_connection() as conn:
             with get_db_cursor(conn) as cursor:
-                cursor.execute("SELECT area_name, latitude, longitude FROM StoreLocations")
-                stores = cursor.fetchall()
-                
-                for store in stores:
-                    distance = calculate_distance(
-                        user_lat, user_lon, 
-                        float(store['latitude']), float(store['longitude'])
-                    )
-                    
-                    if distance <= 500:
-                        return store['area_name']
-                
-                return None
-    except Exception as e:
-        print(f"Error finding nearest store: {e}")
+                placeholders = ', '.join(['%s'] * len(days))
+                return _load_headcount_rows(cursor, f"a.date IN ({placeholders})", tuple(days))
+
+    try:
+        headcounts.rebuild(days, load_rows)
+    except Exception:
+        log.exception("Error rebuilding headcounts")
+
+
+def sync_headcounts(cursor, employee_id, start_day, end_day=None):
+    """Re-read one employee's tracked days in [start_day, end_day] after a write"""
+    end_day = end_day or start_day
+    days = [d for d in headcounts.tracked_days() if start_day <= d <= end_day]
+    if not days:
+        return
+    rows = {row[0]: row for row in _load_headcount_rows(
+        cursor, "a.employee_id = %s AND a.date BETWEEN %s AND %s", (employee_id, days[0], days[-1])
+    )}
+    for day in days:
+        _, _, store, status, checked_out = rows.get(day, (day, employee_id, None, None, False))
+        headcounts.record(day, employee_id, store, status, checked_out)
+
+# Arrival analytics. Attendance for a date range is loaded as columns into
+# NumPy arrays and aggregated in vectorized passes; results are cached per
+# (range, store) because historical days rarely change.
+ANALYTICS_CACHE_TTL_SECONDS = int(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "600"))
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", "400"))
+ANALYTICS_DEFAULT_DAYS = 28
+ANALYTICS_STATUSES = ('Present', 'Late', 'Absent', 'On Leave')
+analytics_cache = LruCache(256, ttl=ANALYTICS_CACHE_TTL_SECONDS)
+
+
+def load_attendance_columns(start_date, end_date, store=None):
+    """
+    Load Attendance rows in [start_date, end_date] as NumPy columns:
+    store (object), status code (index into ANALYTICS_STATUSES, or 4 for
+    anything else), week (proleptic ordinal of the week's Monday) and
+    check_in / check_out in seconds since midnight (NaN when missing).
+    """
+    import numpy as np
+
+    store_sql, params = "", [start_date, end_date]
+    if store:
+        store_sql = "AND COALESCE(a.current_location, e.permanent_location) = %s"
+        params.append(store)
+
+    # Plain tuple cursor: the rows go straight into arrays
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT
+                    COALESCE(a.current_location, e.permanent_location),
+                    CASE a.status WHEN 'Present' THEN 0 WHEN 'Late' THEN 1
+                                  WHEN 'Absent' THEN 2 WHEN 'On Leave' THEN 3 ELSE 4 END,
+                    TO_DAYS(a.date) - WEEKDAY(a.date) - 365,
+                    COALESCE(CAST(TIME_TO_SEC(a.check_in) AS SIGNED), -1),
+                    COALESCE(CAST(TIME_TO_SEC(a.check_out) AS SIGNED), -1)
+                FROM {attendance_table(start_date)} a
+                JOIN Employees e ON a.employee_id = e.employee_id
+                WHERE a.date BETWEEN %s AND %s {store_sql}
+            """, tuple(params))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+    columns = list(zip(*rows)) or [()] * 5
+    count = len(rows)
+    check_in = np.fromiter(columns[3], dtype=np.float64, count=count)
+    check_out = np.fromiter(columns[4], dtype=np.float64, count=count)
+    check_in[check_in < 0] = np.nan
+    check_out[check_out < 0] = np.nan
+    return {
+        'store': np.array(columns[0], dtype=object),
+        'status': np.fromiter(columns[1], dtype=np.int8, count=count),
+        'week': np.fromiter(columns[2], dtype=np.int64, count=count),
+        'check_in': check_in,
+        'check_out': check_out,
+    }
+
+
+def _group_quantiles(groups, values, n_groups, quantiles):
+    """Linear-interpolated quantiles of `values` per group, NaN for empty groups"""
+    import numpy as np
+
+    order = np.lexsort((values, groups))
+    values = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    result = np.full((len(quantiles), n_groups), np.nan)
+    present = counts > 0
+    for i, q in enumerate(quantiles):
+        position = starts[present] + (counts[present] - 1) * q
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        result[i, present] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+    return result
+
+
+def _clock(seconds):
+    if seconds != seconds:  # NaN
         return None
+    seconds = int(round(seconds))
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def compute_arrival_analytics(columns):
+    """
+    Per store: check-ins by hour, check-in quartiles, and per week the late
+    rate and average hours worked
+    """
+    import numpy as np
+
+    stores, store_idx = np.unique(columns['store'].astype(str), return_inverse=True)
+    weeks, week_idx = np.unique(columns['week'], return_inverse=True)
+    n_stores, n_weeks = len(stores), len(weeks)
+    status = columns['status']
+    check_in, check_out = columns['check_in'], columns['check_out']
 
-def mark_absent_employees():
+    arrived = ~np.isnan(check_in)
+    hours = (check_in[arrived] // 3600).astype(np.int64).clip(0, 23)
+    by_hour = np.bincount(store_idx[arrived] * 24 + hours, minlength=n_stores * 24).reshape(n_stores, 24)
+    quartiles = _group_quantiles(store_idx[arrived], check_in[arrived], n_stores, (0.25, 0.5, 0.75))
+
+    cell = store_idx * n_weeks + week_idx
+    size = n_stores * n_weeks
+    attended = np.bincount(cell, weights=(status <= 1).astype(np.float64), minlength=size).reshape(n_stores, n_weeks)
+    late = np.bincount(cell, weights=(status == 1).astype(np.float64), minlength=size).reshape(n_stores, n_weeks)
+    absent = np.bincount(cell, weights=(status == 2).astype(np.float64), minlength=size).reshape(n_stores, n_weeks)
+
+    worked = arrived & ~np.isnan(check_out) & (check_out >= check_in)
+    worked_hours = np.where(worked, check_out - check_in, 0.0) / 3600
+    hours_total = np.bincount(cell, weights=worked_hours, minlength=size).reshape(n_stores, n_weeks)
+    hours_days = np.bincount(cell, weights=worked.astype(np.float64), minlength=size).reshape(n_stores, n_weeks)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        late_rate = late / attended
+        avg_hours = hours_total / hours_days
+
+    week_starts = [date.fromordinal(int(w)).isoformat() for w in weeks]
+    result = {}
+    for s, name in enumerate(stores):
+        result[name] = {
+            'check_ins_by_hour': by_hour[s].tolist(),
+            'check_in_p25': _clock(quartiles[0, s]),
+            'check_in_median': _clock(quartiles[1, s]),
+            'check_in_p75': _clock(quartiles[2, s]),
+            'weeks': [{
+                'week_start': week_starts[w],
+                'attended': int(attended[s, w]),
+                'late': int(late[s, w]),
+                'absent': int(absent[s, w]),
+                'late_rate': None if np.isnan(late_rate[s, w]) else round(float(late_rate[s, w]), 4),
+                'avg_hours_worked': None if np.isnan(avg_hours[s, w]) else round(float(avg_hours[s, w]), 2)
+            } for w in range(n_weeks) if attended[s, w] or absent[s, w]]
+        }
+    return result
+
+
+def mark_absent_employees(shard=None):
     """
-    Check for employees with no attendance record for today and mark them absent
+    Give every employee with no attendance record for today one: 'On Leave'
+    when an approved leave request covers today, otherwise 'Absent'
+    Args:
+        shard: Region shard to process (default: every employee, server-local date)
     """
     try:
         with get_db_connection() as conn:
             with get_db_cursor(conn) as cursor:
-                # Get today's date
-                today = datetime.now().date()
+                # Get today's date, in the region's timezone when running for a shard
+                today = datetime.now(shard['tz']).date() if shard else datetime.now().date()
+                scope_sql, scope_params = shard_employee_filter(shard)
                 
-                # Find all employees who don't have an attendance record for today
-                query = """
-                    SELECT e.employee_id, e.name 
-                    FROM Employees e 
-                    LEFT JOIN Attendance a ON e.employee_id = a.employee_id 
+                # One set-based pass; approved leave is resolved with an interval-overlap
+                # probe on LeaveRequests (employee_id, status, start_date, end_date).
+                # IGNORE skips employees who check in between the probe and the insert
+                # instead of failing the whole statement on their duplicate key
+                cursor.execute("""
+                    INSERT IGNORE INTO Attendance (employee_id, date, status, check_in, check_out, current_location)
+                    SELECT
+                        e.employee_id,
+                        %s,
+                        CASE WHEN EXISTS (
+                            SELECT 1 FROM LeaveRequests l
+                            WHERE l.employee_id = e.employee_id
+                              AND l.status = 'Approved'
+                              AND l.start_date <= %s
+                              AND l.end_date >= %s
+                        ) THEN 'On Leave' ELSE 'Absent' END,
+                        NULL, NULL, NULL
+                    FROM Employees e
+                    LEFT JOIN Attendance a ON e.employee_id = a.employee_id
                         AND a.date = %s
                     WHERE a.employee_id IS NULL
-                """
-                
-                cursor.execute(query, (today,))
-                absent_employees = cursor.fetchall()
+                      AND {scope_sql}
+                """.format(scope_sql=scope_sql), (today, today, today, today, *scope_params))
+                marked_count = cursor.rowcount
+                conn.commit()
                 
-                if not absent_employees:
-                    print(f"No employees to mark absent for {today}")
+                region = f" in region {shard['key']}" if shard else ""
+                if not marked_count:
+                    jobs_log.info("No employees to mark absent for %s%s", today, region)
                     return
                 
-                print(f"Found {len(absent_employees)} employees to mark absent for {today}")
-                
-                # Insert absent records for these employees
-                insert_query = """
-                    INSERT INTO Attendance (employee_id, date, status, check_in, check_out, current_location)
-                    VALUES (%s, %s, 'Absent', NULL, NULL, NULL)
-                """
-                
-                absent_count = 0
-                for employee in absent_employees:
-                    try:
-                        cursor.execute(insert_query, (employee['employee_id'], today))
-                        conn.commit()
-                        absent_count += 1
-                        print(f"Marked employee {employee['name']} (ID: {employee['employee_id']}) as absent")
-                    except Exception as e:
-                        print(f"Error marking employee {employee['employee_id']} as absent: {e}")
-                        conn.rollback()
+                cursor.execute("""
+                    SELECT status, COUNT(*) AS total
+                    FROM Attendance
+                    WHERE date = %s AND status IN ('Absent', 'On Leave')
+                    GROUP BY status
+                """, (today,))
+                totals = {row['status']: row['total'] for row in cursor.fetchall()}
                 
-                print(f"Successfully marked {absent_count} employees as absent for {today}")
+        jobs_log.info("Marked %d employees for %s%s: %d absent, %d on leave in total",
+                      marked_count, today, region, totals.get('Absent', 0), totals.get('On Leave', 0))
+        # Takes its own connection, so only after this one is back in the pool
+        rebuild_headcounts([today])
                 
-    except Exception as e:
-        print(f"Error in mark_absent_employees: {e}")
-        logging.error(f"Error in mark_absent_employees: {e}")
+    except Exception:
+        jobs_log.exception("Error in mark_absent_employees")
+
+# Longest leave that is expanded into daily attendance rows on approval
+MAX_LEAVE_DAYS = 366
+
+def record_leave_days(cursor, employee_id, start_date, end_date):
+    """
+    Write an 'On Leave' attendance row for every day of an approved leave.
+    Days already marked 'Absent' are converted; days with real attendance are kept.
+    Returns the number of days written.
+    """
+    days = (end_date - start_date).days + 1
+    if days < 1:
+        return 0
+    if days > MAX_LEAVE_DAYS:
+        raise ValueError(f"Leave spans {days} days; at most {MAX_LEAVE_DAYS} are supported")
+
+    cursor.executemany("""
+        INSERT INTO Attendance (employee_id, date, status, check_in, check_out, current_location)
+        VALUES (%s, %s, 'On Leave', NULL, NULL, NULL)
+        ON DUPLICATE KEY UPDATE
+            version = IF(status = 'Absent', version + 1, version),
+            status = IF(status = 'Absent', 'On Leave', status)
+    """, [(employee_id, start_date + timedelta(days=i)) for i in range(days)])
+    return days
+
+
+def is_active_shift(record):
+    """
+    Whether an attendance row is a shift the employee can check out of:
+    checked in and not out. Pre-written 'On Leave' rows have neither time.
+    """
+    return (record is not None and record['check_in'] is not None
+            and record['check_out'] is None and record['status'] != 'On Leave')
 
 def init_absent_scheduler(hour=21, minute=0):
     """
@@ -216,6 +2377,9 @@ def init_absent_scheduler(hour=21, minute=0):
         hour: Hour in 24-hour format (0-23)
         minute: Minute (0-59)
     """
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+
     ist = pytz.timezone('Asia/Kolkata')
     
     scheduler = BackgroundScheduler(timezone=ist)
@@ -228,7 +2392,7 @@ def init_absent_scheduler(hour=21, minute=0):
         replace_existing=True
     )
     
-    print(f"Absent employee scheduler set for {hour:02d}:{minute:02d} IST")
+    jobs_log.info("Absent employee scheduler set for %02d:%02d IST", hour, minute)
     return scheduler
 
 def init_late_request_scheduler(hour=21, minute=0):
@@ -238,6 +2402,9 @@ def init_late_request_scheduler(hour=21, minute=0):
         hour: Hour in 24-hour format (0-23)
         minute: Minute (0-59)
     """
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+
     ist = pytz.timezone('Asia/Kolkata')
     
     scheduler = BackgroundScheduler(timezone=ist)
@@ -250,101 +2417,756 @@ def init_late_request_scheduler(hour=21, minute=0):
         replace_existing=True
     )
     
-    print(f"Late request rejection scheduler set for {hour:02d}:{minute:02d} IST")
+    jobs_log.info("Late request rejection scheduler set for %02d:%02d IST", hour, minute)
     return scheduler
 
-def init_all_schedulers(absent_hour=21, absent_minute=0, late_request_hour=21, late_request_minute=5):
+# Pre-rush warm-up, run per region at WARMUP_TIME local time
+WARMUP_TIME = os.getenv("WARMUP_TIME", "08:30")
+WARMUP_POOL_SIZE = int(os.getenv("WARMUP_POOL_SIZE", str(max(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE // 2))))
+COMPRE_FACE_HEALTH_URL = os.getenv("COMPRE_FACE_HEALTH_URL")
+
+last_warmup = {}
+
+
+def _compreface_health():
+    """Probe CompreFace so the first check-in does not pay for a cold connection"""
+    url = COMPRE_FACE_HEALTH_URL
+    if not url and COMPRE_FACE_URL:
+        from urllib.parse import urlsplit
+        parts = urlsplit(COMPRE_FACE_URL)
+        url = f"{parts.scheme}://{parts.netloc}/"
+    if not url:
+        return {'status': 'not_configured'}
+
+    started = _time.monotonic()
+    try:
+        response = get_compreface_session().get(url, timeout=5)
+        return {
+            'status': 'ok' if response.status_code < 500 else 'error',
+            'http_status': response.status_code,
+            'latency_ms': round((_time.monotonic() - started) * 1000, 1)
+        }
+    except Exception as e:
+        return {'status': 'unreachable', 'error': str(e)}
+
+
+def warm_caches(shard=None):
+    """
+    Load the roster, store index, reference photos and face templates into the
+    in-process caches, open pool connections ahead of the rush and probe CompreFace
+    Args:
+        shard: Region shard whose employees to load (default: everyone)
+    """
+    started = _time.monotonic()
+    result = {'region': shard['key'] if shard else None, 'started_at': datetime.now().isoformat()}
+    try:
+        result['stores'] = len(store_policies.refresh())
+
+        scope_sql, scope_params = shard_employee_filter(shard)
+        with get_db_connection() as conn:
+            with get_db_cursor(conn) as cursor:
+                cursor.execute(f"""
+                    SELECT employee_id, name, photo_url, permanent_location
+                    FROM Employees e
+                    WHERE {scope_sql}
+                """, scope_params)
+                roster = cursor.fetchall()
+                cursor.execute(f"""
+                    SELECT t.employee_id, t.template
+                    FROM EmployeeFaceTemplates t
+                    JOIN Employees e ON t.employee_id = e.employee_id
+                    WHERE {scope_sql}
+                """, scope_params)
+                templates = {row['employee_id']: json.loads(row['template']) for row in cursor.fetchall()}
+
+        photos = 0
+        for employee in roster:
+            employee_cache.put(str(employee['employee_id']), employee)
+            face_template_cache.put(str(employee['employee_id']), templates.get(employee['employee_id'], []))
+            if employee['photo_url']:
+                try:
+                    load_stored_photo(employee['photo_url'])
+                    photos += 1
+                except OSError:
+                    pass
+        result['employees'] = len(roster)
+        result['photos'] = photos
+        result['face_templates'] = len(templates)
+
+        result['pool_connections_opened'] = get_connection_pool().prewarm(WARMUP_POOL_SIZE)
+        result['compreface'] = _compreface_health()
+        result['status'] = 'success'
+    except Exception as e:
+        jobs_log.exception("Error warming caches")
+        result['status'] = 'error'
+        result['error'] = str(e)
+
+    result['duration_ms'] = round((_time.monotonic() - started) * 1000, 1)
+    # Hit rates reported from here on describe the warmed caches
+    employee_cache.reset_counters()
+    face_image_cache.reset_counters()
+    face_template_cache.reset_counters()
+    last_warmup.clear()
+    last_warmup.update(result)
+    jobs_log.info("Cache warm-up %s in %s ms (%d employees, %d photos)", result['status'],
+                  result['duration_ms'], result.get('employees', 0), result.get('photos', 0))
+    return result
+
+def build_region_shards():
+    """
+    Group stores into region shards: stores sharing a timezone and nightly job
+    times are processed together, at that region's local time. The shard that
+    matches the default policy also covers employees whose permanent location
+    is not a known store.
+    """
+    try:
+        stores = store_policies.stores()
+    except Exception as e:
+        jobs_log.error("Error loading stores for region shards: %s", e)
+        stores = []
+
+    shards = {}
+    for policy in [DEFAULT_STORE_POLICY] + stores:
+        key = (f"{policy['timezone']}@{policy['absence_mark_time'].strftime('%H%M')}"
+               f"-{policy['late_reject_time'].strftime('%H%M')}")
+        shard = shards.setdefault(key, {
+            'key': key,
+            'timezone': policy['timezone'],
+            'tz': policy['tz'],
+            'absence_mark_time': policy['absence_mark_time'],
+            'late_reject_time': policy['late_reject_time'],
+            'stores': [],
+            'default': policy is DEFAULT_STORE_POLICY,
+            'exclude': [],
+        })
+        if policy['area_name'] is not None:
+            shard['stores'].append(policy['area_name'])
+
+    default_shard = next(shard for shard in shards.values() if shard['default'])
+    default_shard['exclude'] = [
+        store for shard in shards.values() if not shard['default'] for store in shard['stores']
+    ]
+    return list(shards.values())
+
+def shard_employee_filter(shard):
+    """SQL condition (on Employees alias e) selecting the employees a shard is responsible for"""
+    if shard is None:
+        return "1 = 1", []
+    if shard['default']:
+        if not shard['exclude']:
+            return "1 = 1", []
+        placeholders = ', '.join(['%s'] * len(shard['exclude']))
+        return f"(e.permanent_location IS NULL OR e.permanent_location NOT IN ({placeholders}))", list(shard['exclude'])
+    placeholders = ', '.join(['%s'] * len(shard['stores']))
+    return f"e.permanent_location IN ({placeholders})", list(shard['stores'])
+
+def sync_region_jobs(scheduler):
+    """Add, update or remove the per-region absence and rejection jobs to match StoreLocations"""
+    from apscheduler.triggers.cron import CronTrigger
+
+    shards = build_region_shards()
+    wanted = set()
+    for shard in shards:
+        tz = shard['tz']
+        absence = shard['absence_mark_time']
+        reject = shard['late_reject_time']
+
+        scheduler.add_job(
+            func=mark_absent_employees,
+            args=[shard],
+            trigger=CronTrigger(hour=absence.hour, minute=absence.minute, timezone=tz),
+            id=f"absent_check:{shard['key']}",
+            name=f"Mark absent employees daily at {absence.strftime('%H:%M')} {shard['timezone']}",
+            replace_existing=True
+        )
+        scheduler.add_job(
+            func=reject_pending_late_requests,
+            args=[shard],
+            trigger=CronTrigger(hour=reject.hour, minute=reject.minute, timezone=tz),
+            id=f"late_request_rejection:{shard['key']}",
+            name=f"Reject pending late requests daily at {reject.strftime('%H:%M')} {shard['timezone']}",
+            replace_existing=True
+        )
+        warmup_hour, warmup_minute = (int(part) for part in WARMUP_TIME.split(':'))
+        scheduler.add_job(
+            func=warm_caches,
+            args=[shard],
+            trigger=CronTrigger(hour=warmup_hour, minute=warmup_minute, timezone=tz),
+            id=f"cache_warmup:{shard['key']}",
+            name=f"Warm caches daily at {WARMUP_TIME} {shard['timezone']}",
+            replace_existing=True
+        )
+        wanted.update({
+            f"absent_check:{shard['key']}",
+            f"late_request_rejection:{shard['key']}",
+            f"cache_warmup:{shard['key']}"
+        })
+
+    for job in scheduler.get_jobs():
+        if job.id.startswith(('absent_check:', 'late_request_rejection:', 'cache_warmup:')) and job.id not in wanted:
+            scheduler.remove_job(job.id)
+
+    return shards
+
+def init_all_schedulers():
     """
-    Initialize both schedulers with custom timing
-    Args:
-        absent_hour: Hour for absent check (default: 21 = 9 PM)
-        absent_minute: Minute for absent check (default: 0)
-        late_request_hour: Hour for late request rejection (default: 21 = 9 PM)
-        late_request_minute: Minute for late request rejection (default: 5 = 5 minutes after)
+    Initialize the absent check and late request rejection jobs, one pair per
+    region shard, each firing at its region's local time. The shards are
+    re-synced with StoreLocations every hour.
     """
-    ist = pytz.timezone('Asia/Kolkata')
-    
-    scheduler = BackgroundScheduler(timezone=ist)
-    
-    # Add absent employee check job
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+
+    scheduler = BackgroundScheduler(timezone=pytz.timezone(DEFAULT_TIMEZONE))
+    shards = sync_region_jobs(scheduler)
+
     scheduler.add_job(
-        func=mark_absent_employees,
-        trigger=CronTrigger(hour=absent_hour, minute=absent_minute, timezone=ist),
-        id='absent_check',
-        name=f'Mark absent employees daily at {absent_hour:02d}:{absent_minute:02d} IST',
+        func=sync_region_jobs,
+        args=[scheduler],
+        trigger='interval',
+        hours=1,
+        id='region_shard_sync',
+        name='Re-sync region shards with StoreLocations',
         replace_existing=True
     )
-    
-    # Add late request rejection job
+    archive_hour, archive_minute = (int(part) for part in ATTENDANCE_ARCHIVE_TIME.split(':'))
     scheduler.add_job(
-        func=reject_pending_late_requests,
-        trigger=CronTrigger(hour=late_request_hour, minute=late_request_minute, timezone=ist),
-        id='late_request_rejection',
-        name=f'Reject pending late requests daily at {late_request_hour:02d}:{late_request_minute:02d} IST',
+        func=maintain_attendance_partitions,
+        trigger=CronTrigger(day=1, hour=archive_hour, minute=archive_minute,
+                            timezone=pytz.timezone(DEFAULT_TIMEZONE)),
+        id='attendance_partitions',
+        name='Add Attendance partitions and archive closed months',
+        replace_existing=True
+    )
+    backfill_hour, backfill_minute = (int(part) for part in WORKED_SECONDS_BACKFILL_TIME.split(':'))
+    scheduler.add_job(
+        func=nightly_worked_seconds_backfill,
+        trigger=CronTrigger(hour=backfill_hour, minute=backfill_minute,
+                            timezone=pytz.timezone(DEFAULT_TIMEZONE)),
+        id='worked_seconds_backfill',
+        name='Backfill worked_seconds on recent attendance rows',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=rebuild_headcounts,
+        trigger='interval',
+        seconds=HEADCOUNT_RESYNC_SECONDS,
+        next_run_time=datetime.now(pytz.timezone(DEFAULT_TIMEZONE)),
+        id='headcount_resync',
+        name='Rebuild live headcounts from Attendance',
         replace_existing=True
     )
     
     scheduler.start()
-    print(f"Both schedulers started:")
-    print(f"  - Absent check: {absent_hour:02d}:{absent_minute:02d} IST")
-    print(f"  - Late request rejection: {late_request_hour:02d}:{late_request_minute:02d} IST")
+    jobs_log.info("Schedulers started for %d region shard(s)", len(shards))
+    for shard in shards:
+        jobs_log.info("Region %s: absent check %s, late request rejection %s (%d stores%s)",
+                      shard['key'], shard['absence_mark_time'].strftime('%H:%M'),
+                      shard['late_reject_time'].strftime('%H:%M'), len(shard['stores']),
+                      ', plus unassigned employees' if shard['default'] else '')
     
     # Shut down the scheduler when exiting the app
     atexit.register(lambda: scheduler.shutdown())
     
     return scheduler
 
-def reject_pending_late_requests():
+# Nightly rejection works in request_id order, LATE_REJECT_CHUNK_SIZE rows per
+# short transaction, so it never holds locks on the whole pending backlog
+LATE_REJECT_CHUNK_SIZE = int(os.getenv("LATE_REJECT_CHUNK_SIZE", "500"))
+
+
+@contextmanager
+def job_run(job, scope):
     """
-    Check for pending late arrival requests and mark them as rejected
+    Record one run of a background job in JobRuns. The body updates the
+    yielded dict's counters; they are saved with the outcome when it exits.
     """
+    run = {'run_id': None, 'examined': 0, 'affected': 0, 'chunks': 0}
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(read_only=False) as conn:
             with get_db_cursor(conn) as cursor:
-                # Find all pending late arrival requests
-                select_query = """
-                    SELECT lar.request_id, lar.employee_id, e.name, lar.requested_at
-                    FROM LateArrivalRequests lar
-                    JOIN Employees e ON lar.employee_id = e.employee_id
-                    WHERE lar.status = 'Pending'
-                """
-                
-                cursor.execute(select_query)
-                pending_requests = cursor.fetchall()
-                
-                if not pending_requests:
-                    print("No pending late arrival requests to reject")
-                    return
-                
-                print(f"Found {len(pending_requests)} pending late arrival requests to reject")
-                
-                # Update all pending requests to rejected
-                update_query = """
-                    UPDATE LateArrivalRequests 
-                    SET status = 'Rejected' 
-                    WHERE status = 'Pending'
-                """
-                
-                cursor.execute(update_query)
-                rejected_count = cursor.rowcount
+                cursor.execute(
+                    "INSERT INTO JobRuns (job, scope, started_at, status) VALUES (%s, %s, NOW(), 'running')",
+                    (job, scope)
+                )
                 conn.commit()
-                
-                # Log each rejected request
-                for request in pending_requests:
-                    print(f"Rejected late arrival request ID: {request['request_id']} for employee {request['name']} (ID: {request['employee_id']}) requested at {request['requested_at']}")
-                
-                print(f"Successfully rejected {rejected_count} pending late arrival requests")
-                
+                run['run_id'] = cursor.lastrowid
+    except mysql.connector.Error as e:
+        jobs_log.warning("Could not record %s run in JobRuns: %s", job, e)
+
+    status, error = 'success', None
+    try:
+        yield run
+    except Exception as e:
+        status, error = 'error', str(e)
+        raise
+    finally:
+        if run['run_id'] is not None:
+            try:
+                with get_db_connection(read_only=False) as conn:
+                    with get_db_cursor(conn) as cursor:
+                        cursor.execute("""
+                            UPDATE JobRuns
+                            SET finished_at = NOW(), status = %s, rows_examined = %s,
+                                rows_affected = %s, chunks = %s, error = %s
+                            WHERE run_id = %s
+                        """, (status, run['examined'], run['affected'], run['chunks'], error, run['run_id']))
+                        conn.commit()
+            except mysql.connector.Error as e:
+                jobs_log.warning("Could not finish %s run %s in JobRuns: %s", job, run['run_id'], e)
+
+
+def reject_pending_late_requests(shard=None):
+    """
+    Reject pending late arrival requests made before the region's rejection
+    time today, in request_id-ordered chunks with one short transaction each.
+    Requests that arrive while the job runs are left for the next run.
+    Args:
+        shard: Region shard to process (default: every employee, server-local time)
+    """
+    # requested_at is stored in store-local time
+    cutoff = (datetime.combine(datetime.now(shard['tz']).date(), shard['late_reject_time'])
+              if shard else datetime.now())
+    scope = shard['key'] if shard else 'all'
+    try:
+        with job_run('late_request_rejection', scope) as run:
+            with get_db_connection(read_only=False) as conn:
+                with get_db_cursor(conn) as cursor:
+                    scope_sql, scope_params = shard_employee_filter(shard)
+                    last_id = 0
+                    while True:
+                        conn.start_transaction()
+                        cursor.execute(f"""
+                            SELECT lar.request_id, lar.employee_id, e.name, lar.requested_at
+                            FROM LateArrivalRequests lar
+                            JOIN Employees e ON lar.employee_id = e.employee_id
+                            WHERE lar.status = 'Pending'
+                              AND lar.request_id > %s
+                              AND lar.requested_at < %s
+                              AND {scope_sql}
+                            ORDER BY lar.request_id
+                            LIMIT %s
+                            FOR UPDATE
+                        """, (last_id, cutoff, *scope_params, LATE_REJECT_CHUNK_SIZE))
+                        chunk = cursor.fetchall()
+                        if not chunk:
+                            conn.commit()
+                            break
+
+                        ids = [row['request_id'] for row in chunk]
+                        placeholders = ', '.join(['%s'] * len(ids))
+                        cursor.execute(f"""
+                            UPDATE LateArrivalRequests SET status = 'Rejected'
+                            WHERE request_id IN ({placeholders}) AND status = 'Pending'
+                        """, ids)
+                        run['affected'] += cursor.rowcount
+                        conn.commit()
+
+                        run['examined'] += len(chunk)
+                        run['chunks'] += 1
+                        last_id = ids[-1]
+
+                        # Log each rejected request (sampled, see LOG_ROW_SAMPLE_EVERY)
+                        if row_log.isEnabledFor(logging.INFO):
+                            for row in chunk:
+                                row_log.info("Rejected late arrival request ID: %s for employee %s (ID: %s) requested at %s",
+                                             row['request_id'], row['name'], row['employee_id'], row['requested_at'])
+
+            jobs_log.info("Rejected %d pending late arrival requests before %s in %d chunk(s) (%s)",
+                          run['affected'], cutoff.strftime('%Y-%m-%d %H:%M'), run['chunks'], scope)
+        return run
+
+    except Exception:
+        jobs_log.exception("Error in reject_pending_late_requests")
+
+# Attendance partitioning. Attendance is range-partitioned by month; months
+# older than ATTENDANCE_HOT_MONTHS are moved to the compressed
+# AttendanceArchive table by a monthly job. AttendanceAll is the union of both
+# and is what reports read when their range reaches archived months.
+ATTENDANCE_HOT_MONTHS = int(os.getenv("ATTENDANCE_HOT_MONTHS", "13"))
+ATTENDANCE_FUTURE_PARTITIONS = 3
+ATTENDANCE_ARCHIVE_TIME = os.getenv("ATTENDANCE_ARCHIVE_TIME", "02:30")
+ATTENDANCE_ALL_VIEW = ("CREATE OR REPLACE VIEW AttendanceAll AS "
+                       "SELECT * FROM Attendance UNION ALL SELECT * FROM AttendanceArchive")
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _partition_name(month_start):
+    return f"p{month_start.strftime('%Y%m')}"
+
+
+def _partition_clause(month_start):
+    return f"PARTITION {_partition_name(month_start)} VALUES LESS THAN ('{_add_months(month_start, 1).isoformat()}')"
+
+
+def _attendance_partitioning_sql(cursor):
+    """PARTITION BY statement covering every month with data, plus a few future months"""
+    cursor.execute("SELECT MIN(date) AS first_day FROM Attendance")
+    first_day = cursor.fetchone()['first_day'] or date.today()
+    month = first_day.replace(day=1)
+    last = _add_months(date.today(), ATTENDANCE_FUTURE_PARTITIONS)
+    clauses = []
+    while month <= last:
+        clauses.append(_partition_clause(month))
+        month = _add_months(month, 1)
+    clauses.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return f"ALTER TABLE Attendance PARTITION BY RANGE COLUMNS(date) ({', '.join(clauses)})"
+
+
+def _attendance_partitions_migration(cursor):
+    """
+    Statements for 0005. InnoDB cannot partition a table that has or is referenced
+    by foreign keys, so refuse before anything is changed rather than halfway through.
+    """
+    cursor.execute("""
+        SELECT CONSTRAINT_NAME, TABLE_NAME, REFERENCED_TABLE_NAME
+        FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE()
+          AND (TABLE_NAME = 'Attendance' OR REFERENCED_TABLE_NAME = 'Attendance')
+    """)
+    foreign_keys = cursor.fetchall()
+    if foreign_keys:
+        names = ', '.join(f"{fk['CONSTRAINT_NAME']} ({fk['TABLE_NAME']} -> {fk['REFERENCED_TABLE_NAME']})"
+                          for fk in foreign_keys)
+        raise RuntimeError(f"Attendance cannot be partitioned while it has foreign keys: {names}. "
+                           "Drop them and run the migration again.")
+    return [
+        "CREATE TABLE AttendanceArchive LIKE Attendance",
+        "ALTER TABLE AttendanceArchive ROW_FORMAT=COMPRESSED",
+        ATTENDANCE_ALL_VIEW,
+        # Every unique key of a partitioned table must include the partition column
+        "ALTER TABLE Attendance DROP PRIMARY KEY, ADD PRIMARY KEY (attendance_id, date)",
+        _attendance_partitioning_sql(cursor),
+    ]
+
+
+def attendance_archive_cutoff():
+    """First day still kept in Attendance; earlier months may be archived"""
+    return _add_months(date.today(), -(ATTENDANCE_HOT_MONTHS - 1))
+
+
+def attendance_table(start_date):
+    """Table or view a report starting at start_date should read Attendance rows from"""
+    return 'Attendance' if start_date >= attendance_archive_cutoff() else 'AttendanceAll'
+
+
+# Schema changes applied by `flask --app backend migrate`, in order. Each entry
+# runs once and is recorded in SchemaMigrations.
+SCHEMA_MIGRATIONS = [
+    ('0001_leave_request_indexes', [
+        "CREATE INDEX idx_leave_status_start ON LeaveRequests (status, start_date, leave_id)",
+        "CREATE INDEX idx_leave_employee_start ON LeaveRequests (employee_id, start_date, leave_id)",
+        "CREATE INDEX idx_leave_start ON LeaveRequests (start_date, leave_id)",
+        "CREATE INDEX idx_employees_location ON Employees (permanent_location)",
+    ]),
+    ('0002_leave_interval_index', [
+        "CREATE INDEX idx_leave_employee_interval ON LeaveRequests (employee_id, status, start_date, end_date)",
+    ]),
+    ('0003_store_policies', [
+        "ALTER TABLE StoreLocations ADD COLUMN timezone VARCHAR(64) NOT NULL DEFAULT 'Asia/Kolkata'",
+        "ALTER TABLE StoreLocations ADD COLUMN checkin_cutoff TIME NOT NULL DEFAULT '09:45:00'",
+        "ALTER TABLE StoreLocations ADD COLUMN absence_mark_time TIME NOT NULL DEFAULT '21:10:00'",
+        "ALTER TABLE StoreLocations ADD COLUMN late_reject_time TIME NOT NULL DEFAULT '21:00:00'",
+        "ALTER TABLE StoreLocations ADD COLUMN geofence_radius_m INT NOT NULL DEFAULT 500",
+    ]),
+    ('0004_date_range_indexes', [
+        "CREATE INDEX idx_attendance_date ON Attendance (date)",
+        "CREATE INDEX idx_late_requested_at ON LateArrivalRequests (requested_at)",
+        "CREATE INDEX idx_late_employee_requested ON LateArrivalRequests (employee_id, requested_at)",
+        "CREATE INDEX idx_late_status ON LateArrivalRequests (status, request_id)",
+    ]),
+    # The archive is created before partitioning so that LIKE copies a plain table
+    ('0005_attendance_partitions', _attendance_partitions_migration),
+    # Columns added to Attendance go to AttendanceArchive too, and the view is
+    # recreated because SELECT * in a view is expanded when it is created
+    ('0006_attendance_version', [
+        "ALTER TABLE Attendance ADD COLUMN version INT NOT NULL DEFAULT 0",
+        "ALTER TABLE AttendanceArchive ADD COLUMN version INT NOT NULL DEFAULT 0",
+        ATTENDANCE_ALL_VIEW,
+    ]),
+    ('0007_job_runs', [
+        """
+        CREATE TABLE JobRuns (
+            run_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            job VARCHAR(64) NOT NULL,
+            scope VARCHAR(128) NOT NULL,
+            started_at DATETIME NOT NULL,
+            finished_at DATETIME NULL,
+            status VARCHAR(16) NOT NULL,
+            rows_examined INT NOT NULL DEFAULT 0,
+            rows_affected INT NOT NULL DEFAULT 0,
+            chunks INT NOT NULL DEFAULT 0,
+            error TEXT NULL,
+            KEY idx_job_runs_job_started (job, started_at)
+        )
+        """,
+    ]),
+    # Covers the hours report: date range, then store/employee, then the value summed
+    ('0008_attendance_worked_seconds', [
+        "ALTER TABLE Attendance ADD COLUMN worked_seconds INT NULL",
+        "ALTER TABLE AttendanceArchive ADD COLUMN worked_seconds INT NULL",
+        ATTENDANCE_ALL_VIEW,
+        "CREATE INDEX idx_attendance_hours ON Attendance (date, current_location, employee_id, worked_seconds)",
+        "CREATE INDEX idx_attendance_hours ON AttendanceArchive (date, current_location, employee_id, worked_seconds)",
+    ]),
+    ('0009_face_templates', [
+        """
+        CREATE TABLE EmployeeFaceReferences (
+            employee_id INT NOT NULL,
+            reference_rank INT NOT NULL,
+            photo_path VARCHAR(255) NOT NULL,
+            embedding JSON NOT NULL,
+            template_similarity FLOAT NOT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (employee_id, reference_rank)
+        )
+        """,
+        """
+        CREATE TABLE EmployeeFaceTemplates (
+            employee_id INT PRIMARY KEY,
+            mode VARCHAR(16) NOT NULL,
+            template JSON NOT NULL,
+            reference_count INT NOT NULL,
+            updated_at DATETIME NOT NULL
+        )
+        """,
+    ]),
+]
+
+
+def maintain_attendance_partitions():
+    """
+    Monthly: add partitions for the coming months, then move every month older
+    than the archive cutoff into AttendanceArchive and drop its partition.
+    """
+    summary = {'added': [], 'archived': {}}
+    try:
+        with get_db_connection(read_only=False) as conn:
+            with get_db_cursor(conn) as cursor:
+                cursor.execute("""
+                    SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS bound
+                    FROM information_schema.PARTITIONS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'Attendance'
+                    ORDER BY PARTITION_ORDINAL_POSITION
+                """)
+                partitions = [row for row in cursor.fetchall() if row['name']]
+                if not partitions:
+                    jobs_log.warning("Attendance is not partitioned; run the 0005 migration")
+                    return summary
+                names = {row['name'] for row in partitions}
+
+                # pmax should be empty, so splitting it only touches metadata
+                month = _add_months(date.today(), 1)
+                for _ in range(ATTENDANCE_FUTURE_PARTITIONS):
+                    if _partition_name(month) not in names:
+                        cursor.execute(
+                            "ALTER TABLE Attendance REORGANIZE PARTITION pmax INTO "
+                            f"({_partition_clause(month)}, PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+                        )
+                        summary['added'].append(_partition_name(month))
+                    month = _add_months(month, 1)
+
+                cutoff = f"'{attendance_archive_cutoff().isoformat()}'"
+                for row in partitions:
+                    if row['name'] == 'pmax' or row['bound'] > cutoff:
+                        continue
+                    name = row['name']
+                    cursor.execute(f"SELECT COUNT(*) AS total FROM Attendance PARTITION ({name})")
+                    total = cursor.fetchone()['total']
+                    # INSERT IGNORE keeps a retry after a failed DROP harmless
+                    cursor.execute(f"INSERT IGNORE INTO AttendanceArchive SELECT * FROM Attendance PARTITION ({name})")
+                    conn.commit()
+                    cursor.execute(f"""
+                        SELECT COUNT(*) AS total FROM AttendanceArchive
+                        WHERE attendance_id IN (SELECT attendance_id FROM Attendance PARTITION ({name}))
+                    """)
+                    if cursor.fetchone()['total'] != total:
+                        jobs_log.error("Archive copy of %s is incomplete; partition kept", name)
+                        continue
+                    cursor.execute(f"ALTER TABLE Attendance DROP PARTITION {name}")
+                    summary['archived'][name] = total
+
+        jobs_log.info("Attendance partitions: added %s, archived %s", summary['added'] or 'none',
+                      summary['archived'] or 'none')
     except Exception as e:
-        print(f"Error in reject_pending_late_requests: {e}")
-        logging.error(f"Error in reject_pending_late_requests: {e}")
+        jobs_log.exception("Error maintaining attendance partitions")
+        summary['error'] = str(e)
+    return summary
+
+# Worked duration of a row from its own check-in and check-out, NULL while the
+# shift is open. Put it after any check_in/check_out assignments in an UPDATE:
+# MySQL evaluates single-table assignments left to right.
+WORKED_SECONDS_SQL = ("CASE WHEN check_in IS NOT NULL AND check_out IS NOT NULL AND check_out >= check_in "
+                      "THEN TIME_TO_SEC(TIMEDIFF(check_out, check_in)) END")
+WORKED_SECONDS_BACKFILL_TIME = os.getenv("WORKED_SECONDS_BACKFILL_TIME", "03:00")
+WORKED_SECONDS_BACKFILL_DAYS = int(os.getenv("WORKED_SECONDS_BACKFILL_DAYS", "7"))
+WORKED_SECONDS_CHUNK_SIZE = int(os.getenv("WORKED_SECONDS_CHUNK_SIZE", "1000"))
+
+
+def backfill_worked_seconds(since=None):
+    """
+    Fill worked_seconds on checked-out rows that do not have it, in
+    attendance_id-ordered chunks with one short transaction each.
+    Args:
+        since: Only rows dated on or after this day (default: every row,
+               AttendanceArchive included)
+    """
+    tables = ['Attendance'] if since and since >= attendance_archive_cutoff() else ['Attendance', 'AttendanceArchive']
+    date_sql, date_params = ("AND date >= %s", (since,)) if since else ("", ())
+    runs = {}
+    try:
+        for table in tables:
+            with job_run('worked_seconds_backfill', table) as run:
+                with get_db_connection(read_only=False) as conn:
+                    with get_db_cursor(conn) as cursor:
+                        last_id = 0
+                        while True:
+                            conn.start_transaction()
+                            cursor.execute(f"""
+                                SELECT attendance_id FROM {table}
+                                WHERE worked_seconds IS NULL
+                                  AND check_in IS NOT NULL AND check_out IS NOT NULL
+                                  AND attendance_id > %s
+                                  {date_sql}
+                                ORDER BY attendance_id
+                                LIMIT %s
+                                FOR UPDATE
+                            """, (last_id, *date_params, WORKED_SECONDS_CHUNK_SIZE))
+                            ids = [row['attendance_id'] for row in cursor.fetchall()]
+                            if not ids:
+                                conn.commit()
+                                break
+
+                            placeholders = ', '.join(['%s'] * len(ids))
+                            cursor.execute(f"""
+                                UPDATE {table} SET worked_seconds = {WORKED_SECONDS_SQL}
+                                WHERE attendance_id IN ({placeholders})
+                            """, ids)
+                            run['affected'] += cursor.rowcount
+                            conn.commit()
+
+                            run['examined'] += len(ids)
+                            run['chunks'] += 1
+                            last_id = ids[-1]
+            runs[table] = run
+            jobs_log.info("Backfilled worked_seconds on %d %s rows in %d chunk(s)",
+                          run['affected'], table, run['chunks'])
+        return runs
+
+    except Exception:
+        jobs_log.exception("Error in backfill_worked_seconds")
+
 
-scheduler = init_all_schedulers(
-    absent_hour=21, absent_minute=10,           # 9:00 PM for absent check
-    late_request_hour=21, late_request_minute=0  # 9:05 PM for late request rejection
-)
+def nightly_worked_seconds_backfill():
+    """Catch rows whose check-out was written without worked_seconds in the last few days"""
+    return backfill_worked_seconds(since=date.today() - timedelta(days=WORKED_SECONDS_BACKFILL_DAYS))
+
+# Errors meaning a statement was already applied (duplicate index, column or table)
+ALREADY_APPLIED_ERRNOS = {1050, 1060, 1061}
+ER_NO_SUCH_TABLE = 1146
+
+def apply_schema_migrations():
+    """Apply every migration in SCHEMA_MIGRATIONS that has not been recorded yet"""
+    with get_db_connection() as conn:
+        with get_db_cursor(conn) as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS SchemaMigrations (
+                    name VARCHAR(100) PRIMARY KEY,
+                    applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("SELECT name FROM SchemaMigrations")
+            applied = {row['name'] for row in cursor.fetchall()}
+
+            for name, statements in SCHEMA_MIGRATIONS:
+                if name in applied:
+                    continue
+                # Migrations that depend on the data build their statements here
+                if callable(statements):
+                    statements = statements(cursor)
+                for statement in statements:
+                    try:
+                        cursor.execute(statement)
+                    except mysql.connector.Error as e:
+                        if e.errno not in ALREADY_APPLIED_ERRNOS:
+                            raise
+                        db_log.info("Migration %s: skipped (already applied): %s", name, e.msg)
+                cursor.execute("INSERT INTO SchemaMigrations (name) VALUES (%s)", (name,))
+                conn.commit()
+                db_log.info("Applied migration %s", name)
+
+def pending_schema_migrations():
+    """Names of the SCHEMA_MIGRATIONS entries not yet applied, in order"""
+    with get_db_connection(read_only=False) as conn:
+        with get_db_cursor(conn) as cursor:
+            try:
+                cursor.execute("SELECT name FROM SchemaMigrations")
+                applied = {row['name'] for row in cursor.fetchall()}
+            except mysql.connector.Error as e:
+                if e.errno != ER_NO_SUCH_TABLE:
+                    raise
+                applied = set()
+    return [name for name, _ in SCHEMA_MIGRATIONS if name not in applied]
+
+
+def create_app(start_scheduler=True, check_migrations=True):
+    """
+    Application factory. Importing this module only builds the Flask app and
+    its routes; logging is set up here, the connection pool and CompreFace
+    session are created on first use. Servers must load the app through it,
+    e.g. `gunicorn 'backend:create_app()'` rather than `gunicorn backend:app`;
+    an app served without it warns on its first request and runs no jobs.
+    The scheduler runs every nightly job (absence marking, late request
+    rejection, archival, backfills) in the process that starts it, so exactly
+    one process should: with a pre-fork server, call create_app(start_scheduler=False)
+    in the workers and run the scheduler in a single separate process (or in
+    one worker chosen under a lock).
+    Queries assume the schema is current (e.g. Attendance.version), so by default
+    the factory refuses to start while migrations are pending.
+    Args:
+        start_scheduler: Start the background job scheduler (default: True)
+        check_migrations: Fail unless every schema migration is applied (default: True)
+    """
+    global scheduler, _app_created
+    configure_logging()
+    _app_created = True
+    if check_migrations:
+        pending = pending_schema_migrations()
+        if pending:
+            raise RuntimeError(f"Pending schema migrations: {', '.join(pending)}. "
+                               "Run `flask --app backend migrate` first.")
+    if start_scheduler and scheduler is None:
+        scheduler = init_all_schedulers()
+    return app
+
+_app_created = False
+
+
+@app.before_request
+def warn_without_factory():
+    """Serving `backend:app` directly skips create_app(); say so once instead of running silently"""
+    global _app_created
+    if _app_created:
+        return
+    with _init_lock:
+        if _app_created:
+            return
+        _app_created = True
+        configure_logging()
+    log.warning("The app is being served without create_app(): scheduled jobs are not running. "
+                "Point the server at backend:create_app() (see its docstring).")
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations"""
+    apply_schema_migrations()
 
 @app.route('/upload_photo', methods=['POST'])
+@rate_limited
 def upload_photo():
     if 'photo' not in request.files or 'employee_id' not in request.form:
         return jsonify({'error': 'Missing photo or employee_id'}), 400
@@ -364,28 +3186,142 @@ def upload_photo():
                     return jsonify({'error': 'Employee ID does not exist'}), 404
 
                 # Check for face in uploaded image
-                photo.stream.seek(0)
-                if not is_face_detected(photo.stream):
+                upload = upload_buffer('photo')
+                if not is_face_detected(upload.payload()):
                     return jsonify({'error': 'No face detected in photo'}), 400
 
-                photo.stream.seek(0)
-
                 # Save photo
                 filename = secure_filename(f"employee_{employee_id}.jpg")
                 photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                photo.save(photo_path)
+                upload.save(photo_path)
 
-                # Update path in DB
+                # Update path in DB; a single new photo replaces any enrolled references
                 cursor.execute("UPDATE Employees SET photo_url = %s WHERE employee_id = %s", (photo_path, employee_id))
+                cursor.execute("DELETE FROM EmployeeFaceTemplates WHERE employee_id = %s", (employee_id,))
+                cursor.execute("DELETE FROM EmployeeFaceReferences WHERE employee_id = %s", (employee_id,))
                 conn.commit()
+                employee_cache.invalidate(str(employee_id))
+                face_template_cache.invalidate(str(employee_id))
 
                 return jsonify({'message': 'Photo uploaded successfully', 'photo_path': photo_path})
 
-    except Exception as e:
-        print(f"Error uploading photo: {e}")
+    except CompreFaceBusy:
+        raise
+    except Exception:
+        api_log.exception("Error uploading photo")
         return jsonify({'error': 'Failed to upload photo'}), 500
 
+def upload_buffers(name):
+    """Every upload sent under `name`, opened once each and released at teardown"""
+    buffers = g.setdefault('upload_buffers', {})
+    result = []
+    for index, storage in enumerate(request.files.getlist(name)):
+        key = f"{name}[{index}]"
+        if key not in buffers:
+            buffers[key] = UploadBuffer(storage)
+        result.append(buffers[key])
+    return result
+
+
+@app.route('/api/employees/<int:employee_id>/face-references', methods=['POST'])
+@rate_limited
+def enroll_face_references(employee_id):
+    """
+    Enroll several reference photos for an employee, replacing any earlier ones
+    Form data:
+        photos: 1 to FACE_REFERENCES_MAX images, one face each
+        mode: mean or ranked (default: FACE_TEMPLATE_MODE)
+    The reference closest to the fused template becomes the employee's photo_url.
+    """
+    uploads = [upload for upload in upload_buffers('photos') if upload.size]
+    mode = request.form.get('mode', FACE_TEMPLATE_MODE)
+    if not uploads:
+        return jsonify({'error': 'Missing photos'}), 400
+    if len(uploads) > FACE_REFERENCES_MAX:
+        return jsonify({'error': f'At most {FACE_REFERENCES_MAX} reference photos'}), 400
+    if mode not in ('mean', 'ranked'):
+        return jsonify({'error': 'mode must be mean or ranked'}), 400
+
+    staged = []
+    try:
+        with get_db_connection() as conn:
+            with get_db_cursor(conn) as cursor:
+                cursor.execute("SELECT employee_id FROM Employees WHERE employee_id = %s", (employee_id,))
+                if cursor.fetchone() is None:
+                    return jsonify({'error': 'Employee ID does not exist'}), 404
+
+                embeddings, errors = [], []
+                for index, upload in enumerate(uploads):
+                    faces = detect_face_embeddings(upload.payload())
+                    if faces is None:
+                        errors.append({'index': index, 'error': 'Face detection service failed'})
+                    elif len(faces) != 1:
+                        errors.append({'index': index, 'error': f'Expected one face, found {len(faces)}'})
+                    else:
+                        embeddings.append(normalize_embedding(faces[0]['embedding']))
+                if errors:
+                    return jsonify({'error': 'Some photos cannot be used as references', 'errors': errors}), 400
+
+                template, ranked, closeness = fuse_face_template(embeddings, mode)
+
+                # Written beside the current files; moved into place once the rows are committed
+                references = []
+                for rank, index in enumerate(ranked):
+                    filename = secure_filename(f"employee_{employee_id}_ref{rank}.jpg")
+                    photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                    uploads[index].save(f"{photo_path}.pending")
+                    staged.append((f"{photo_path}.pending", photo_path))
+                    references.append((employee_id, rank, photo_path, json.dumps(embeddings[index]),
+                                       closeness[index]))
+
+                conn.start_transaction()
+                cursor.execute("DELETE FROM EmployeeFaceReferences WHERE employee_id = %s", (employee_id,))
+                cursor.executemany("""
+                    INSERT INTO EmployeeFaceReferences
+                      (employee_id, reference_rank, photo_path, embedding, template_similarity)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, references)
+                cursor.execute("""
+                    REPLACE INTO EmployeeFaceTemplates (employee_id, mode, template, reference_count, updated_at)
+                    VALUES (%s, %s, %s, %s, NOW())
+                """, (employee_id, mode, json.dumps(template), len(references)))
+                cursor.execute("UPDATE Employees SET photo_url = %s WHERE employee_id = %s",
+                               (references[0][2], employee_id))
+                conn.commit()
+                for pending, photo_path in staged:
+                    os.replace(pending, photo_path)
+                staged = []
+                employee_cache.invalidate(str(employee_id))
+                face_template_cache.invalidate(str(employee_id))
+
+        # Files from an earlier, larger reference set
+        for rank in range(len(references), FACE_REFERENCES_MAX):
+            stale = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(f"employee_{employee_id}_ref{rank}.jpg"))
+            if os.path.exists(stale):
+                os.remove(stale)
+
+        return jsonify({
+            'message': 'Reference photos enrolled successfully',
+            'mode': mode,
+            'references': len(references),
+            'template_size': len(template),
+            'photo_path': references[0][2],
+            'template_similarity': [round(closeness[i], 4) for i in range(len(embeddings))]
+        }), 201
+
+    except CompreFaceBusy:
+        raise
+    except Exception:
+        api_log.exception("Error enrolling reference photos")
+        return jsonify({'error': 'Failed to enroll reference photos'}), 500
+    finally:
+        for pending, _ in staged:
+            if os.path.exists(pending):
+                os.remove(pending)
+
 @app.route('/check_in', methods=['POST'])
+@request_class(CRITICAL)
+@rate_limited
 def compare_photo():
     if 'photo' not in request.files or 'employee_id' not in request.form:
         return jsonify({'error': 'Missing photo or employee_id'}), 400
@@ -401,135 +3337,121 @@ def compare_photo():
     
     try:
         with get_db_connection() as conn:
-            with get_db_cursor(conn) as cursor:
-                # Check if employee exists
-                cursor.execute("SELECT photo_url, name FROM Employees WHERE employee_id = %s", (employee_id,))
-                result = cursor.fetchone()
-                if result is None:
-                    return jsonify({'error': 'Employee not found'}), 404
-                
-                stored_photo_path = result['photo_url']
-                emp_name = result['name']
-                
-                if not os.path.exists(stored_photo_path):
-                    return jsonify({'error': 'Stored photo not found'}), 404
-                
-                # Check face in uploaded image
-                photo.stream.seek(0)
-                if not is_face_detected(photo.stream):
-                    return jsonify({'error': 'No face detected in uploaded photo'}), 400
-                photo.stream.seek(0)
-                
-                # Compare photos
-                with open(stored_photo_path, 'rb') as stored_image:
-                    files = {
-                        'source_image': ('stored.jpg', stored_image, 'image/jpeg'),
-                        'target_image': ('uploaded.jpg', photo, 'image/jpeg')
-                    }
-                    headers = {'x-api-key': COMPRE_FACE_API_KEY}
-                    response = requests.post(COMPRE_FACE_URL, files=files, headers=headers)
-                
-                if response.status_code != 200:
-                    return jsonify({'error': 'CompreFace verification failed', 'details': response.text}), 500
-                
-                result = response.json()
-                similarity = result['result'][0]['face_matches'][0]['similarity']
-                is_match = similarity >= 0.9
-                
-                response_data = {
-                    'match': is_match,
-                    'similarity': similarity,
-                    'face_verification': 'success' if is_match else 'failed',
-                    'location_check': None,
-                    'time_check': None,
-                    'attendance_recorded': False,
-                    'message': None
-                }
-                
-                if not is_match:
-                    response_data['message'] = 'Face verification failed - attendance not recorded'
-                    return jsonify(response_data)
-                
-                # Location validation
-                if not user_lat or not user_lon:
-                    response_data['location_check'] = 'missing_coordinates'
-                    response_data['message'] = 'Location coordinates missing - attendance not recorded'
-                    return jsonify(response_data)
-                
-                try:
-                    user_lat = float(user_lat)
-                    user_lon = float(user_lon)
-                except (ValueError, TypeError):
-                    response_data['location_check'] = 'invalid_coordinates'
-                    response_data['message'] = 'Invalid location coordinates - attendance not recorded'
-                    return jsonify(response_data)
-                
-                store_location = find_nearest_store(user_lat, user_lon)
-                
-                if not store_location:
-                    response_data['location_check'] = 'too_far_from_store'
-                    response_data['message'] = 'You are not within 500m of any store location - attendance not recorded'
-                    return jsonify(response_data)
-                
-                response_data['location_check'] = 'success'
-                response_data['store_location'] = store_location
-                
-                # Time validation
-                if timestamp:
-                    try:
-                        check_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                    except:
-                        check_time = datetime.now()
-                else:
-                    check_time = datetime.now()
-                
-                is_on_time = check_time.time() <= time(9, 45)
-                
-                # Check for approved late arrival request if after 9 AM
-                has_approved_late_request = False
-                if not is_on_time:
-                    cursor.execute("""
-                        SELECT 1 FROM LateArrivalRequests 
-                        WHERE employee_id = %s 
-                        AND DATE(requested_at) = %s 
-                        AND status = 'Accepted'
-                    """, (employee_id, check_time.date()))
-                    has_approved_late_request = bool(cursor.fetchone())
-                
-                if is_on_time:
-                    attendance_status = 'Present'
-                    response_data['time_check'] = 'on_time'
-                elif has_approved_late_request:
-                    attendance_status = 'Late'
-                    response_data['time_check'] = 'late_with_approval'
-                else:
-                    response_data['time_check'] = 'late_without_approval'
-                    response_data['message'] = 'Check-in after 9:40 AM without approved late arrival request - attendance not recorded'
-                    return jsonify(response_data)
-                
-                # Record attendance
-                cursor.execute("""
-                    INSERT INTO Attendance (employee_id, current_location, date, status, check_in, check_out)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                    status = VALUES(status),
-                    check_in = VALUES(check_in),
-                    current_location = VALUES(current_location)
-                """, (employee_id, store_location, check_time.date(), attendance_status, check_time.time(), None))
-                
-                conn.commit()
-                
-                response_data.update({
-                    'attendance_recorded': True,
-                    'attendance_status': attendance_status,
-                    'check_in_time': check_time.strftime('%H:%M:%S'),
-                    'message': f'Attendance successfully recorded as {attendance_status} at {store_location}'
-                })
-                
+            # Check if employee exists
+            result = lookup_employee(conn, employee_id)
+            if result is None:
+                return jsonify({'error': 'Employee not found'}), 404
+            
+            stored_photo_path = result['photo_url']
+            emp_name = result['name']
+            
+            if not os.path.exists(stored_photo_path):
+                return jsonify({'error': 'Stored photo not found'}), 404
+            
+            # Detect the face and compare it with the employee's references
+            face = check_employee_face(conn, result, upload_buffer('photo'))
+            if not face['face_detected']:
+                return jsonify({'error': 'No face detected in uploaded photo'}), 400
+            
+            if face['error'] is not None:
+                return jsonify({'error': 'CompreFace verification failed', 'details': face['error']}), 500
+            
+            similarity = face['similarity']
+            is_match = face['match']
+            
+            response_data = {
+                'match': is_match,
+                'similarity': similarity,
+                'face_verification': 'success' if is_match else 'failed',
+                'location_check': None,
+                'time_check': None,
+                'attendance_recorded': False,
+                'message': None
+            }
+            
+            if not is_match:
+                response_data['message'] = 'Face verification failed - attendance not recorded'
+                return jsonify(response_data)
+            
+            # Location validation
+            if not user_lat or not user_lon:
+                response_data['location_check'] = 'missing_coordinates'
+                response_data['message'] = 'Location coordinates missing - attendance not recorded'
+                return jsonify(response_data)
+            
+            try:
+                user_lat = float(user_lat)
+                user_lon = float(user_lon)
+            except (ValueError, TypeError):
+                response_data['location_check'] = 'invalid_coordinates'
+                response_data['message'] = 'Invalid location coordinates - attendance not recorded'
                 return jsonify(response_data)
+            
+            store_location = find_nearest_store(user_lat, user_lon)
+            
+            if not store_location:
+                response_data['location_check'] = 'too_far_from_store'
+                response_data['message'] = 'You are not within range of any store location - attendance not recorded'
+                return jsonify(response_data)
+            
+            response_data['location_check'] = 'success'
+            response_data['store_location'] = store_location
+            
+            # Time validation, against the store's own timezone and cutoff
+            store_policy = store_policies.get(store_location)
+            check_time = store_local_time(store_policy, timestamp)
+            cutoff = store_policy['checkin_cutoff']
+            
+            is_on_time = check_time.time() <= cutoff
+            
+            # Check for approved late arrival request if after 9 AM
+            has_approved_late_request = False
+            if not is_on_time:
+                late_request = fetch_hot_query_one(
+                    conn, 'late_request_for_day', (employee_id, *day_bounds(check_time.date()))
+                )
+                has_approved_late_request = bool(late_request and late_request['status'] == 'Accepted')
+            
+            if is_on_time:
+                attendance_status = 'Present'
+                response_data['time_check'] = 'on_time'
+            elif has_approved_late_request:
+                attendance_status = 'Late'
+                response_data['time_check'] = 'late_with_approval'
+            else:
+                response_data['time_check'] = 'late_without_approval'
+                response_data['message'] = f"Check-in after {cutoff.strftime('%I:%M %p')} without approved late arrival request - attendance not recorded"
+                return jsonify(response_data)
+            
+            # Record attendance
+            execute_hot_query(conn, 'upsert_attendance', (
+                employee_id, store_location, check_time.date(), attendance_status, check_time.time(), None
+            ))
+            
+            conn.commit()
+            headcounts.record(check_time.date(), employee_id, store_location, attendance_status)
+            
+            publish_event('attendance.check_in', {
+                'employee_id': employee_id,
+                'name': emp_name,
+                'date': check_time.date().isoformat(),
+                'status': attendance_status,
+                'check_in': check_time.strftime('%H:%M:%S')
+            }, store=store_location)
 
-    except Exception as e:
-        print(f"Error during check-in: {e}")
+            response_data.update({
+                'attendance_recorded': True,
+                'attendance_status': attendance_status,
+                'check_in_time': check_time.strftime('%H:%M:%S'),
+                'message': f'Attendance successfully recorded as {attendance_status} at {store_location}'
+            })
+            
+            return jsonify(response_data)
+
+    except CompreFaceBusy:
+        raise
+    except Exception:
+        api_log.exception("Error during check-in")
         return jsonify({'error': 'Internal server error during check-in'}), 500
 
 @app.route('/api/create-account', methods=['POST'])
@@ -555,8 +3477,8 @@ def create_account():
                 
                 return jsonify({'success': True, 'message': 'Account created successfully'}), 201
 
-    except Exception as e:
-        print(f"Error creating account: {e}")
+    except Exception:
+        api_log.exception("Error creating account")
         return jsonify({'success': False, 'message': 'Internal server error'}), 500
 
 @app.route('/api/login', methods=['POST'])
@@ -583,77 +3505,51 @@ def login():
                 else:
                     return jsonify({'success': False, 'message': 'Invalid username or password'}), 401
                     
-    except Exception as e:
-        print(f"Error during login: {e}")
+    except Exception:
+        api_log.exception("Error during login")
         return jsonify({'success': False, 'message': 'Internal server error'}), 500
 
 @app.route('/api/attendance', methods=['GET'])
+@request_class(DEFERRABLE)
+@read_replica
 def get_attendance():
     try:
         # Get date from query parameter, default to today
         date_param = request.args.get('date')
+        try:
+            query_date = datetime.strptime(date_param, '%Y-%m-%d').date() if date_param else date.today()
+        except ValueError:
+            return jsonify({'error': 'Invalid date. Use YYYY-MM-DD'}), 400
         
         with get_db_connection() as conn:
             with get_db_cursor(conn) as cursor:
-                if date_param:
-                    # Use the provided date - directly in query
-                    query = f"""
-                        SELECT 
-                            a.attendance_id,
-                            a.employee_id,
-                            e.name AS emp_name,
-                            a.current_location,
-                            DATE(a.date) as date,
-                            a.status,
-                            CASE WHEN a.check_in = 'RUNE' THEN NULL ELSE TIME_FORMAT(a.check_in, '%H:%i:%s') END as check_in,
-                            CASE WHEN a.check_out = 'RUNE' THEN NULL ELSE TIME_FORMAT(a.check_out, '%H:%i:%s') END as check_out
-                        FROM Attendance a
-                        JOIN Employees e ON a.employee_id = e.employee_id
-                        WHERE DATE(a.date) = '{date_param}'
-                        ORDER BY a.date DESC
-                        LIMIT 50
-                    """
-                    cursor.execute(query)
-                else:
-                    # Default to current date
-                    cursor.execute("""
-                        SELECT 
-                            a.attendance_id,
-                            a.employee_id,
-                            e.name AS emp_name,
-                            a.current_location,
-                            DATE(a.date) as date,
-                            a.status,
-                            CASE WHEN a.check_in = 'RUNE' THEN NULL ELSE TIME_FORMAT(a.check_in, '%H:%i:%s') END as check_in,
-                            CASE WHEN a.check_out = 'RUNE' THEN NULL ELSE TIME_FORMAT(a.check_out, '%H:%i:%s') END as check_out
-                        FROM Attendance a
-                        JOIN Employees e ON a.employee_id = e.employee_id
-                        WHERE DATE(a.date) = CURDATE()
-                        ORDER BY a.date DESC
-                        LIMIT 50
-                    """)
-               
-                attendance_data = []
-                for row in cursor:
-                    processed_row = {
-                        'attendance_id': int(row['attendance_id']),
-                        'employee_id': int(row['employee_id']),
-                        'emp_name': str(row['emp_name']),
-                        'current_location': str(row['current_location']) if row['current_location'] else None,
-                        'date': str(row['date']) if row['date'] else None,
-                        'status': str(row['status']),
-                        'check_in': str(row['check_in']) if row['check_in'] else None,
-                        'check_out': str(row['check_out']) if row['check_out'] else None
-                    }
-                    attendance_data.append(processed_row)
-               
-                return jsonify(attendance_data)
+                # Compare the column itself (not DATE(a.date)) so the date index is usable
+                cursor.execute(f"""
+                    SELECT 
+                        a.attendance_id,
+                        a.employee_id,
+                        e.name AS emp_name,
+                        a.current_location,
+                        DATE(a.date) as date,
+                        a.status,
+                        a.version,
+                        CASE WHEN a.check_in = 'RUNE' THEN NULL ELSE TIME_FORMAT(a.check_in, '%%H:%%i:%%s') END as check_in,
+                        CASE WHEN a.check_out = 'RUNE' THEN NULL ELSE TIME_FORMAT(a.check_out, '%%H:%%i:%%s') END as check_out
+                    FROM {attendance_table(query_date)} a
+                    JOIN Employees e ON a.employee_id = e.employee_id
+                    WHERE a.date = %s
+                    ORDER BY a.date DESC
+                    LIMIT 50
+                """, (query_date,))
+
+                return jsonify(cursor.fetchall())
                 
     except Exception as e:
-        print(f"Error fetching attendance data: {e}")
+        api_log.exception("Error fetching attendance data")
         return jsonify({'error': 'Failed to fetch attendance data', 'details': str(e)}), 500
     
 @app.route('/api/late-arrival-requests', methods=['GET'])
+@request_class(DEFERRABLE)
 def get_late_arrival_requests():
     try:
         with get_db_connection() as conn:
@@ -673,9 +3569,9 @@ def get_late_arrival_requests():
                         r.status
                     FROM LateArrivalRequests r
                     JOIN Employees e ON r.employee_id = e.employee_id
-                    WHERE DATE(r.requested_at) = %s
+                    WHERE r.requested_at >= %s AND r.requested_at < %s
                     ORDER BY r.requested_at DESC
-                """, (today,))
+                """, day_bounds(today))
 
                 requests = []
                 for row in cursor:
@@ -692,55 +3588,215 @@ def get_late_arrival_requests():
 
                 return jsonify(requests), 200
 
-    except Exception as e:
-        print(f"Error fetching late arrival requests: {e}")
+    except Exception:
+        api_log.exception("Error fetching late arrival requests")
         return jsonify({'error': 'Failed to fetch late arrival requests'}), 500
 
+@app.route('/api/events/stream', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events feed of late arrival requests and check-in/check-out events.
+    Query params:
+        store: Only send events for this store (default: all stores)
+    Reconnecting clients resume from the Last-Event-ID header (or last_event_id param).
+    """
+    store = request.args.get('store') or None
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    try:
+        last_id = int(last_event_id) if last_event_id else event_bus.latest_id()
+    except ValueError:
+        return jsonify({'error': 'Invalid last event id'}), 400
+
+    def generate():
+        nonlocal last_id
+        yield "retry: 5000\n\n"
+
+        # Events older than the replay buffer are lost; tell the client to re-fetch
+        if last_id < event_bus.oldest_id() - 1:
+            yield "event: resync\ndata: {}\n\n"
+
+        while True:
+            events, newest_id = event_bus.wait_for_events(last_id, store, timeout=EVENT_HEARTBEAT_SECONDS)
+            if newest_id == last_id:
+                # Nothing happened; keeps proxies from closing the idle connection
+                yield ": keep-alive\n\n"
+                continue
+            last_id = newest_id
+            for event in events:
+                payload = json.dumps({**event['data'], 'store': event['store']}, default=str)
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+LATE_REQUEST_DECISIONS = {'Accepted': 'Late', 'Rejected': 'Absent'}
+LATE_REQUEST_BATCH_MAX = 500
+
+
+def decide_late_requests(conn, cursor, decisions):
+    """
+    Apply {request_id: 'Accepted' | 'Rejected'} in one transaction: one
+    locking read, one status UPDATE and one set-based attendance upsert.
+    Accepted requests record a Late check-in at the requested time, rejected
+    ones an Absent day; an existing attendance row is only replaced when it
+    is an Absent mark. Only Pending requests are decided; the rest come back
+    as already_decided with their current status. Returns one outcome per
+    request id, in input order.
+    """
+    ids = list(decisions)
+    placeholders = ', '.join(['%s'] * len(ids))
+
+    conn.start_transaction()
+    cursor.execute(f"""
+        SELECT r.request_id, r.employee_id, r.requested_at, r.status, e.name, e.permanent_location
+        FROM LateArrivalRequests r
+        JOIN Employees e ON r.employee_id = e.employee_id
+        WHERE r.request_id IN ({placeholders})
+        FOR UPDATE
+    """, ids)
+    found = {row['request_id']: row for row in cursor.fetchall()}
+    decided = [request_id for request_id in ids
+               if request_id in found and found[request_id]['status'] == 'Pending']
+
+    if decided:
+        placeholders = ', '.join(['%s'] * len(decided))
+        cases = ' '.join(['WHEN %s THEN %s'] * len(decided))
+        cursor.execute(f"""
+            UPDATE LateArrivalRequests
+            SET status = CASE request_id {cases} END
+            WHERE request_id IN ({placeholders}) AND status = 'Pending'
+        """, [v for request_id in decided for v in (request_id, decisions[request_id])] + decided)
+
+        # Assignments run left to right, so status is updated last. Attendance
+        # columns are qualified: r.status would make a bare `status` ambiguous
+        cursor.execute(f"""
+            INSERT INTO Attendance (employee_id, current_location, date, status, check_in, check_out)
+            SELECT r.employee_id, e.permanent_location, DATE(r.requested_at),
+                   IF(r.status = 'Accepted', 'Late', 'Absent'),
+                   IF(r.status = 'Accepted', TIME(r.requested_at), NULL),
+                   NULL
+            FROM LateArrivalRequests r
+            JOIN Employees e ON r.employee_id = e.employee_id
+            WHERE r.request_id IN ({placeholders})
+            ON DUPLICATE KEY UPDATE
+                Attendance.version = IF(Attendance.status = 'Absent', Attendance.version + 1, Attendance.version),
+                Attendance.check_in = IF(Attendance.status = 'Absent', VALUES(check_in), Attendance.check_in),
+                Attendance.current_location = IF(Attendance.status = 'Absent', VALUES(current_location),
+                                                 Attendance.current_location),
+                Attendance.status = IF(Attendance.status = 'Absent', VALUES(status), Attendance.status)
+        """, decided)
+    conn.commit()
+
+    if decided:
+        pairs = {(found[r]['employee_id'], found[r]['requested_at'].date()) for r in decided}
+        where = ' OR '.join(['(a.employee_id = %s AND a.date = %s)'] * len(pairs))
+        for day, employee_id, store, status, checked_out in _load_headcount_rows(
+                cursor, where, tuple(v for pair in pairs for v in pair)):
+            headcounts.record(day, employee_id, store, status, checked_out)
+
+    outcomes = []
+    for request_id in ids:
+        row = found.get(request_id)
+        if row is None:
+            outcomes.append({'request_id': request_id, 'outcome': 'not_found'})
+            continue
+        if row['status'] != 'Pending':
+            outcomes.append({'request_id': request_id, 'outcome': 'already_decided', 'status': row['status']})
+            continue
+        new_status = decisions[request_id]
+        publish_event('late_request.status', {
+            'request_id': request_id,
+            'employee_id': row['employee_id'],
+            'name': row['name'],
+            'status': new_status,
+            'attendance_status': LATE_REQUEST_DECISIONS[new_status]
+        }, store=row['permanent_location'])
+        outcomes.append({
+            'request_id': request_id,
+            'outcome': new_status.lower(),
+            'attendance_status': LATE_REQUEST_DECISIONS[new_status]
+        })
+    return outcomes
+
+
 @app.route('/api/late-arrival-requests/<int:request_id>/status', methods=['PUT'])
 def update_late_arrival_status(request_id):
     new_status = request.json.get('status')
-    if new_status not in ['Accepted', 'Rejected']:
+    if new_status not in LATE_REQUEST_DECISIONS:
         return jsonify({'error': 'Invalid status'}), 400
     
-    try:
-        with get_db_connection() as conn:
-            with get_db_cursor(conn) as cursor:
-                # Get late request details
-                cursor.execute("""
-                    SELECT r.employee_id, r.requested_at, e.name, e.permanent_location
-                    FROM LateArrivalRequests r
-                    JOIN Employees e ON r.employee_id = e.employee_id
-                    WHERE r.request_id = %s
-                """, (request_id,))
-                
-                row = cursor.fetchone()
-                if not row:
+    try:
+        with get_db_connection() as conn:
+            with get_db_cursor(conn) as cursor:
+                outcome = decide_late_requests(conn, cursor, {request_id: new_status})[0]
+                if outcome['outcome'] == 'not_found':
                     return jsonify({'error': 'Late arrival request not found'}), 404
-                
-                employee_id = row['employee_id']
-                current_location = row['permanent_location']
-                requested_at = row['requested_at']
-                
-                attendance_status = 'Late' if new_status == 'Accepted' else 'Absent'
-                check_in = requested_at if new_status == 'Accepted' else None
-                
-                # Insert attendance record
-                cursor.execute("""
-                    INSERT INTO Attendance (employee_id, current_location, date, status, check_in, check_out)
-                    VALUES (%s, %s, CURDATE(), %s, %s, %s)
-                """, (employee_id, current_location, attendance_status, check_in, None))
-                
-                # Update request status
-                cursor.execute("UPDATE LateArrivalRequests SET status = %s WHERE request_id = %s", (new_status, request_id))
-                
-                conn.commit()
+                if outcome['outcome'] == 'already_decided':
+                    return jsonify({'error': f"Late arrival request already {outcome['status'].lower()}",
+                                    'status': outcome['status']}), 409
+
                 return jsonify({'message': 'Status updated and attendance recorded'}), 200
                 
-    except Exception as e:
-        print(f"Error updating late arrival status: {e}")
+    except Exception:
+        api_log.exception("Error updating late arrival status")
         return jsonify({'error': 'Failed to process request'}), 500
 
 
+@app.route('/api/late-arrival-requests/status', methods=['PUT'])
+def bulk_update_late_arrival_status():
+    """
+    Accept or reject many late arrival requests at once
+    Body:
+        {"decisions": [{"request_id": 12, "status": "Accepted"}, ...]}
+    Returns one outcome per request id: accepted, rejected, already_decided
+    (with the current status) or not_found.
+    Invalid bodies are rejected whole.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('decisions')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'decisions must be a non-empty list'}), 400
+    if len(items) > LATE_REQUEST_BATCH_MAX:
+        return jsonify({'error': f'At most {LATE_REQUEST_BATCH_MAX} decisions per request'}), 400
+
+    decisions, errors = {}, []
+    for index, item in enumerate(items):
+        request_id = item.get('request_id') if isinstance(item, dict) else None
+        new_status = item.get('status') if isinstance(item, dict) else None
+        if not isinstance(request_id, int) or isinstance(request_id, bool):
+            errors.append({'index': index, 'error': 'request_id must be an integer'})
+        elif new_status not in LATE_REQUEST_DECISIONS:
+            errors.append({'index': index, 'error': 'status must be Accepted or Rejected'})
+        elif request_id in decisions:
+            errors.append({'index': index, 'error': 'request_id appears more than once'})
+        else:
+            decisions[request_id] = new_status
+    if errors:
+        return jsonify({'error': 'Invalid decisions; nothing was applied', 'errors': errors}), 400
+
+    try:
+        with get_db_connection() as conn:
+            with get_db_cursor(conn) as cursor:
+                outcomes = decide_late_requests(conn, cursor, decisions)
+
+        return jsonify({
+            'message': 'Decisions applied',
+            'accepted': sum(o['outcome'] == 'accepted' for o in outcomes),
+            'rejected': sum(o['outcome'] == 'rejected' for o in outcomes),
+            'already_decided': sum(o['outcome'] == 'already_decided' for o in outcomes),
+            'not_found': sum(o['outcome'] == 'not_found' for o in outcomes),
+            'results': outcomes
+        }), 200
+
+    except Exception:
+        api_log.exception("Error applying late arrival decisions")
+        return jsonify({'error': 'Failed to process requests'}), 500
+
+
 @app.route('/api/employees', methods=['POST'])
 def add_employee():
     try:
@@ -782,10 +3838,10 @@ def add_employee():
         }), 201
         
     except mysql.connector.Error as db_error:
-        app.logger.exception("Database error in add_employee")
+        api_log.exception("Database error in add_employee")
         return jsonify({"success": False, "message": f"Database error: {str(db_error)}"}), 500
     except Exception as e:
-        app.logger.exception("Add employee failed")
+        api_log.exception("Add employee failed")
         return jsonify({"success": False, "message": str(e)}), 500
 
 @app.route('/api/employees/<int:employee_id>', methods=['DELETE'])
@@ -799,16 +3855,23 @@ def remove_employee(employee_id):
                     return jsonify({'success': False, 'message': 'Employee not found'}), 404
                 
                 # Delete employee
+                cursor.execute("DELETE FROM EmployeeFaceTemplates WHERE employee_id = %s", (employee_id,))
+                cursor.execute("DELETE FROM EmployeeFaceReferences WHERE employee_id = %s", (employee_id,))
                 cursor.execute("DELETE FROM Employees WHERE employee_id = %s", (employee_id,))
                 conn.commit()
+                employee_cache.invalidate(str(employee_id))
+                face_template_cache.invalidate(str(employee_id))
+                for day in headcounts.tracked_days():
+                    headcounts.record(day, employee_id, None, None)
                 
                 return jsonify({'success': True, 'message': 'Employee removed successfully'}), 200
                 
-    except Exception as e:
-        print(f"Error removing employee: {e}")
+    except Exception:
+        api_log.exception("Error removing employee")
         return jsonify({'success': False, 'message': 'Internal server error'}), 500
 
 @app.route('/api/employee-status', methods=['POST'])
+@request_class(CRITICAL)
 def get_employee_status():
     """Determine what action the employee should see"""
     data = request.get_json()
@@ -819,111 +3882,110 @@ def get_employee_status():
     
     try:
         with get_db_connection() as conn:
-            with get_db_cursor(conn) as cursor:
-                # Check if employee exists
-                cursor.execute("SELECT employee_id, name FROM Employees WHERE employee_id = %s", (employee_id,))
-                employee = cursor.fetchone()
-                
-                if not employee:
-                    return jsonify({'success': False, 'error': 'Employee not found', 'action': None}), 404
-                
-                current_time = datetime.now()
-                today = current_time.date()
-                
-                # Check existing attendance
-                cursor.execute("""
-                    SELECT status, check_in, check_out 
-                    FROM Attendance 
-                    WHERE employee_id = %s AND date = %s
-                """, (employee_id, today))
-                
-                attendance_record = cursor.fetchone()
+            # Check if employee exists
+            employee = lookup_employee(conn, employee_id)
+            
+            if not employee:
+                return jsonify({'success': False, 'error': 'Employee not found', 'action': None}), 404
+            
+            store_policy = store_policies.get(employee['permanent_location'])
+            current_time = store_local_time(store_policy)
+            today = current_time.date()
+            
+            # Check existing attendance
+            attendance_record = fetch_hot_query_one(conn, 'attendance_for_day', (employee_id, today))
+            
+            if attendance_record and attendance_record['status'] == 'On Leave':
+                return jsonify({
+                    'success': True,
+                    'employee_name': employee['name'],
+                    'action': 'on_leave',
+                    'current_status': attendance_record['status'],
+                    'message': f"Hi {employee['name']}, you are on approved leave today."
+                })
+
+            if attendance_record and (attendance_record['check_in'] is not None
+                                      or attendance_record['check_out'] is not None):
+                if is_active_shift(attendance_record):
+                    return jsonify({
+                        'success': True,
+                        'employee_name': employee['name'],
+                        'action': 'check_out',
+                        'current_status': attendance_record['status'],
+                        'check_in_time': str(attendance_record['check_in']),
+                        'message': f"Welcome back {employee['name']}! You're ready to check out."
+                    })
+                else:
+                    return jsonify({
+                        'success': True,
+                        'employee_name': employee['name'],
+                        'action': 'already_completed',
+                        'current_status': attendance_record['status'],
+                        'check_in_time': str(attendance_record['check_in']),
+                        'check_out_time': str(attendance_record['check_out']),
+                        'message': f"Hi {employee['name']}, you've already completed your attendance for today."
+                    })
+            
+            # No attendance - check time and late requests
+            current_time_only = current_time.time()
+            cutoff_time = store_policy['checkin_cutoff']
+            
+            if current_time_only <= cutoff_time:
+                return jsonify({
+                    'success': True,
+                    'employee_name': employee['name'],
+                    'action': 'check_in',
+                    'message': f"Good morning {employee['name']}! Ready to check in?"
+                })
+            else:
+                # Check late requests
+                late_request = fetch_hot_query_one(
+                    conn, 'late_request_for_day', (employee_id, *day_bounds(today))
+                )
                 
-                if attendance_record:
-                    if attendance_record['check_out'] is None:
+                if late_request:
+                    status = late_request['status']
+                    if status == 'Pending':
                         return jsonify({
                             'success': True,
                             'employee_name': employee['name'],
-                            'action': 'check_out',
-                            'current_status': attendance_record['status'],
-                            'check_in_time': str(attendance_record['check_in']),
-                            'message': f"Welcome back {employee['name']}! You're ready to check out."
+                            'action': 'wait_for_approval',
+                            'request_id': late_request['request_id'],
+                            'requested_at': str(late_request['requested_at']),
+                            'message': f"Hi {employee['name']}, your late arrival request is pending approval."
                         })
-                    else:
+                    elif status == 'Accepted':
                         return jsonify({
                             'success': True,
                             'employee_name': employee['name'],
-                            'action': 'already_completed',
-                            'current_status': attendance_record['status'],
-                            'check_in_time': str(attendance_record['check_in']),
-                            'check_out_time': str(attendance_record['check_out']),
-                            'message': f"Hi {employee['name']}, you've already completed your attendance for today."
+                            'action': 'check_in',
+                            'late_approval': True,
+                            'message': f"Hi {employee['name']}, your late arrival was approved. Ready to check in?"
                         })
-                
-                # No attendance - check time and late requests
-                current_time_only = current_time.time()
-                cutoff_time = time(9, 45)
-                
-                if current_time_only <= cutoff_time:
+                    elif status == 'Rejected':
+                        return jsonify({
+                            'success': True,
+                            'employee_name': employee['name'],
+                            'action': 'request_rejected',
+                            'message': f"Hi {employee['name']}, your late arrival request was rejected. Please contact your supervisor."
+                        })
+                else:
                     return jsonify({
                         'success': True,
                         'employee_name': employee['name'],
-                        'action': 'check_in',
-                        'message': f"Good morning {employee['name']}! Ready to check in?"
+                        'action': 'late_arrival_request',
+                        'current_time': current_time.strftime('%H:%M'),
+                        'message': f"Hi {employee['name']}, it's past {cutoff_time.strftime('%I:%M %p')}. You need to submit a late arrival request."
                     })
-                else:
-                    # Check late requests
-                    cursor.execute("""
-                        SELECT request_id, status, requested_at 
-                        FROM LateArrivalRequests 
-                        WHERE employee_id = %s AND DATE(requested_at) = %s
-                        ORDER BY requested_at DESC 
-                        LIMIT 1
-                    """, (employee_id, today))
-                    
-                    late_request = cursor.fetchone()
                     
-                    if late_request:
-                        status = late_request['status']
-                        if status == 'Pending':
-                            return jsonify({
-                                'success': True,
-                                'employee_name': employee['name'],
-                                'action': 'wait_for_approval',
-                                'request_id': late_request['request_id'],
-                                'requested_at': str(late_request['requested_at']),
-                                'message': f"Hi {employee['name']}, your late arrival request is pending approval."
-                            })
-                        elif status == 'Accepted':
-                            return jsonify({
-                                'success': True,
-                                'employee_name': employee['name'],
-                                'action': 'check_in',
-                                'late_approval': True,
-                                'message': f"Hi {employee['name']}, your late arrival was approved. Ready to check in?"
-                            })
-                        elif status == 'Rejected':
-                            return jsonify({
-                                'success': True,
-                                'employee_name': employee['name'],
-                                'action': 'request_rejected',
-                                'message': f"Hi {employee['name']}, your late arrival request was rejected. Please contact your supervisor."
-                            })
-                    else:
-                        return jsonify({
-                            'success': True,
-                            'employee_name': employee['name'],
-                            'action': 'late_arrival_request',
-                            'current_time': current_time.strftime('%H:%M'),
-                            'message': f"Hi {employee['name']}, it's past 9:30 AM. You need to submit a late arrival request."
-                        })
-                        
-    except Exception as e:
-        print(f"Error in employee status check: {e}")
+    except Exception:
+        api_log.exception("Error in employee status check")
         return jsonify({'success': False, 'error': 'Internal server error', 'action': None}), 500
 
 
 @app.route('/api/submit-late-request', methods=['POST'])
+@request_class(CRITICAL)
+@rate_limited
 def submit_late_request():
     """Submit a late arrival request for an employee with face and location verification"""
     if 'photo' not in request.files or 'employee_id' not in request.form:
@@ -945,38 +4007,27 @@ def submit_late_request():
         with get_db_connection() as conn:
             with get_db_cursor(conn) as cursor:
                 # Check if employee exists
-                cursor.execute("SELECT photo_url, name FROM Employees WHERE employee_id = %s", (employee_id,))
-                result = cursor.fetchone()
+                result = lookup_employee(conn, employee_id)
                 if result is None:
                     return jsonify({'error': 'Employee not found'}), 404
                 
                 stored_photo_path = result['photo_url']
                 emp_name = result['name']
+                emp_branch = result['permanent_location']
                 
                 if not os.path.exists(stored_photo_path):
                     return jsonify({'error': 'Stored photo not found'}), 404
                 
-                # Check face in uploaded image
-                photo.stream.seek(0)
-                if not is_face_detected(photo.stream):
+                # Detect the face and compare it with the employee's references
+                face = check_employee_face(conn, result, upload_buffer('photo'))
+                if not face['face_detected']:
                     return jsonify({'error': 'No face detected in uploaded photo'}), 400
-                photo.stream.seek(0)
                 
-                # Compare photos
-                with open(stored_photo_path, 'rb') as stored_image:
-                    files = {
-                        'source_image': ('stored.jpg', stored_image, 'image/jpeg'),
-                        'target_image': ('uploaded.jpg', photo, 'image/jpeg')
-                    }
-                    headers = {'x-api-key': COMPRE_FACE_API_KEY}
-                    response = requests.post(COMPRE_FACE_URL, files=files, headers=headers)
-                
-                if response.status_code != 200:
-                    return jsonify({'error': 'CompreFace verification failed', 'details': response.text}), 500
+                if face['error'] is not None:
+                    return jsonify({'error': 'CompreFace verification failed', 'details': face['error']}), 500
                 
-                result = response.json()
-                similarity = result['result'][0]['face_matches'][0]['similarity']
-                is_match = similarity >= 0.9
+                similarity = face['similarity']
+                is_match = face['match']
                 
                 response_data = {
                     'success': False,
@@ -1010,19 +4061,15 @@ def submit_late_request():
                 
                 if not store_location:
                     response_data['location_check'] = 'too_far_from_store'
-                    response_data['message'] = 'You are not within 50m of any store location - late arrival request not submitted'
+                    response_data['message'] = 'You are not within range of any store location - late arrival request not submitted'
                     return jsonify(response_data)
                 
                 response_data['location_check'] = 'success'
                 response_data['store_location'] = store_location
                 
                 # Check existing request for today
-                cursor.execute("""
-                    SELECT request_id FROM LateArrivalRequests
-                    WHERE employee_id = %s AND DATE(requested_at) = CURDATE()
-                """, (employee_id,))
-                
-                if cursor.fetchone():
+                today = store_local_time(store_policies.get(store_location)).date()
+                if fetch_hot_query_one(conn, 'late_request_for_day', (employee_id, *day_bounds(today))):
                     response_data['message'] = 'Late arrival request already submitted for today'
                     return jsonify(response_data), 400
                 
@@ -1031,7 +4078,6 @@ def submit_late_request():
                     if len(requested_time.split(':')) == 2:
                         requested_time += ":00"
                     
-                    today = date.today()
                     time_obj = datetime.strptime(requested_time, "%H:%M:%S").time()
                     requested_datetime = datetime.combine(today, time_obj)
                     
@@ -1047,6 +4093,15 @@ def submit_late_request():
                 
                 conn.commit()
                 request_id = cursor.lastrowid
+
+                publish_event('late_request.submitted', {
+                    'request_id': request_id,
+                    'employee_id': employee_id,
+                    'name': emp_name,
+                    'branch': emp_branch,
+                    'requested_at': requested_datetime.strftime('%H:%M:%S'),
+                    'status': 'Pending'
+                }, store=store_location)
                 
                 response_data.update({
                     'success': True,
@@ -1061,11 +4116,15 @@ def submit_late_request():
                 
                 return jsonify(response_data), 201
                 
-    except Exception as e:
-        print(f"Error submitting late arrival request: {e}")
+    except CompreFaceBusy:
+        raise
+    except Exception:
+        api_log.exception("Error submitting late arrival request")
         return jsonify({'success': False, 'error': 'Failed to submit request'}), 500
 
 @app.route('/api/check-out-verify', methods=['POST'])
+@request_class(CRITICAL)
+@rate_limited
 def check_out_verify():
     """Handle employee check-out with face verification"""
     if 'photo' not in request.files or 'employee_id' not in request.form:
@@ -1088,8 +4147,7 @@ def check_out_verify():
         with get_db_connection() as conn:
             with get_db_cursor(conn) as cursor:
                 # Check if employee exists
-                cursor.execute("SELECT photo_url, name FROM Employees WHERE employee_id = %s", (employee_id,))
-                result = cursor.fetchone()
+                result = lookup_employee(conn, employee_id)
                 
                 if result is None:
                     response_data['face_verification'] = 'employee_not_found'
@@ -1104,47 +4162,30 @@ def check_out_verify():
                     response_data['message'] = 'No stored photo found for employee'
                     return jsonify(response_data), 404
                 
-                # Check for active check-in
-                today = date.today()
-                cursor.execute("""
-                    SELECT attendance_id, check_in, status, current_location 
-                    FROM Attendance 
-                    WHERE employee_id = %s AND date = %s AND check_out IS NULL
-                """, (employee_id, today))
-                
-                attendance_record = cursor.fetchone()
+                # Check for active check-in, on the employee's store-local date
+                today = store_local_time(store_policies.get(result['permanent_location'])).date()
+                attendance_record = fetch_hot_query_one(conn, 'attendance_for_day', (employee_id, today))
 
-                if not attendance_record:
+                if not is_active_shift(attendance_record):
                     response_data['face_verification'] = 'no_active_checkin'
                     response_data['message'] = 'No active check-in found for today. Please check-in first.'
                     return jsonify(response_data), 404
                 
-                # Face detection
-                photo.stream.seek(0)
-                if not is_face_detected(photo.stream):
+                # Face detection and verification against the employee's references
+                face = check_employee_face(conn, result, upload_buffer('photo'))
+                if not face['face_detected']:
                     response_data['face_verification'] = 'no_face_detected'
                     response_data['message'] = 'No face detected in uploaded photo'
                     return jsonify(response_data), 400
-                photo.stream.seek(0)
-                
-                # Face verification
-                with open(stored_photo_path, 'rb') as stored_image:
-                    files = {
-                        'source_image': ('stored.jpg', stored_image, 'image/jpeg'),
-                        'target_image': ('uploaded.jpg', photo, 'image/jpeg')
-                    }
-                    headers = {'x-api-key': COMPRE_FACE_API_KEY}
-                    verification_response = requests.post(COMPRE_FACE_URL, files=files, headers=headers)
                 
-                if verification_response.status_code != 200:
+                if face['error'] is not None:
                     response_data['face_verification'] = 'verification_service_error'
                     response_data['message'] = 'Face verification service failed'
-                    response_data['details'] = verification_response.text
+                    response_data['details'] = face['error']
                     return jsonify(response_data), 500
                 
-                verification_result = verification_response.json()
-                similarity = verification_result['result'][0]['face_matches'][0]['similarity']
-                is_match = similarity >= 0.9
+                similarity = face['similarity']
+                is_match = face['match']
                 
                 response_data['similarity'] = similarity
                 response_data['match'] = is_match
@@ -1157,13 +4198,9 @@ def check_out_verify():
                 response_data['face_verification'] = 'success'
                 
                 # Parse timestamp
-                if timestamp:
-                    try:
-                        check_out_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                    except:
-                        check_out_time = datetime.now()
-                else:
-                    check_out_time = datetime.now()
+                check_out_time = store_local_time(
+                    store_policies.get(attendance_record['current_location']), timestamp
+                )
 
                 # Validate check-out time
                 check_in_value = attendance_record['check_in']
@@ -1181,18 +4218,28 @@ def check_out_verify():
                 
                 response_data['time_validation'] = 'success'
                 
-                # Update attendance record
+                # Store the worked duration with the check-out so reports can sum it
+                check_out_time = check_out_time.replace(microsecond=0)
+                worked_seconds = int((check_out_time - check_in_datetime).total_seconds())
+                hours_worked = worked_seconds / 3600
                 cursor.execute("""
                     UPDATE Attendance 
-                    SET check_out = %s 
+                    SET check_out = %s, worked_seconds = %s, version = version + 1
                     WHERE attendance_id = %s
-                """, (check_out_time.time(), attendance_record['attendance_id']))
+                """, (check_out_time.time(), worked_seconds, attendance_record['attendance_id']))
                 
                 conn.commit()
-                
-                # Calculate hours worked
-                time_diff = check_out_time - check_in_datetime
-                hours_worked = time_diff.total_seconds() / 3600
+                headcounts.record(today, employee_id, attendance_record['current_location'],
+                                  attendance_record['status'], checked_out=True)
+
+                publish_event('attendance.check_out', {
+                    'employee_id': employee_id,
+                    'name': emp_name,
+                    'date': today.isoformat(),
+                    'status': attendance_record['status'],
+                    'check_out': check_out_time.strftime('%H:%M:%S'),
+                    'hours_worked': round(hours_worked, 2)
+                }, store=attendance_record['current_location'])
                 
                 response_data.update({
                     'check_out_recorded': True,
@@ -1207,13 +4254,17 @@ def check_out_verify():
                 
                 return jsonify(response_data), 200
         
-    except Exception as e:
-        print(f"Error during check-out verification: {e}")
+    except CompreFaceBusy:
+        raise
+    except Exception:
+        api_log.exception("Error during check-out verification")
         response_data['face_verification'] = 'system_error'
         response_data['message'] = 'Internal server error during check-out'
         return jsonify(response_data), 500
 
 @app.route('/api/viewemployees', methods=['GET'])
+@request_class(DEFERRABLE)
+@read_replica
 def view_employees():
     try:
         with get_db_connection() as conn:
@@ -1226,11 +4277,13 @@ def view_employees():
 
                 return jsonify({"success": True, "employees": employees}), 200
                 
-    except Exception as e:
-        print(f"Error fetching employees: {e}")
+    except Exception:
+        api_log.exception("Error fetching employees")
         return jsonify({"success": False, "message": "Failed to fetch employees"}), 500
 
 @app.route('/api/monthlyrecords/dynamic', methods=['POST'])
+@request_class(DEFERRABLE)
+@read_replica
 def get_dynamic_monthly_records():
     try:
         data = request.get_json()
@@ -1243,26 +4296,38 @@ def get_dynamic_monthly_records():
         # Use connection pool with context managers
         with get_db_connection() as conn:
             with get_db_cursor(conn) as cursor:
-                cursor.execute("""
+                # Aggregate in a derived table so the date range prunes partitions,
+                # reading archived months through AttendanceAll when needed
+                source = attendance_table(datetime.strptime(start_date, '%Y-%m-%d').date())
+                cursor.execute(f"""
                     SELECT
                         e.employee_id,
                         e.name,
                         e.permanent_location,
-                        COUNT(CASE WHEN a.status = 'Present' THEN 1 END) as days_present,
-                        COUNT(CASE WHEN a.status = 'Late' THEN 1 END) as late_days,
-                        COUNT(CASE WHEN a.status = 'Absent' THEN 1 END) as absent_days,
-                        COUNT(a.attendance_id) as total_recorded_days
+                        a.days_present,
+                        a.late_days,
+                        a.absent_days,
+                        a.on_leave_days,
+                        a.total_recorded_days
                     FROM Employees e
-                    LEFT JOIN Attendance a ON e.employee_id = a.employee_id
-                        AND a.date BETWEEN %s AND %s
-                    GROUP BY e.employee_id, e.name, e.permanent_location
+                    LEFT JOIN (
+                        SELECT
+                            employee_id,
+                            COUNT(CASE WHEN status = 'Present' THEN 1 END) as days_present,
+                            COUNT(CASE WHEN status = 'Late' THEN 1 END) as late_days,
+                            COUNT(CASE WHEN status = 'Absent' THEN 1 END) as absent_days,
+                            COUNT(CASE WHEN status = 'On Leave' THEN 1 END) as on_leave_days,
+                            COUNT(*) as total_recorded_days
+                        FROM {source}
+                        WHERE date BETWEEN %s AND %s
+                        GROUP BY employee_id
+                    ) a ON e.employee_id = a.employee_id
                     ORDER BY e.employee_id
                 """, (start_date, end_date))
                
                 records = []
                
                 # Calculate dates once, outside the loop
-                from datetime import datetime, timedelta
                 start = datetime.strptime(start_date, '%Y-%m-%d')
                 end = datetime.strptime(end_date, '%Y-%m-%d')
                 today = datetime.now().date()
@@ -1292,6 +4357,7 @@ def get_dynamic_monthly_records():
                         'daysPresent': days_present,
                         'lateDays': late_days,
                         'leavesTaken': leaves_taken,
+                        'approvedLeaveDays': row['on_leave_days'] or 0,
                         'overtime': overtime_days,
                         'totalWorkingDays': total_working_days,
                         'workingDaysElapsed': working_days_elapsed,
@@ -1304,16 +4370,103 @@ def get_dynamic_monthly_records():
                     'period': {
                         'start_date': start_date,
                         'end_date': end_date,
-                        'effective_end_date': effective_end_date.strftime('%Y-%m-%d'),
+                        'effective_end_date': effective_end_date,
                         'total_working_days': total_working_days,
                         'working_days_elapsed': working_days_elapsed
                     }
                 }), 200
        
     except Exception as e:
-        print("Error calculating dynamic monthly records:", e)
+        api_log.exception("Error calculating dynamic monthly records")
         return jsonify({'error': 'Failed to calculate monthly records', 'details': str(e)}), 500
 
+HOURS_PERIODS = ('week', 'month')
+
+
+@app.route('/api/hours', methods=['GET'])
+@request_class(DEFERRABLE)
+@read_replica
+def get_hours_report():
+    """
+    Worked hours over a week or a month, summed in SQL from the worked_seconds
+    stored at check-out. Open shifts (no check-out yet) are not counted.
+    Query params:
+        period: week (Monday to Sunday, default) or month
+        date: Any day in the period (YYYY-MM-DD, default: today)
+        store: Only this store
+        group: employee (one row per employee and store, default) or store
+    """
+    args = request.args
+    period = args.get('period', 'week')
+    group = args.get('group', 'employee')
+    store = args.get('store')
+    if period not in HOURS_PERIODS:
+        return jsonify({'error': f"period must be one of: {', '.join(HOURS_PERIODS)}"}), 400
+    if group not in ('employee', 'store'):
+        return jsonify({'error': 'group must be employee or store'}), 400
+    try:
+        day = datetime.strptime(args['date'], '%Y-%m-%d').date() if args.get('date') else date.today()
+    except ValueError:
+        return jsonify({'error': 'Invalid date. Use YYYY-MM-DD'}), 400
+
+    if period == 'week':
+        start = day - timedelta(days=day.weekday())
+        end = start + timedelta(days=7)
+    else:
+        start = day.replace(day=1)
+        end = _add_months(start, 1)
+
+    conditions = ["date >= %s", "date < %s", "worked_seconds IS NOT NULL"]
+    params = [start, end]
+    if store:
+        conditions.append("current_location = %s")
+        params.append(store)
+    where = " AND ".join(conditions)
+    source = attendance_table(start)
+
+    try:
+        with get_db_connection() as conn:
+            with get_db_cursor(conn) as cursor:
+                if group == 'employee':
+                    cursor.execute(f"""
+                        SELECT h.employee_id, e.name, h.store, h.days_worked, h.worked_seconds,
+                               ROUND(h.worked_seconds / 3600, 2) AS hours
+                        FROM (
+                            SELECT employee_id, current_location AS store, COUNT(*) AS days_worked,
+                                   CAST(SUM(worked_seconds) AS SIGNED) AS worked_seconds
+                            FROM {source}
+                            WHERE {where}
+                            GROUP BY employee_id, current_location
+                        ) h
+                        JOIN Employees e ON h.employee_id = e.employee_id
+                        ORDER BY h.store, e.name, h.employee_id
+                    """, params)
+                else:
+                    cursor.execute(f"""
+                        SELECT current_location AS store, COUNT(DISTINCT employee_id) AS employees,
+                               COUNT(*) AS days_worked, CAST(SUM(worked_seconds) AS SIGNED) AS worked_seconds,
+                               ROUND(SUM(worked_seconds) / 3600, 2) AS hours
+                        FROM {source}
+                        WHERE {where}
+                        GROUP BY current_location
+                        ORDER BY current_location
+                    """, params)
+                rows = cursor.fetchall()
+
+        total_seconds = sum(row['worked_seconds'] for row in rows)
+        return jsonify({
+            'success': True,
+            'period': {'type': period, 'start': start, 'end': end - timedelta(days=1)},
+            'group': group,
+            'rows': rows,
+            'total_seconds': total_seconds,
+            'total_hours': round(total_seconds / 3600, 2)
+        }), 200
+
+    except Exception as e:
+        api_log.exception("Error building hours report")
+        return jsonify({'error': 'Failed to build hours report', 'details': str(e)}), 500
+
 # Optional: Add endpoint for getting current month records
 @app.route('/api/monthlyrecords/current', methods=['GET'])
 def get_current_month_records():
@@ -1332,23 +4485,92 @@ def get_current_month_records():
             }
         }), 200
         
-    except Exception as e:
-        print("Error:", e)
+    except Exception:
+        api_log.exception("Error building current month dates")
         return jsonify({'error': 'Failed to get current month data'}), 500
 
 
 
+LEAVE_STATUSES = ('Pending', 'Approved', 'Rejected')
+LEAVE_PAGE_SIZE = 50
+LEAVE_MAX_PAGE_SIZE = 200
+
 @app.route('/api/leave-requests', methods=['GET'])
+@request_class(DEFERRABLE)
+@read_replica
 def get_leave_requests():
+    """
+    List leave requests, newest start date first
+    Without limit or cursor the response is the original bare array of every
+    matching request. With either it is one page: {success, requests,
+    next_cursor, counts}.
+    Query params:
+        status: Pending, Approved or Rejected
+        employee_id: Only this employee's requests
+        store: Only employees whose permanent location is this store
+        from, to: Only requests overlapping this date range (YYYY-MM-DD)
+        limit: Page size (default 50, max 200)
+        cursor: next_cursor from the previous page
+        include_counts: Set to 0 to skip the per-status counts on the first page
+    """
+    args = request.args
+    paged = 'limit' in args or 'cursor' in args
+    status = args.get('status')
+    employee_id = args.get('employee_id')
+    store = args.get('store')
+    cursor_param = args.get('cursor')
+
+    if status and status not in LEAVE_STATUSES:
+        return jsonify({'error': f'Invalid status. Must be one of: {", ".join(LEAVE_STATUSES)}'}), 400
+
+    try:
+        limit = min(int(args.get('limit', LEAVE_PAGE_SIZE)), LEAVE_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError
+        from_date = datetime.strptime(args['from'], '%Y-%m-%d').date() if args.get('from') else None
+        to_date = datetime.strptime(args['to'], '%Y-%m-%d').date() if args.get('to') else None
+        if employee_id is not None:
+            employee_id = int(employee_id)
+        after = None
+        if cursor_param:
+            cursor_date, cursor_id = cursor_param.split('.')
+            after = (datetime.strptime(cursor_date, '%Y-%m-%d').date(), int(cursor_id))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid limit, employee_id, from/to date or cursor'}), 400
+
+    # Filters shared by the page query and the per-status counts
+    conditions = []
+    params = []
+    if employee_id is not None:
+        conditions.append("l.employee_id = %s")
+        params.append(employee_id)
+    if store:
+        conditions.append("e.permanent_location = %s")
+        params.append(store)
+    if from_date:
+        conditions.append("l.end_date >= %s")
+        params.append(from_date)
+    if to_date:
+        conditions.append("l.start_date <= %s")
+        params.append(to_date)
+
+    page_conditions = list(conditions)
+    page_params = list(params)
+    if status:
+        page_conditions.append("l.status = %s")
+        page_params.append(status)
+    if after:
+        page_conditions.append("(l.start_date < %s OR (l.start_date = %s AND l.leave_id < %s))")
+        page_params.extend([after[0], after[0], after[1]])
+
     try:
-        # Use connection pool with context managers
         with get_db_connection() as conn:
             with get_db_cursor(conn) as cursor:
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT
-                        l.leave_id,
+                        l.leave_id AS request_id,
                         l.employee_id,
-                        e.name AS employee_name,
+                        e.name,
                         l.start_date,
                         l.end_date,
                         l.reason,
@@ -1356,26 +4578,41 @@ def get_leave_requests():
                         l.request_date
                     FROM LeaveRequests l
                     JOIN Employees e ON l.employee_id = e.employee_id
-                    ORDER BY l.start_date DESC
-                """)
-                
-                requests = []
-                for row in cursor:
-                    requests.append({
-                        'request_id': row['leave_id'],
-                        'employee_id': row['employee_id'],
-                        'name': row['employee_name'],
-                        'start_date': row['start_date'].strftime('%Y-%m-%d'),
-                        'end_date': row['end_date'].strftime('%Y-%m-%d'),
-                        'reason': row['reason'],
-                        'status': row['status'],
-                        'request_date': row['request_date'].strftime('%Y-%m-%d %H:%M:%S')
-                    })
-                
-                return jsonify(requests), 200
+                    {"WHERE " + " AND ".join(page_conditions) if page_conditions else ""}
+                    ORDER BY l.start_date DESC, l.leave_id DESC
+                    {"LIMIT %s" if paged else ""}
+                """, (*page_params, limit + 1) if paged else page_params)
+                rows = cursor.fetchall()
+                if not paged:
+                    return jsonify(rows), 200
+
+                counts = None
+                if not after and args.get('include_counts') != '0':
+                    cursor.execute(f"""
+                        SELECT l.status, COUNT(*) AS total
+                        FROM LeaveRequests l
+                        {"JOIN Employees e ON l.employee_id = e.employee_id" if store else ""}
+                        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+                        GROUP BY l.status
+                    """, params)
+                    counts = {leave_status: 0 for leave_status in LEAVE_STATUSES}
+                    counts.update({row['status']: row['total'] for row in cursor.fetchall()})
+
+                next_cursor = None
+                if len(rows) > limit:
+                    rows = rows[:limit]
+                    last = rows[-1]
+                    next_cursor = f"{last['start_date'].isoformat()}.{last['request_id']}"
+
+                return jsonify({
+                    'success': True,
+                    'requests': rows,
+                    'next_cursor': next_cursor,
+                    'counts': counts
+                }), 200
                 
-    except Exception as e:
-        print("Error fetching leave requests:", e)
+    except Exception:
+        api_log.exception("Error fetching leave requests")
         return jsonify({'error': 'Failed to fetch leave requests'}), 500
     
 @app.route('/api/leave-requests/<int:leave_id>/status', methods=['PUT'])
@@ -1391,35 +4628,54 @@ def update_leave_status(leave_id):
     try:
         with get_db_connection() as conn:
             with get_db_cursor(conn) as cursor:
-                # First check if the leave request exists
-                cursor.execute("SELECT leave_id, status FROM LeaveRequests WHERE leave_id = %s", (leave_id,))
+                # Lock the request so two concurrent decisions cannot both pass the check below
+                conn.start_transaction()
+                cursor.execute("""
+                    SELECT leave_id, employee_id, start_date, end_date, status
+                    FROM LeaveRequests
+                    WHERE leave_id = %s
+                    FOR UPDATE
+                """, (leave_id,))
                 leave_request = cursor.fetchone()
                 
                 if not leave_request:
+                    conn.rollback()
                     return jsonify({'error': 'Leave request not found'}), 404
                 
                 # Check if already processed (optional - remove if you want to allow status changes)
                 if leave_request['status'] in ['Approved', 'Rejected']:
+                    conn.rollback()
                     return jsonify({'error': f'Leave request already {leave_request["status"].lower()}'}), 400
 
                 # Update the status
                 cursor.execute("UPDATE LeaveRequests SET status = %s WHERE leave_id = %s", (new_status, leave_id))
                 
-                # Since autocommit is True in your config, no need for conn.commit()
-                # If you changed autocommit to False, uncomment the next line:
-                # conn.commit()
+                # Precompute the daily attendance entries so reports need no corrections
+                leave_days = 0
+                if new_status == 'Approved':
+                    leave_days = record_leave_days(
+                        cursor, leave_request['employee_id'], leave_request['start_date'], leave_request['end_date']
+                    )
+
+                conn.commit()
+                if leave_days:
+                    sync_headcounts(cursor, leave_request['employee_id'],
+                                    leave_request['start_date'], leave_request['end_date'])
 
                 return jsonify({
                     'message': 'Leave request status updated successfully',
                     'leave_id': leave_id,
-                    'new_status': new_status
+                    'new_status': new_status,
+                    'leave_days_recorded': leave_days
                 }), 200
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except mysql.connector.Error as e:
-        print(f"Database error updating leave request {leave_id}: {e}")
+        api_log.error("Database error updating leave request %s: %s", leave_id, e)
         return jsonify({'error': 'Database error occurred'}), 500
-    except Exception as e:
-        print(f"Error updating leave request {leave_id}: {e}")
+    except Exception:
+        api_log.exception("Error updating leave request %s", leave_id)
         return jsonify({'error': 'Failed to update leave status'}), 500
     
 # Optional: Add a manual trigger endpoint for testing
@@ -1440,36 +4696,343 @@ def trigger_late_request_rejection():
     Manual trigger for testing the late request rejection
     """
     try:
-        reject_pending_late_requests()
-        return jsonify({"status": "success", "message": "Late request rejection completed"}), 200
+        run = reject_pending_late_requests()
+        if run is None:
+            return jsonify({"status": "error", "message": "Late request rejection failed; see logs"}), 500
+        return jsonify({"status": "success", "message": "Late request rejection completed", "run": run}), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route('/api/job-runs', methods=['GET'])
+def get_job_runs():
+    """
+    Recent background job runs, newest first
+    Query params:
+        job: Only this job (e.g. late_request_rejection)
+        limit: Number of runs (default 50, max 500)
+    """
+    job = request.args.get('job')
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    try:
+        with get_db_connection() as conn:
+            with get_db_cursor(conn) as cursor:
+                where, params = ("WHERE job = %s", [job]) if job else ("", [])
+                cursor.execute(f"""
+                    SELECT run_id, job, scope, started_at, finished_at, status,
+                           rows_examined, rows_affected, chunks, error
+                    FROM JobRuns
+                    {where}
+                    ORDER BY started_at DESC, run_id DESC
+                    LIMIT %s
+                """, (*params, limit))
+                runs = cursor.fetchall()
+        return jsonify({'runs': runs}), 200
+    except Exception:
+        api_log.exception("Error fetching job runs")
+        return jsonify({'error': 'Failed to fetch job runs'}), 500
+
+
+@app.route('/api/trigger-attendance-archival', methods=['POST'])
+def trigger_attendance_archival():
+    """
+    Manual trigger for the monthly partition maintenance and archival
+    """
+    summary = maintain_attendance_partitions()
+    status = 'error' if 'error' in summary else 'success'
+    return jsonify({"status": status, **summary}), 500 if status == 'error' else 200
+
+
+@app.route('/api/trigger-worked-seconds-backfill', methods=['POST'])
+def trigger_worked_seconds_backfill():
+    """
+    Manual trigger for the worked_seconds backfill
+    Query params:
+        since: Only rows dated on or after this day (YYYY-MM-DD, default: every row)
+    """
+    since = request.args.get('since')
+    try:
+        since = datetime.strptime(since, '%Y-%m-%d').date() if since else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid since. Use YYYY-MM-DD"}), 400
+    runs = backfill_worked_seconds(since)
+    if runs is None:
+        return jsonify({"status": "error", "message": "worked_seconds backfill failed; see logs"}), 500
+    return jsonify({"status": "success", "message": "worked_seconds backfill completed", "runs": runs}), 200
+
+
 @app.route('/api/scheduler-status', methods=['GET'])
 def scheduler_status():
     """
-    Check if both schedulers are running and show next run times
+    Check that the per-region jobs are scheduled and show their next run times
     """
     try:
-        absent_job = scheduler.get_job('absent_check')
-        late_job = scheduler.get_job('late_request_rejection')
+        if scheduler is None:
+            return jsonify({"status": "error", "message": "Scheduler not started"}), 503
+
+        result = {"absent_check": [], "late_request_rejection": [], "cache_warmup": []}
+        for job in scheduler.get_jobs():
+            job_type, _, shard_key = job.id.partition(':')
+            if job_type not in result:
+                continue
+            result[job_type].append({
+                "region": shard_key,
+                "status": "running",
+                "next_run": job.next_run_time.isoformat() if job.next_run_time else "Not scheduled"
+            })
         
-        result = {
-            "absent_check": {
-                "status": "running" if absent_job else "not_found",
-                "next_run": absent_job.next_run_time.isoformat() if absent_job and absent_job.next_run_time else "Not scheduled"
-            },
-            "late_request_rejection": {
-                "status": "running" if late_job else "not_found", 
-                "next_run": late_job.next_run_time.isoformat() if late_job and late_job.next_run_time else "Not scheduled"
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/pool-status', methods=['GET'])
+def pool_status():
+    """
+    Connection pool telemetry: in-use, idle, waiters and acquire wait times
+    """
+    try:
+        result = {"primary": connection_pool.stats() if connection_pool else None}
+        if DB_REPLICA_HOST:
+            result["replica"] = replica_pool.stats() if replica_pool else None
+            result["replica_health"] = {
+                "healthy": _replica_state['healthy'],
+                "lag_seconds": _replica_state['lag']
             }
-        }
-        
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/rate-limit-status', methods=['GET'])
+def rate_limit_status():
+    """
+    Rejected request counters, tracked buckets and CompreFace concurrency
+    """
+    with _rate_limit_stats_lock:
+        rejected = dict(rate_limit_rejections)
+        in_flight = _compreface_in_flight
+    return jsonify({
+        "rejected": rejected,
+        "tracked_buckets": {
+            limiter.name: len(limiter) for limiter in (employee_limiter, client_limiter, store_limiter)
+        },
+        "compreface": {
+            "in_flight": in_flight,
+            "max_concurrency": COMPREFACE_MAX_CONCURRENCY
+        }
+    }), 200
+
+@app.route('/api/load-status', methods=['GET'])
+def load_status():
+    """
+    Load-shedding signals, in-flight requests per class and the shed counter
+    """
+    with _load_stats_lock:
+        stats = {**load_shedding_stats, 'in_flight': dict(load_shedding_stats['in_flight'])}
+    return jsonify({
+        "pressure": system_pressure(),
+        "signals": {
+            "pool_wait_ms": round(connection_pool.recent_wait_ms.value, 3) if connection_pool else 0.0,
+            "pool_waiters": connection_pool.stats()['waiters'] if connection_pool else 0,
+            "compreface_latency_ms": round(compreface_latency_ms.value, 3)
+        },
+        "thresholds": {
+            "pool_wait_ms": LOAD_SHED_POOL_WAIT_MS,
+            "compreface_latency_ms": LOAD_SHED_COMPREFACE_MS
+        },
+        **stats
+    }), 200
+
+@app.route('/api/trigger-cache-warmup', methods=['POST'])
+def trigger_cache_warmup():
+    """
+    Manual trigger for the pre-rush cache warm-up (all regions)
+    """
+    try:
+        result = warm_caches()
+        return jsonify({"status": result['status'], "warmup": result}), 200 if result['status'] == 'success' else 500
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/cache-status', methods=['GET'])
+def cache_status():
+    """
+    Last warm-up report and cache hit rates since then
+    """
+    return jsonify({
+        "last_warmup": last_warmup or None,
+        "employees": employee_cache.stats(),
+        "face_images": face_image_cache.stats(),
+        "face_templates": face_template_cache.stats()
+    }), 200
+
+@app.route('/api/face-verification-status', methods=['GET'])
+def face_verification_status():
+    """
+    Verification outcomes since start per method (template or single photo),
+    with false-reject retries and the CompreFace calls they cost
+    """
+    with _face_stats_lock:
+        stats = {method: dict(counts) for method, counts in face_verification_stats.items()}
+    for counts in stats.values():
+        counts['false_reject_rate'] = (round(counts['false_reject_retries'] / counts['matches'], 4)
+                                       if counts['matches'] else None)
+        # Each retry repeats detection and verification
+        counts['retry_compreface_calls'] = 2 * counts['false_reject_retries']
+    return jsonify({
+        **stats,
+        "threshold": FACE_MATCH_THRESHOLD,
+        "retry_window_seconds": FACE_RETRY_WINDOW_SECONDS
+    }), 200
+
+@app.route('/api/profiling', methods=['GET', 'POST'])
+def profiling_settings():
+    """
+    GET: Sampled routes and the recent profiles (without their traces)
+    POST: Set the sampled percentage for a route, e.g.
+        {"route": "/api/monthlyrecords/dynamic", "sample_percent": 5}
+        A sample_percent of 0 stops sampling that route.
+    Requires the X-Admin-Token header.
+    """
+    denied = _require_profile_admin()
+    if denied:
+        return denied
+
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        route = data.get('route')
+        rules = {rule.rule for rule in app.url_map.iter_rules()}
+        if route not in rules:
+            return jsonify({"error": "Unknown route"}), 400
+        try:
+            percent = float(data.get('sample_percent', 0))
+        except (TypeError, ValueError):
+            return jsonify({"error": "sample_percent must be a number"}), 400
+        if not 0 <= percent <= 100:
+            return jsonify({"error": "sample_percent must be between 0 and 100"}), 400
+        with _profile_lock:
+            if percent:
+                profile_routes[route] = percent
+            else:
+                profile_routes.pop(route, None)
+
+    with _profile_lock:
+        profiles = [{k: v for k, v in p.items() if k not in ('sql', 'summary', 'raw')} for p in recent_profiles]
+        routes = dict(profile_routes)
+    return jsonify({"routes": routes, "profiles": profiles}), 200
+
+@app.route('/api/profiling/<int:profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    One captured profile: SQL timings and the top functions by cumulative time.
+    Add ?format=pstats to download the raw trace for snakeviz or pstats.
+    Requires the X-Admin-Token header.
+    """
+    denied = _require_profile_admin()
+    if denied:
+        return denied
+
+    with _profile_lock:
+        profile = next((p for p in recent_profiles if p['id'] == profile_id), None)
+    if profile is None:
+        return jsonify({"error": "Profile not found"}), 404
+
+    if request.args.get('format') == 'pstats':
+        if profile['raw'] is None:
+            return jsonify({"error": "No trace was captured for this request"}), 404
+        return Response(profile['raw'], mimetype='application/octet-stream', headers={
+            'Content-Disposition': f'attachment; filename=profile-{profile_id}.pstats'
+        })
+    return jsonify({k: v for k, v in profile.items() if k != 'raw'}), 200
+
+@app.route('/api/upload-status', methods=['GET'])
+def upload_status():
+    """
+    Upload totals since start, and how many bytes were copied per byte received
+    """
+    with _upload_stats_lock:
+        stats = dict(upload_stats)
+    received = stats['bytes_received']
+    return jsonify({
+        **stats,
+        "copies_per_byte": round(stats['bytes_copied'] / received, 3) if received else None
+    }), 200
+
+@app.route('/api/headcounts', methods=['GET'])
+def get_headcounts():
+    """
+    Live staff counts per store: checked in, checked out, on site, late,
+    absent and on leave
+    Query params:
+        store: Only this store
+        date: Day to report (YYYY-MM-DD, default: each store's local today)
+    """
+    store = request.args.get('store')
+    try:
+        day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid date. Use YYYY-MM-DD'}), 400
+
+    # First request in a process that does not run the scheduler
+    if headcounts.rebuilt_at is None:
+        rebuild_headcounts()
+
+    if store:
+        policies = [store_policies.get(store)]
+        names = [store]
+    else:
+        policies = store_policies.stores()
+        names = [p['area_name'] for p in policies]
+
+    stores = {}
+    for name, policy in zip(names, policies):
+        store_day = day or store_local_time(policy).date()
+        stores[name] = {'date': store_day.isoformat(), **headcounts.counts(name, store_day)}
+
+    return jsonify({
+        'stores': stores,
+        'rebuilt_at': headcounts.rebuilt_at.isoformat(timespec='seconds') if headcounts.rebuilt_at else None
+    }), 200
+
+@app.route('/api/analytics/arrivals', methods=['GET'])
+@request_class(DEFERRABLE)
+@read_replica
+def get_arrival_analytics():
+    """
+    Arrival analytics per store: check-ins by hour, check-in quartiles and
+    weekly late rate and average hours worked
+    Query params:
+        start, end: Date range (YYYY-MM-DD, default: the last 4 weeks)
+        store: Only this store
+    """
+    try:
+        end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else date.today()
+        start_date = (datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start')
+                      else end_date - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1))
+    except ValueError:
+        return jsonify({'error': 'Invalid start or end date. Use YYYY-MM-DD'}), 400
+    if start_date > end_date or (end_date - start_date).days >= ANALYTICS_MAX_DAYS:
+        return jsonify({'error': f'start must not be after end, and the range must be under {ANALYTICS_MAX_DAYS} days'}), 400
+    store = request.args.get('store') or None
+
+    try:
+        key = (start_date, end_date, store)
+        stores = analytics_cache.get(key)
+        if stores is None:
+            stores = compute_arrival_analytics(load_attendance_columns(start_date, end_date, store))
+            analytics_cache.put(key, stores)
+        return jsonify({
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'stores': stores
+        }), 200
+    except Exception as e:
+        api_log.exception("Error computing arrival analytics")
+        return jsonify({'error': 'Failed to compute arrival analytics', 'details': str(e)}), 500
+
 @app.route('/api/update_attendance', methods=['PUT'])
 def update_attendance():
     try:
@@ -1480,7 +5043,7 @@ def update_attendance():
         check_in = data.get('check_in')
         check_out = data.get('check_out')
 
-        print(f"Received update request: {data}")  # Debug log
+        api_log.debug("Attendance update for %s: fields %s", attendance_id, sorted(data))
 
         if not attendance_id:
             return jsonify({'success': False, 'message': 'attendance_id is required'}), 400
@@ -1493,27 +5056,177 @@ def update_attendance():
 
         with get_db_connection() as conn:
             with get_db_cursor(conn) as cursor:
-                update_query = """
+                update_query = f"""
                     UPDATE Attendance
                     SET current_location = %s,
                         status = %s,
                         check_in = %s,
-                        check_out = %s
+                        check_out = %s,
+                        worked_seconds = {WORKED_SECONDS_SQL},
+                        version = version + 1
                     WHERE attendance_id = %s
                 """
                 cursor.execute(update_query, (current_location, status, check_in, check_out, attendance_id))
                 conn.commit()
+                api_log.debug("Updated %d attendance rows", cursor.rowcount)
+                if not cursor.rowcount and archived_attendance_ids(cursor, [attendance_id]):
+                    return jsonify({'success': False, 'message': 'Attendance record is archived and read-only'}), 409
 
-                print(f"Updated {cursor.rowcount} rows")  # Debug log
+                for day, employee_id, store, status, checked_out in _load_headcount_rows(
+                        cursor, "a.attendance_id = %s", (attendance_id,)):
+                    headcounts.record(day, employee_id, store, status, checked_out)
 
         return jsonify({'success': True, 'message': 'Attendance updated successfully'})
 
     except Exception as e:
-        print(f"Error updating attendance: {e}")
-        import traceback
-        traceback.print_exc()
+        api_log.exception("Error updating attendance")
         return jsonify({'success': False, 'message': str(e)}), 500
     
+def archived_attendance_ids(cursor, attendance_ids):
+    """The ids among attendance_ids that were moved to AttendanceArchive (read-only)"""
+    placeholders = ', '.join(['%s'] * len(attendance_ids))
+    cursor.execute(f"SELECT attendance_id FROM AttendanceArchive WHERE attendance_id IN ({placeholders})",
+                   list(attendance_ids))
+    return {row['attendance_id'] for row in cursor.fetchall()}
+
+
+ATTENDANCE_STATUSES = ('Present', 'Late', 'Absent', 'On Leave')
+ATTENDANCE_EDIT_FIELDS = ('current_location', 'status', 'check_in', 'check_out')
+ATTENDANCE_BATCH_MAX = 500
+
+
+def _validate_attendance_edit(edit):
+    """Normalized (attendance_id, version, {column: value}) for one batch edit; raises ValueError"""
+    if not isinstance(edit, dict):
+        raise ValueError('Each edit must be an object')
+    attendance_id = edit.get('attendance_id')
+    if not isinstance(attendance_id, int) or isinstance(attendance_id, bool):
+        raise ValueError('attendance_id must be an integer')
+    version = edit.get('version')
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        raise ValueError('version must be an integer')
+
+    unknown = set(edit) - set(ATTENDANCE_EDIT_FIELDS) - {'attendance_id', 'version'}
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    changes = {field: edit[field] for field in ATTENDANCE_EDIT_FIELDS if field in edit}
+    if not changes:
+        raise ValueError('Nothing to change')
+
+    status = changes.get('status')
+    if 'status' in changes and status not in ATTENDANCE_STATUSES:
+        raise ValueError(f"status must be one of: {', '.join(ATTENDANCE_STATUSES)}")
+    for field in ('check_in', 'check_out'):
+        value = changes.get(field)
+        if value is not None:
+            if not isinstance(value, str):
+                raise ValueError(f'{field} must be HH:MM or HH:MM:SS')
+            changes[field] = datetime.strptime(value if value.count(':') == 2 else f"{value}:00", '%H:%M:%S').time()
+    if changes.get('current_location') is not None and not isinstance(changes['current_location'], str):
+        raise ValueError('current_location must be a string')
+
+    # Same rule as the single-row edit: no times or location without attendance
+    if status in ('Absent', 'On Leave'):
+        changes.update(check_in=None, check_out=None, current_location=None)
+    return attendance_id, version, changes
+
+
+@app.route('/api/attendance/batch', methods=['PUT'])
+def batch_update_attendance():
+    """
+    Apply many partial attendance edits in one transaction
+    Body:
+        {"edits": [{"attendance_id": 1, "version": 3, "status": "Late", "check_in": "09:52"}, ...]}
+        Only the given fields are changed. When version is given, the edit only
+        applies if the row is still at that version.
+    Returns one outcome per edit: updated (with the new version), conflict
+    (with the current version), archived (moved to AttendanceArchive, which is
+    read-only) or not_found. Invalid batches are rejected whole.
+    """
+    data = request.get_json(silent=True) or {}
+    edits = data.get('edits')
+    if not isinstance(edits, list) or not edits:
+        return jsonify({'success': False, 'message': 'edits must be a non-empty list'}), 400
+    if len(edits) > ATTENDANCE_BATCH_MAX:
+        return jsonify({'success': False, 'message': f'At most {ATTENDANCE_BATCH_MAX} edits per batch'}), 400
+
+    validated, errors, seen = [], [], set()
+    for index, edit in enumerate(edits):
+        try:
+            attendance_id, version, changes = _validate_attendance_edit(edit)
+            if attendance_id in seen:
+                raise ValueError('attendance_id appears more than once')
+            seen.add(attendance_id)
+            validated.append((attendance_id, version, changes))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+    if errors:
+        return jsonify({'success': False, 'message': 'Invalid edits; nothing was applied', 'errors': errors}), 400
+
+    try:
+        with get_db_connection() as conn:
+            with get_db_cursor(conn) as cursor:
+                conn.start_transaction()
+                ids = [attendance_id for attendance_id, _, _ in validated]
+                placeholders = ', '.join(['%s'] * len(ids))
+                # Lock the rows so the version check and the update see the same state
+                cursor.execute(f"""
+                    SELECT attendance_id, version FROM Attendance
+                    WHERE attendance_id IN ({placeholders})
+                    FOR UPDATE
+                """, ids)
+                current = {row['attendance_id']: row['version'] for row in cursor.fetchall()}
+                missing = [attendance_id for attendance_id in ids if attendance_id not in current]
+                archived = archived_attendance_ids(cursor, missing) if missing else set()
+
+                outcomes, groups = [], {}
+                for attendance_id, version, changes in validated:
+                    if attendance_id in archived:
+                        outcomes.append({'attendance_id': attendance_id, 'outcome': 'archived'})
+                    elif attendance_id not in current:
+                        outcomes.append({'attendance_id': attendance_id, 'outcome': 'not_found'})
+                    elif version is not None and version != current[attendance_id]:
+                        outcomes.append({'attendance_id': attendance_id, 'outcome': 'conflict',
+                                         'version': current[attendance_id]})
+                    else:
+                        columns = tuple(sorted(changes))
+                        groups.setdefault(columns, []).append(
+                            tuple(changes[c] for c in columns) + (attendance_id,)
+                        )
+                        outcomes.append({'attendance_id': attendance_id, 'outcome': 'updated',
+                                         'version': current[attendance_id] + 1})
+
+                # One statement per distinct set of changed columns
+                for columns, rows in groups.items():
+                    assignments = ', '.join(f"{c} = %s" for c in columns)
+                    cursor.executemany(
+                        f"UPDATE Attendance SET {assignments}, worked_seconds = {WORKED_SECONDS_SQL}, "
+                        "version = version + 1 WHERE attendance_id = %s",
+                        rows
+                    )
+                conn.commit()
+
+                updated = [o['attendance_id'] for o in outcomes if o['outcome'] == 'updated']
+                if updated:
+                    placeholders = ', '.join(['%s'] * len(updated))
+                    for day, employee_id, store, status, checked_out in _load_headcount_rows(
+                            cursor, f"a.attendance_id IN ({placeholders})", tuple(updated)):
+                        headcounts.record(day, employee_id, store, status, checked_out)
+                    publish_event('attendance.batch_updated', {'attendance_ids': updated})
+
+        return jsonify({
+            'success': True,
+            'updated': len(updated),
+            'conflicts': sum(o['outcome'] == 'conflict' for o in outcomes),
+            'archived': sum(o['outcome'] == 'archived' for o in outcomes),
+            'not_found': sum(o['outcome'] == 'not_found' for o in outcomes),
+            'results': outcomes
+        }), 200
+
+    except Exception as e:
+        api_log.exception("Error applying attendance batch")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/employees/<employee_id>', methods=['GET'])
 def get_employee(employee_id):
     try:
@@ -1546,7 +5259,7 @@ def get_employee(employee_id):
                 }), 200
                 
     except Exception as e:
-        app.logger.exception("Get employee failed")
+        api_log.exception("Get employee failed")
         return jsonify({"success": False, "message": str(e)}), 500
 
 
@@ -1590,6 +5303,7 @@ def update_employee():
             with get_db_cursor(conn) as cursor:
                 query = f"UPDATE Employees SET {', '.join(update_fields)} WHERE employee_id = %s"
                 cursor.execute(query, values)
+                employee_cache.invalidate(str(employee_id))
                 
                 if cursor.rowcount == 0:
                     return jsonify({"success": False, "message": "Employee not found"}), 404
@@ -1600,8 +5314,8 @@ def update_employee():
         }), 200
         
     except Exception as e:
-        app.logger.exception("Update employee failed")
+        api_log.exception("Update employee failed")
         return jsonify({"success": False, "message": str(e)}), 500
     
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
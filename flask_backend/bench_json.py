@@ -0,0 +1,113 @@
+"""
+JSON serialization and compression benchmark for large list responses.
+
+Builds a synthetic employee roster shaped like the /api/viewemployees and
+/api/attendance rows (ints, strings, dates, TIME columns as timedeltas) and
+compares, per response:
+  - Flask's stock provider on rows converted field by field (what the
+    endpoints did before) against FastJSONProvider on the raw rows
+  - bytes on the wire uncompressed, gzip and (when installed) brotli, at the
+    levels the backend uses, and how long compression takes
+
+No database is needed.
+
+Usage:
+    python bench_json.py [rows] [iterations]
+"""
+import gzip
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+from flask.json.provider import DefaultJSONProvider
+
+import backend
+
+STORES = [f"Store {i}" for i in range(1, 41)]
+POSITIONS = ['Staff', 'Cashier', 'Supervisor', 'Manager']
+STATUSES = ['Present', 'Late', 'Absent', 'On Leave']
+
+
+def roster(rows):
+    today = date.today()
+    return [{
+        'attendance_id': i,
+        'employee_id': 10000 + i,
+        'emp_name': f"Employee {i}",
+        'email': f"employee{i}@example.com",
+        'position': random.choice(POSITIONS),
+        'current_location': random.choice(STORES),
+        'date_joined': today - timedelta(days=random.randint(0, 3000)),
+        'date': today,
+        'status': random.choice(STATUSES),
+        'check_in': timedelta(hours=9, minutes=random.randint(0, 59), seconds=random.randint(0, 59)),
+        'check_out': timedelta(hours=18, minutes=random.randint(0, 59)),
+    } for i in range(rows)]
+
+
+def convert_rows(rows):
+    """The per-row conversion the endpoints used before the fast provider"""
+    return [{
+        'attendance_id': int(row['attendance_id']),
+        'employee_id': int(row['employee_id']),
+        'emp_name': str(row['emp_name']),
+        'email': str(row['email']),
+        'position': str(row['position']),
+        'current_location': str(row['current_location']) if row['current_location'] else None,
+        'date_joined': row['date_joined'].strftime('%Y-%m-%d'),
+        'date': str(row['date']) if row['date'] else None,
+        'status': str(row['status']),
+        'check_in': str(row['check_in']) if row['check_in'] else None,
+        'check_out': str(row['check_out']) if row['check_out'] else None,
+    } for row in rows]
+
+
+def timed(fn, iterations):
+    samples = []
+    result = None
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return result, samples
+
+
+def summarize(samples):
+    samples = sorted(s * 1000 for s in samples)
+    return f"median {statistics.median(samples):8.2f} ms  max {samples[-1]:8.2f} ms"
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    data = roster(rows)
+
+    stock = DefaultJSONProvider(backend.app)
+    fast = backend.FastJSONProvider(backend.app)
+    stdlib = backend.FastJSONProvider(backend.app, backend='stdlib')
+
+    print(f"rows: {rows}  iterations: {iterations}")
+    baseline, samples = timed(lambda: stock.dumps(convert_rows(data)).encode(), iterations)
+    print(f"{'stock provider + per-row conversion:':38}{summarize(samples)}")
+    _, samples = timed(lambda: stdlib.dumps_bytes(data), iterations)
+    print(f"{'FastJSONProvider (stdlib):':38}{summarize(samples)}")
+    body, samples = timed(lambda: fast.dumps_bytes(data), iterations)
+    print(f"{'FastJSONProvider (' + fast.name + '):':38}{summarize(samples)}")
+
+    print()
+    print(f"bytes before:  {len(baseline):>10,}")
+    print(f"bytes now:     {len(body):>10,}")
+    packed, samples = timed(lambda: gzip.compress(body, compresslevel=backend.COMPRESS_GZIP_LEVEL), iterations)
+    print(f"gzip -{backend.COMPRESS_GZIP_LEVEL}:       {len(packed):>10,}  {summarize(samples)}")
+    brotli = backend._brotli_module()
+    if brotli:
+        packed, samples = timed(lambda: brotli.compress(body, quality=backend.COMPRESS_BROTLI_QUALITY), iterations)
+        print(f"brotli q{backend.COMPRESS_BROTLI_QUALITY}:     {len(packed):>10,}  {summarize(samples)}")
+    else:
+        print("brotli:        skipped (brotli not installed)")
+
+
+if __name__ == '__main__':
+    main()
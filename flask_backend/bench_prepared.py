@@ -0,0 +1,82 @@
+"""
+Prepared-statement benchmark for the hot-path queries.
+
+Runs each registered hot SELECT against the configured database, once through
+a plain text-protocol cursor (what the endpoints used before) and once through
+the per-connection prepared statement cache, and prints per-call latency.
+
+Usage:
+    python bench_prepared.py [iterations]
+"""
+import random
+import statistics
+import sys
+import time
+from datetime import date
+
+import backend
+
+
+def sample_params(conn):
+    with backend.get_db_cursor(conn) as cursor:
+        cursor.execute("SELECT employee_id FROM Employees LIMIT 1000")
+        employee_ids = [row['employee_id'] for row in cursor.fetchall()]
+    if not employee_ids:
+        sys.exit("Employees table is empty; seed some rows first")
+
+    today = date.today()
+    return {
+        'employee_by_id': lambda: (random.choice(employee_ids),),
+        'attendance_for_day': lambda: (random.choice(employee_ids), today),
+        'late_request_for_day': lambda: (random.choice(employee_ids), *backend.day_bounds(today)),
+    }
+
+
+def time_text(conn, name, make_params, iterations):
+    query = backend.HOT_QUERIES[name]
+    samples = []
+    for _ in range(iterations):
+        params = make_params()
+        started = time.perf_counter()
+        with backend.get_db_cursor(conn) as cursor:
+            cursor.execute(query, params)
+            cursor.fetchall()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def time_prepared(conn, name, make_params, iterations):
+    samples = []
+    for _ in range(iterations):
+        params = make_params()
+        started = time.perf_counter()
+        backend.fetch_hot_query(conn, name, params)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summarize(samples):
+    samples = sorted(s * 1_000_000 for s in samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    return f"median {statistics.median(samples):8.1f} us  p95 {p95:8.1f} us"
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    with backend.get_db_connection() as conn:
+        params = sample_params(conn)
+        for name, make_params in params.items():
+            # Warm both paths so preparation cost is not counted
+            time_text(conn, name, make_params, 10)
+            time_prepared(conn, name, make_params, 10)
+
+            text = time_text(conn, name, make_params, iterations)
+            prepared = time_prepared(conn, name, make_params, iterations)
+            print(f"{name}")
+            print(f"  text:     {summarize(text)}")
+            print(f"  prepared: {summarize(prepared)}")
+
+
+if __name__ == '__main__':
+    main()
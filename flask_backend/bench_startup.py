@@ -0,0 +1,61 @@
+"""
+Cold-start benchmark for the backend.
+
+Measures, in fresh interpreters, how long it takes to import backend.py and
+build the app, and (when a database is reachable) how long the first request
+that needs the connection pool pays for creating it.
+
+Usage:
+    python bench_startup.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import backend
+t1 = time.perf_counter()
+backend.create_app(start_scheduler=False, check_migrations=False)
+t2 = time.perf_counter()
+try:
+    with backend.get_db_connection():
+        pass
+    pool = time.perf_counter() - t2
+except Exception:
+    pool = -1
+print(f"{t1 - t0:.6f} {t2 - t1:.6f} {pool:.6f}")
+"""
+
+
+def run_once():
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=HERE, capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    return [float(x) for x in out.split()]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    samples = [run_once() for _ in range(runs)]
+
+    imports = [s[0] * 1000 for s in samples]
+    factory = [s[1] * 1000 for s in samples]
+    pools = [s[2] * 1000 for s in samples if s[2] >= 0]
+
+    print(f"runs: {runs}")
+    print(f"import backend:      median {statistics.median(imports):8.2f} ms  max {max(imports):8.2f} ms")
+    print(f"create_app():        median {statistics.median(factory):8.2f} ms  max {max(factory):8.2f} ms")
+    if pools:
+        print(f"first pool checkout: median {statistics.median(pools):8.2f} ms  max {max(pools):8.2f} ms")
+    else:
+        print("first pool checkout: skipped (database not reachable)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""
+Query-plan regression check for the SQL issued by backend.py.
+
+Drives the endpoints (everything except the CompreFace-backed ones) and the
+nightly jobs against a local, disposable database while recording every
+statement they run, then runs EXPLAIN FORMAT=JSON on each distinct statement.
+A statement fails the check when its plan does a full table scan, a filesort
+or uses a temporary table on one of LARGE_TABLES, unless its fingerprint is in
+PLAN_ALLOWLIST. Estimated rows examined per table are written to a baseline
+file so changes show up between runs.
+
+The nightly jobs write to the database, so never point this at production.
+
+Usage:
+    python plan_check.py --database attendance_plan_check [--seed-employees 2000]
+                         [--seed-days 60] [--baseline plan_baseline.json]
+                         [--update-baseline]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+from datetime import date, datetime, time, timedelta
+
+import backend
+
+LARGE_TABLES = {'Attendance', 'AttendanceArchive', 'LateArrivalRequests', 'LeaveRequests'}
+
+# Fingerprint -> reason. Fingerprints are printed next to each violation.
+PLAN_ALLOWLIST = {
+}
+
+EXPLAINABLE = re.compile(r'^\s*(SELECT|UPDATE|DELETE|INSERT\b.*\bSELECT\b)', re.IGNORECASE | re.DOTALL)
+SKIPPED = re.compile(r'^\s*(EXPLAIN|SHOW|ANALYZE|SELECT\s+1\b|SELECT\s+name\s+FROM\s+SchemaMigrations)', re.IGNORECASE)
+
+
+def normalize(statement):
+    return ' '.join(statement.split())
+
+
+def fingerprint(statement):
+    return hashlib.sha1(normalize(statement).encode()).hexdigest()[:10]
+
+
+def seed(conn, employees, days):
+    """Fill the database with synthetic employees and history at a realistic ratio"""
+    stores = [s['area_name'] for s in backend.store_policies.stores()] or ['Store 1']
+    today = date.today()
+    with backend.get_db_cursor(conn) as cursor:
+        cursor.execute("SELECT COALESCE(MAX(employee_id), 0) AS top FROM Employees")
+        first_id = cursor.fetchone()['top'] + 1
+        ids = list(range(first_id, first_id + employees))
+        cursor.executemany("""
+            INSERT INTO Employees
+              (employee_id, name, email, permanent_location, position, date_joined, phone_no, photo_url)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, [(i, f"Seed {i}", f"seed{i}@example.com", random.choice(stores), 'Staff',
+               today - timedelta(days=days), '0000000000', '') for i in ids])
+
+        for offset in range(1, days + 1):
+            day = today - timedelta(days=offset)
+            cursor.executemany("""
+                INSERT IGNORE INTO Attendance (employee_id, current_location, date, status, check_in, check_out)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, [(i, random.choice(stores), day, random.choice(('Present', 'Present', 'Late', 'Absent')),
+                   time(9, random.randint(0, 59)), time(18, random.randint(0, 59))) for i in ids])
+            cursor.executemany("""
+                INSERT INTO LateArrivalRequests (employee_id, requested_at, status)
+                VALUES (%s, %s, %s)
+            """, [(i, datetime.combine(day, time(9, 50)), random.choice(('Accepted', 'Rejected')))
+                  for i in random.sample(ids, max(1, len(ids) // 20))])
+
+        try:
+            leave_rows = []
+            for i in random.sample(ids, max(1, len(ids) // 10)):
+                start = today - timedelta(days=random.randint(0, days))
+                leave_rows.append((i, start, start + timedelta(days=random.randint(0, 4)),
+                                   random.choice(backend.LEAVE_STATUSES)))
+            cursor.executemany("""
+                INSERT INTO LeaveRequests (employee_id, start_date, end_date, status)
+                VALUES (%s, %s, %s, %s)
+            """, leave_rows)
+        except backend.mysql.connector.Error as e:
+            print(f"Skipping LeaveRequests seed rows: {e.msg}")
+
+        for table in ('Employees', 'Attendance', 'LateArrivalRequests', 'LeaveRequests'):
+            cursor.execute(f"ANALYZE TABLE {table}")
+            cursor.fetchall()
+    conn.commit()
+
+
+def exercise(conn):
+    """Run the endpoints and jobs whose SQL should be checked"""
+    with backend.get_db_cursor(conn) as cursor:
+        cursor.execute("SELECT employee_id, permanent_location FROM Employees LIMIT 1")
+        employee = cursor.fetchone()
+    if not employee:
+        sys.exit("Employees table is empty; run with --seed-employees")
+    employee_id = employee['employee_id']
+    store = employee['permanent_location']
+    today = date.today()
+    month_start = today.replace(day=1)
+
+    client = backend.app.test_client()
+    calls = [
+        ('GET', '/api/attendance', None),
+        ('GET', f'/api/attendance?date={(today - timedelta(days=1)).isoformat()}', None),
+        ('GET', '/api/late-arrival-requests', None),
+        ('GET', '/api/viewemployees', None),
+        ('POST', '/api/monthlyrecords/dynamic', {'start_date': month_start.isoformat(), 'end_date': today.isoformat()}),
+        ('GET', '/api/leave-requests', None),
+        ('GET', '/api/leave-requests?status=Pending', None),
+        ('GET', f'/api/leave-requests?employee_id={employee_id}', None),
+        ('GET', f'/api/leave-requests?store={store}', None),
+        ('GET', f'/api/leave-requests?from={month_start.isoformat()}&to={today.isoformat()}', None),
+        ('POST', '/api/employee-status', {'employee_id': employee_id}),
+        ('GET', f'/api/employees/{employee_id}', None),
+        ('GET', '/api/hours', None),
+        ('GET', f'/api/hours?period=month&store={store}', None),
+        ('GET', '/api/hours?period=month&group=store', None),
+    ]
+    for method, path, body in calls:
+        response = client.open(path, method=method, json=body)
+        if response.status_code >= 500:
+            print(f"  {method} {path} -> {response.status_code}")
+
+    for name, params in (
+        ('employee_by_id', (employee_id,)),
+        ('attendance_for_day', (employee_id, today)),
+        ('late_request_for_day', (employee_id, *backend.day_bounds(today))),
+    ):
+        backend.fetch_hot_query(conn, name, params)
+
+    for shard in backend.build_region_shards():
+        backend.mark_absent_employees(shard)
+        backend.reject_pending_late_requests(shard)
+    backend.nightly_worked_seconds_backfill()
+
+
+def plan_tables(node, found):
+    """Collect every table access in an EXPLAIN JSON plan"""
+    if isinstance(node, dict):
+        if 'table_name' in node and 'access_type' in node:
+            found.append(node)
+        for value in node.values():
+            plan_tables(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            plan_tables(value, found)
+    return found
+
+
+def plan_problems(node, problems):
+    """Find full scans, filesorts and temporary tables that touch a large table"""
+    if isinstance(node, dict):
+        large = {t['table_name'] for t in plan_tables(node, [])} & LARGE_TABLES
+        if large:
+            if node.get('using_filesort'):
+                problems.add(f"filesort over {', '.join(sorted(large))}")
+            if node.get('using_temporary_table'):
+                problems.add(f"temporary table over {', '.join(sorted(large))}")
+        if node.get('table_name') in LARGE_TABLES and node.get('access_type') == 'ALL':
+            problems.add(f"full scan of {node['table_name']}")
+        for value in node.values():
+            plan_problems(value, problems)
+    elif isinstance(node, list):
+        for value in node:
+            plan_problems(value, problems)
+    return problems
+
+
+def explain(conn, statement, params):
+    with backend.get_db_cursor(conn) as cursor:
+        cursor.execute("EXPLAIN FORMAT=JSON " + statement, params or ())
+        row = cursor.fetchone()
+    return json.loads(next(iter(row.values())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=os.getenv('PLAN_CHECK_DATABASE'))
+    parser.add_argument('--seed-employees', type=int, default=0)
+    parser.add_argument('--seed-days', type=int, default=60)
+    parser.add_argument('--baseline', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           'plan_baseline.json'))
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    if not args.database or args.database == 'attendance_db':
+        sys.exit("Pass --database (or PLAN_CHECK_DATABASE) naming a disposable local database")
+    backend.DB_CONFIG['database'] = args.database
+    # @read_replica endpoints must be explained against the check database too
+    backend.DB_REPLICA_CONFIG.update(backend.DB_CONFIG)
+
+    backend.apply_schema_migrations()
+    with backend.get_db_connection(read_only=False) as conn:
+        if args.seed_employees:
+            seed(conn, args.seed_employees, args.seed_days)
+
+        backend.sql_capture = []
+        exercise(conn)
+        captured, backend.sql_capture = backend.sql_capture, None
+
+        statements = {}
+        for statement, params in captured:
+            if EXPLAINABLE.match(statement) and not SKIPPED.match(statement):
+                statements.setdefault(fingerprint(statement), (statement, params))
+
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            baseline = {}
+
+        results = {}
+        failures = 0
+        for key, (statement, params) in sorted(statements.items()):
+            try:
+                plan = explain(conn, statement, params)
+            except backend.mysql.connector.Error as e:
+                print(f"[{key}] EXPLAIN failed: {e.msg}\n    {normalize(statement)[:120]}")
+                failures += 1
+                continue
+
+            rows = {t['table_name']: t.get('rows_examined_per_scan') for t in plan_tables(plan, [])}
+            results[key] = {'sql': normalize(statement)[:200], 'rows_examined_per_scan': rows}
+
+            problems = plan_problems(plan, set())
+            if problems and key not in PLAN_ALLOWLIST:
+                failures += 1
+                print(f"[{key}] FAIL {'; '.join(sorted(problems))}\n    {normalize(statement)[:120]}")
+
+            previous = baseline.get(key, {}).get('rows_examined_per_scan')
+            if previous is not None and previous != rows:
+                print(f"[{key}] rows examined changed: {previous} -> {rows}")
+
+    print(f"{len(results)} statements explained, {failures} failing")
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend  # noqa: E402
+
+
+class FakeCursor:
+    """
+    Stands in for a dictionary cursor. Each execute() asks the owning
+    connection's responder for the rows that statement returns.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+        self.rowcount = 0
+        self.lastrowid = None
+        self.with_rows = False
+
+    def execute(self, statement, params=None):
+        self.connection.executed.append((' '.join(statement.split()), params))
+        rows = self.connection.responder(statement, params)
+        self.rows = list(rows or [])
+        self.rowcount = len(self.rows)
+        self.with_rows = statement.lstrip().upper().startswith(('SELECT', 'SHOW'))
+
+    def executemany(self, statement, seq_params):
+        for params in seq_params:
+            self.execute(statement, params)
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    in_transaction = False
+
+    def __init__(self, responder):
+        self.responder = responder
+        self.executed = []
+        self.commits = 0
+        self.closes = 0
+
+    def cursor(self, dictionary=False, prepared=False):
+        return FakeCursor(self)
+
+    def start_transaction(self, **kwargs):
+        pass
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closes += 1
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """
+    Route every pooled connection to one FakeConnection. Tests set
+    `fake_db.responder` to a function (statement, params) -> rows.
+    """
+    connection = FakeConnection(lambda statement, params: [])
+    monkeypatch.setattr(backend, '_get_pooled_connection', lambda read_only: connection)
+    return connection
+
+
+@pytest.fixture
+def client():
+    backend.app.config['TESTING'] = True
+    return backend.app.test_client()
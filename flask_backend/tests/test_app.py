@@ -0,0 +1,25 @@
+import logging
+
+import backend
+
+
+def test_serving_without_factory_warns_once(monkeypatch, client, caplog):
+    monkeypatch.setattr(backend, '_app_created', False)
+
+    with caplog.at_level(logging.WARNING, logger='attendance'):
+        client.get('/api/monthlyrecords/current')
+        client.get('/api/monthlyrecords/current')
+
+    warnings = [r for r in caplog.records if 'without create_app()' in r.getMessage()]
+    assert len(warnings) == 1
+
+
+def test_factory_suppresses_the_warning(monkeypatch, fake_db, client, caplog):
+    monkeypatch.setattr(backend, '_app_created', False)
+    fake_db.responder = lambda statement, params: [{'name': name} for name, _ in backend.SCHEMA_MIGRATIONS]
+    backend.create_app(start_scheduler=False)
+
+    with caplog.at_level(logging.WARNING, logger='attendance'):
+        client.get('/api/monthlyrecords/current')
+
+    assert not [r for r in caplog.records if 'without create_app()' in r.getMessage()]
@@ -0,0 +1,74 @@
+import pytest
+
+import backend
+
+
+def archive_responder(live, archived):
+    """Attendance holds `live` {attendance_id: version}; AttendanceArchive holds `archived` ids"""
+    def responder(statement, params):
+        if 'FROM AttendanceArchive' in statement:
+            return [{'attendance_id': i} for i in params if i in archived]
+        if 'FOR UPDATE' in statement:
+            return [{'attendance_id': i, 'version': live[i]} for i in params if i in live]
+        if statement.lstrip().startswith('UPDATE Attendance'):
+            return [{}] if params[-1] in live else []
+        return []
+    return responder
+
+
+def test_update_of_archived_row_conflicts(client, fake_db):
+    fake_db.responder = archive_responder(live={}, archived={5})
+
+    response = client.put('/api/update_attendance', json={'attendance_id': 5, 'status': 'Present'})
+
+    assert response.status_code == 409
+    assert 'archived' in response.get_json()['message']
+
+
+def test_update_of_live_row(client, fake_db):
+    fake_db.responder = archive_responder(live={5: 0}, archived=set())
+
+    response = client.put('/api/update_attendance', json={'attendance_id': 5, 'status': 'Present'})
+
+    assert response.status_code == 200
+
+
+def test_batch_reports_archived_rows(client, fake_db):
+    fake_db.responder = archive_responder(live={1: 2}, archived={3})
+
+    response = client.put('/api/attendance/batch', json={'edits': [
+        {'attendance_id': 1, 'version': 2, 'status': 'Late'},
+        {'attendance_id': 2, 'status': 'Late'},
+        {'attendance_id': 3, 'status': 'Late'},
+    ]})
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert [r['outcome'] for r in body['results']] == ['updated', 'not_found', 'archived']
+    assert (body['updated'], body['not_found'], body['archived']) == (1, 1, 1)
+
+
+def test_batch_version_conflict(client, fake_db):
+    fake_db.responder = archive_responder(live={1: 3}, archived=set())
+
+    response = client.put('/api/attendance/batch', json={'edits': [{'attendance_id': 1, 'version': 2, 'status': 'Late'}]})
+
+    assert response.get_json()['results'] == [{'attendance_id': 1, 'outcome': 'conflict', 'version': 3}]
+
+
+def test_partitioning_migration_refuses_foreign_keys(fake_db):
+    fake_db.responder = lambda statement, params: [{
+        'CONSTRAINT_NAME': 'fk_attendance_employee', 'TABLE_NAME': 'Attendance', 'REFERENCED_TABLE_NAME': 'Employees'
+    }] if 'REFERENTIAL_CONSTRAINTS' in statement else []
+
+    with pytest.raises(RuntimeError, match='fk_attendance_employee'):
+        backend._attendance_partitions_migration(fake_db.cursor(dictionary=True))
+    assert not any(s.startswith(('CREATE', 'ALTER')) for s, _ in fake_db.executed)
+
+
+def test_partitioning_migration_without_foreign_keys(fake_db):
+    fake_db.responder = lambda statement, params: [{'first_day': None}] if 'MIN(date)' in statement else []
+
+    statements = backend._attendance_partitions_migration(fake_db.cursor(dictionary=True))
+
+    assert statements[-1].startswith('ALTER TABLE Attendance PARTITION BY RANGE COLUMNS(date)')
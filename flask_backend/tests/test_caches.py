@@ -0,0 +1,62 @@
+import backend
+
+
+def test_evicts_least_recently_used_entry():
+    cache = backend.LruCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(backend._time, 'monotonic', lambda: now[0])
+    cache = backend.LruCache(10, ttl=60)
+    cache.put('a', 1)
+
+    now[0] += 59
+    assert cache.get('a') == 1
+    now[0] += 2
+    assert cache.get('a') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_byte_bound_evicts_oldest_entries():
+    cache = backend.LruCache(100, max_bytes=10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    cache.put('c', b'1234')
+
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 8
+    assert cache.stats()['max_bytes'] == 10
+
+
+def test_entry_larger_than_the_bound_is_not_cached():
+    cache = backend.LruCache(100, max_bytes=10)
+    cache.put('a', b'1234')
+    cache.put('big', b'x' * 11)
+
+    assert cache.get('big') is None
+    assert cache.get('a') == b'1234'
+
+
+def test_replacing_and_invalidating_keep_the_byte_count():
+    cache = backend.LruCache(100, max_bytes=100)
+    cache.put('a', b'x' * 10)
+    cache.put('a', b'x' * 30)
+    assert cache.stats()['bytes'] == 30
+
+    cache.invalidate('a')
+    assert cache.stats()['bytes'] == 0
+
+
+def test_face_image_cache_counts_jpeg_bytes():
+    cache = backend.LruCache(100, max_bytes=100, sizeof=backend.face_image_cache.sizeof)
+    cache.put('uploads/7.jpg', (1700000000.0, b'x' * 40))
+
+    assert cache.stats()['bytes'] == 40
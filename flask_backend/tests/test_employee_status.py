@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+import pytest
+
+import backend
+
+
+@pytest.fixture(autouse=True)
+def clear_employee_cache():
+    backend.employee_cache.invalidate('7')
+    yield
+    backend.employee_cache.invalidate('7')
+
+
+def respond_with(attendance):
+    def responder(statement, params):
+        if 'FROM Employees' in statement:
+            return [{'employee_id': 7, 'name': 'Asha', 'photo_url': 'uploads/7.jpg', 'permanent_location': 'Store 1'}]
+        if 'FROM Attendance' in statement:
+            return [attendance] if attendance else []
+        return []
+    return responder
+
+
+@pytest.mark.parametrize('attendance, action', [
+    ({'attendance_id': 1, 'status': 'On Leave', 'check_in': None, 'check_out': None,
+      'current_location': None}, 'on_leave'),
+    ({'attendance_id': 1, 'status': 'Present', 'check_in': timedelta(hours=9), 'check_out': None,
+      'current_location': 'Store 1'}, 'check_out'),
+    ({'attendance_id': 1, 'status': 'Present', 'check_in': timedelta(hours=9), 'check_out': timedelta(hours=18),
+      'current_location': 'Store 1'}, 'already_completed'),
+])
+def test_employee_status_action(client, fake_db, attendance, action):
+    fake_db.responder = respond_with(attendance)
+
+    response = client.post('/api/employee-status', json={'employee_id': 7})
+
+    assert response.status_code == 200
+    assert response.get_json()['action'] == action
+
+
+def test_employee_status_unknown_employee(client, fake_db):
+    response = client.post('/api/employee-status', json={'employee_id': 7})
+    assert response.status_code == 404
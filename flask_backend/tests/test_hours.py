@@ -0,0 +1,48 @@
+from datetime import date
+
+import backend
+
+
+def test_weekly_hours_per_employee(client, fake_db):
+    fake_db.responder = lambda statement, params: [
+        {'employee_id': 7, 'name': 'Ana', 'store': 'Store 1', 'days_worked': 2,
+         'worked_seconds': 54000, 'hours': 15.0},
+        {'employee_id': 8, 'name': 'Ben', 'store': 'Store 1', 'days_worked': 1,
+         'worked_seconds': 9000, 'hours': 2.5},
+    ]
+
+    response = client.get('/api/hours', query_string={'date': '2024-05-08'})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['total_seconds'] == 63000 and body['total_hours'] == 17.5
+    statement, params = fake_db.executed[0]
+    assert params == [date(2024, 5, 6), date(2024, 5, 13)]
+    assert 'GROUP BY employee_id, current_location' in statement
+
+
+def test_monthly_hours_per_store_read_the_hot_table(client, fake_db):
+    this_month = date.today().replace(day=1)
+
+    response = client.get('/api/hours', query_string={
+        'period': 'month', 'group': 'store', 'store': 'Store 1', 'date': this_month.isoformat()})
+
+    assert response.status_code == 200
+    statement, params = fake_db.executed[0]
+    assert 'FROM Attendance ' in statement and 'GROUP BY current_location' in statement
+    assert params == [this_month, backend._add_months(this_month, 1), 'Store 1']
+
+
+def test_archived_months_read_the_union(client, fake_db):
+    old_month = backend._add_months(backend.attendance_archive_cutoff(), -1)
+
+    client.get('/api/hours', query_string={'period': 'month', 'date': old_month.isoformat()})
+
+    assert 'FROM AttendanceAll ' in fake_db.executed[0][0]
+
+
+def test_invalid_hours_parameters(client, fake_db):
+    assert client.get('/api/hours', query_string={'period': 'year'}).status_code == 400
+    assert client.get('/api/hours', query_string={'group': 'team'}).status_code == 400
+    assert client.get('/api/hours', query_string={'date': '08/05/2024'}).status_code == 400
+    assert fake_db.executed == []
@@ -0,0 +1,45 @@
+import backend
+
+
+class MarkedRows:
+    """Responder for mark_absent_employees: the insert marks `count` rows"""
+
+    def __init__(self, count):
+        self.count = count
+
+    def __call__(self, statement, params):
+        if 'INSERT' in statement:
+            return [{}] * self.count
+        if 'GROUP BY status' in statement:
+            return [{'status': 'Absent', 'total': self.count}]
+        return []
+
+
+def test_mark_absent_skips_rows_written_concurrently(fake_db, monkeypatch):
+    fake_db.responder = MarkedRows(3)
+    monkeypatch.setattr(backend, 'rebuild_headcounts', lambda days: None)
+
+    backend.mark_absent_employees()
+
+    statement, _ = fake_db.executed[0]
+    assert statement.startswith('INSERT IGNORE INTO Attendance')
+
+
+def test_mark_absent_rebuilds_headcounts_after_releasing_its_connection(fake_db, monkeypatch):
+    fake_db.responder = MarkedRows(3)
+    rebuilds = []
+    monkeypatch.setattr(backend, 'rebuild_headcounts', lambda days: rebuilds.append(fake_db.closes))
+
+    backend.mark_absent_employees()
+
+    assert rebuilds == [1]
+
+
+def test_mark_absent_without_new_rows_skips_rebuild(fake_db, monkeypatch):
+    fake_db.responder = MarkedRows(0)
+    rebuilds = []
+    monkeypatch.setattr(backend, 'rebuild_headcounts', lambda days: rebuilds.append(days))
+
+    backend.mark_absent_employees()
+
+    assert rebuilds == []
@@ -0,0 +1,99 @@
+import gzip
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+import pytest
+from flask import jsonify
+
+import backend
+
+ROW = {
+    'day': date(2024, 5, 6),
+    'at': datetime(2024, 5, 6, 9, 5, 7),
+    'cutoff': time(9, 45),
+    'check_in': timedelta(hours=9, minutes=5, seconds=7),
+    'overnight': timedelta(hours=-1),
+    'rate': Decimal('1.5'),
+    'tags': {'a'},
+    'blob': b'abc',
+    'name': 'Zoë',
+}
+EXPECTED = {
+    'day': '2024-05-06',
+    'at': '2024-05-06 09:05:07',
+    'cutoff': '09:45:00',
+    'check_in': '9:05:07',
+    'overnight': '-1:00:00',
+    'rate': 1.5,
+    'tags': ['a'],
+    'blob': 'abc',
+    'name': 'Zoë',
+}
+
+
+@pytest.mark.parametrize('encoder', ['orjson', 'stdlib'])
+def test_encodes_database_types_the_same_with_either_encoder(encoder):
+    if encoder == 'orjson':
+        pytest.importorskip('orjson')
+    provider = backend.FastJSONProvider(backend.app, backend=encoder)
+
+    assert provider.name == encoder
+    assert json.loads(provider.dumps_bytes(ROW)) == EXPECTED
+    assert json.loads(provider.dumps(ROW)) == EXPECTED
+
+
+def test_keys_keep_insertion_order():
+    provider = backend.FastJSONProvider(backend.app, backend='stdlib')
+    assert provider.dumps({'b': 1, 'a': 2}) == '{"b": 1, "a": 2}'
+
+
+def test_unknown_types_are_rejected():
+    with pytest.raises(TypeError):
+        backend.json_default(object())
+
+
+def compressed(payload, accept_encoding, **kwargs):
+    with backend.app.test_request_context('/', headers={'Accept-Encoding': accept_encoding}):
+        response = jsonify(payload)
+        for name, value in kwargs.items():
+            setattr(response, name, value)
+        return backend.compress_response(response)
+
+
+def large_payload():
+    return [{'employee_id': i, 'status': 'Present'} for i in range(200)]
+
+
+def test_large_json_is_gzipped(monkeypatch):
+    monkeypatch.setattr(backend, '_brotli', False)
+    response = compressed(large_payload(), 'gzip, deflate')
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert json.loads(gzip.decompress(response.get_data())) == large_payload()
+
+
+def test_brotli_is_preferred_when_installed():
+    brotli = pytest.importorskip('brotli')
+    response = compressed(large_payload(), 'br, gzip')
+
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(response.get_data())) == large_payload()
+
+
+def test_small_responses_are_left_alone():
+    response = compressed({'ok': True}, 'gzip')
+
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.vary
+
+
+def test_identity_only_clients_get_plain_json():
+    response = compressed(large_payload(), 'identity')
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_error_responses_are_compressed_but_not_304s():
+    assert compressed(large_payload(), 'gzip', status_code=500).headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Encoding' not in compressed(large_payload(), 'gzip', status_code=304).headers
@@ -0,0 +1,81 @@
+import re
+from datetime import datetime
+
+import backend
+
+
+def late_request(request_id, status):
+    return {
+        'request_id': request_id,
+        'employee_id': 100 + request_id,
+        'requested_at': datetime(2024, 5, 6, 9, 20),
+        'status': status,
+        'name': f"Employee {request_id}",
+        'permanent_location': 'Store 1',
+    }
+
+
+def respond_with_requests(*rows):
+    def responder(statement, params):
+        if 'FOR UPDATE' in statement:
+            return [row for row in rows if row['request_id'] in params]
+        return []
+    return responder
+
+
+def test_only_pending_requests_are_decided(fake_db):
+    fake_db.responder = respond_with_requests(late_request(1, 'Pending'), late_request(2, 'Rejected'))
+    cursor = fake_db.cursor(dictionary=True)
+
+    outcomes = backend.decide_late_requests(fake_db, cursor, {1: 'Accepted', 2: 'Accepted', 3: 'Rejected'})
+
+    assert [o['outcome'] for o in outcomes] == ['accepted', 'already_decided', 'not_found']
+    assert outcomes[1]['status'] == 'Rejected'
+    upserts = [(s, p) for s, p in fake_db.executed if s.startswith('INSERT INTO Attendance')]
+    assert len(upserts) == 1 and upserts[0][1] == [1]
+
+
+def test_attendance_upsert_qualifies_attendance_columns(fake_db):
+    fake_db.responder = respond_with_requests(late_request(1, 'Pending'))
+    cursor = fake_db.cursor(dictionary=True)
+
+    backend.decide_late_requests(fake_db, cursor, {1: 'Rejected'})
+
+    statement = next(s for s, _ in fake_db.executed if s.startswith('INSERT INTO Attendance'))
+    update = statement.split('ON DUPLICATE KEY UPDATE', 1)[1]
+    # LateArrivalRequests also has a status column; a bare reference is ambiguous (MySQL error 1052)
+    assert not re.search(r'(?<![.\w(])(status|version|check_in|current_location)\b(?!\))', update)
+
+
+def test_single_decision_conflicts_when_already_decided(client, fake_db):
+    fake_db.responder = respond_with_requests(late_request(1, 'Accepted'))
+
+    response = client.put('/api/late-arrival-requests/1/status', json={'status': 'Rejected'})
+
+    assert response.status_code == 409
+    assert response.get_json()['status'] == 'Accepted'
+
+
+def test_bulk_decisions_report_each_outcome(client, fake_db):
+    fake_db.responder = respond_with_requests(late_request(1, 'Pending'), late_request(2, 'Accepted'))
+
+    response = client.put('/api/late-arrival-requests/status', json={'decisions': [
+        {'request_id': 1, 'status': 'Rejected'},
+        {'request_id': 2, 'status': 'Rejected'},
+        {'request_id': 3, 'status': 'Accepted'},
+    ]})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['rejected'], body['already_decided'], body['not_found']) == (1, 1, 1)
+
+
+def test_bulk_decisions_reject_invalid_bodies_whole(client, fake_db):
+    response = client.put('/api/late-arrival-requests/status', json={'decisions': [
+        {'request_id': 1, 'status': 'Rejected'},
+        {'request_id': 1, 'status': 'Accepted'},
+    ]})
+
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == [{'index': 1, 'error': 'request_id appears more than once'}]
+    assert fake_db.executed == []
@@ -0,0 +1,46 @@
+from datetime import date, datetime
+
+
+def leave_rows(count):
+    return [{
+        'request_id': 100 - i,
+        'employee_id': 7,
+        'name': 'Asha',
+        'start_date': date(2024, 5, 20 - i),
+        'end_date': date(2024, 5, 21 - i),
+        'reason': 'Family',
+        'status': 'Pending',
+        'request_date': datetime(2024, 5, 1, 10, 30),
+    } for i in range(count)]
+
+
+def test_unpaged_listing_keeps_the_array_response(client, fake_db):
+    fake_db.responder = lambda statement, params: leave_rows(3) if 'FROM LeaveRequests l' in statement else []
+
+    response = client.get('/api/leave-requests')
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert isinstance(body, list) and len(body) == 3
+    assert body[0]['start_date'] == '2024-05-20'
+    assert body[0]['request_date'] == '2024-05-01 10:30:00'
+    assert 'LIMIT' not in fake_db.executed[0][0]
+
+
+def test_paged_listing(client, fake_db):
+    def responder(statement, params):
+        if 'GROUP BY l.status' in statement:
+            return [{'status': 'Pending', 'total': 3}]
+        return leave_rows(3)[:params[-1]]
+    fake_db.responder = responder
+
+    response = client.get('/api/leave-requests?limit=2')
+
+    body = response.get_json()
+    assert [row['request_id'] for row in body['requests']] == [100, 99]
+    assert body['next_cursor'] == '2024-05-19.99'
+    assert body['counts'] == {'Pending': 3, 'Approved': 0, 'Rejected': 0}
+
+
+def test_invalid_limit(client, fake_db):
+    assert client.get('/api/leave-requests?limit=0').status_code == 400
@@ -0,0 +1,43 @@
+import pytest
+
+import backend
+
+
+@pytest.fixture
+def slow_compreface(monkeypatch):
+    latency = backend.DecayingAverage(half_life=3600)
+    latency.add(backend.LOAD_SHED_COMPREFACE_MS * 10)
+    monkeypatch.setattr(backend, 'compreface_latency_ms', latency)
+
+
+def test_healthy_system_has_no_pressure(monkeypatch):
+    monkeypatch.setattr(backend, 'compreface_latency_ms', backend.DecayingAverage())
+    assert backend.system_pressure() == []
+
+
+def test_deferrable_requests_are_shed_under_pressure(slow_compreface, fake_db, client):
+    shed_before = backend.load_shedding_stats['shed']
+
+    response = client.get('/api/hours')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(backend.LOAD_SHED_RETRY_AFTER)
+    assert response.get_json()['reason'] == ['compreface']
+    assert backend.load_shedding_stats['shed'] == shed_before + 1
+    assert fake_db.executed == []
+
+
+def test_critical_requests_are_admitted_under_pressure(slow_compreface, fake_db, client):
+    response = client.post('/api/employee-status', json={})
+
+    # Reaches the view (and its validation) instead of being shed
+    assert response.status_code == 400
+
+
+def test_load_status_reports_pressure(slow_compreface, client):
+    response = client.get('/api/load-status')
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['pressure'] == ['compreface']
+    assert set(body['in_flight']) == {backend.CRITICAL, backend.DEFERRABLE}
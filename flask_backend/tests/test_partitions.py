@@ -0,0 +1,48 @@
+from datetime import date
+
+import pytest
+
+import backend
+
+
+@pytest.mark.parametrize('day, months, expected', [
+    (date(2024, 1, 31), 1, date(2024, 2, 1)),
+    (date(2024, 12, 15), 1, date(2025, 1, 1)),
+    (date(2024, 3, 1), -3, date(2023, 12, 1)),
+    (date(2024, 3, 1), -15, date(2022, 12, 1)),
+])
+def test_add_months_lands_on_the_first(day, months, expected):
+    assert backend._add_months(day, months) == expected
+
+
+def test_partition_clause_covers_one_month():
+    assert backend._partition_clause(date(2024, 12, 1)) == \
+        "PARTITION p202412 VALUES LESS THAN ('2025-01-01')"
+
+
+def test_archive_cutoff_keeps_the_hot_months():
+    cutoff = backend.attendance_archive_cutoff()
+    this_month = date.today().replace(day=1)
+
+    assert cutoff.day == 1
+    assert backend._add_months(cutoff, backend.ATTENDANCE_HOT_MONTHS - 1) == this_month
+
+
+def test_recent_ranges_read_attendance():
+    assert backend.attendance_table(date.today()) == 'Attendance'
+    assert backend.attendance_table(backend.attendance_archive_cutoff()) == 'Attendance'
+
+
+def test_ranges_reaching_archived_months_read_the_union():
+    before_cutoff = backend._add_months(backend.attendance_archive_cutoff(), -1)
+    assert backend.attendance_table(before_cutoff) == 'AttendanceAll'
+
+
+def test_partitioning_starts_at_the_first_month_with_data(fake_db):
+    fake_db.responder = lambda statement, params: [{'first_day': date(2023, 7, 19)}]
+
+    statement = backend._attendance_partitioning_sql(fake_db.cursor(dictionary=True))
+
+    assert 'PARTITION p202306' not in statement
+    assert "PARTITION p202307 VALUES LESS THAN ('2023-08-01')" in statement
+    assert statement.endswith("PARTITION pmax VALUES LESS THAN (MAXVALUE))")
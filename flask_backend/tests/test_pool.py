@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+import backend
+
+
+class RawConnection:
+    """Enough of a mysql-connector connection for AdaptiveConnectionPool"""
+    in_transaction = False
+    connection_id = 1
+
+    def __init__(self):
+        self.closed = False
+
+    def is_connected(self):
+        return not self.closed
+
+    def ping(self, reconnect=False):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    monkeypatch.setattr(backend.mysql.connector, 'connect', lambda **config: RawConnection())
+
+    def make_pool(min_size=0, max_size=1, acquire_timeout=1.0, max_waiters=None):
+        return backend.AdaptiveConnectionPool(
+            'test', min_size=min_size, max_size=max_size, acquire_timeout=acquire_timeout,
+            idle_timeout=300, health_check_after=30, reset_session=False, max_waiters=max_waiters)
+    return make_pool
+
+
+def wait_for_waiters(pool, count):
+    deadline = time.monotonic() + 1
+    while pool.stats()['waiters'] < count:
+        assert time.monotonic() < deadline, 'waiter never queued'
+        time.sleep(0.001)
+
+
+def test_prewarm_and_reuse(make_pool):
+    pool = make_pool(min_size=2, max_size=4)
+    assert pool.stats()['size'] == 2
+
+    first = pool.get_connection()
+    first.close()
+    second = pool.get_connection()
+    second.close()
+
+    stats = pool.stats()
+    assert (stats['size'], stats['in_use'], stats['idle'], stats['opened']) == (2, 0, 2, 2)
+
+
+def test_grows_to_max_size_then_times_out(make_pool):
+    pool = make_pool(max_size=2, acquire_timeout=0.05)
+    held = [pool.get_connection(), pool.get_connection()]
+
+    with pytest.raises(backend.PoolTimeoutError):
+        pool.get_connection()
+
+    assert pool.stats()['timeouts'] == 1
+    for connection in held:
+        connection.close()
+
+
+def test_waiters_are_served_in_arrival_order(make_pool):
+    pool = make_pool(max_size=1)
+    held = pool.get_connection()
+    served = []
+
+    def wait(name):
+        connection = pool.get_connection()
+        served.append(name)
+        connection.close()
+
+    threads = []
+    for index, name in enumerate(('first', 'second', 'third')):
+        thread = threading.Thread(target=wait, args=(name,))
+        thread.start()
+        wait_for_waiters(pool, index + 1)
+        threads.append(thread)
+    held.close()
+    for thread in threads:
+        thread.join()
+
+    assert served == ['first', 'second', 'third']
+
+
+def test_max_waiters_fails_fast(make_pool):
+    pool = make_pool(max_size=1, acquire_timeout=5, max_waiters=1)
+    held = pool.get_connection()
+    waiter = threading.Thread(target=lambda: pool.get_connection().close())
+    waiter.start()
+    wait_for_waiters(pool, 1)
+
+    started = time.monotonic()
+    with pytest.raises(backend.PoolSaturatedError):
+        pool.get_connection()
+    assert time.monotonic() - started < 1
+
+    held.close()
+    waiter.join()
+    stats = pool.stats()
+    assert (stats['rejected'], stats['waiters'], stats['max_waiters']) == (1, 0, 1)
+
+
+def test_saturation_is_a_pool_timeout(make_pool):
+    assert issubclass(backend.PoolSaturatedError, backend.PoolTimeoutError)
+    assert issubclass(backend.PoolTimeoutError, backend.mysql.connector.errors.PoolError)
+
+
+def test_broken_connection_is_replaced_on_release(make_pool):
+    pool = make_pool(max_size=1)
+    connection = pool.get_connection()
+    connection.slot.raw.closed = True
+    connection.close()
+
+    replacement = pool.get_connection()
+    assert not replacement.slot.raw.closed
+    replacement.close()
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+import backend
+
+
+def test_bucket_allows_capacity_then_refuses():
+    limiter = backend.TokenBucketLimiter('test', '3/60')
+
+    assert [limiter.acquire('a') for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire('a') == pytest.approx(20, abs=0.1)
+    assert limiter.acquire('b') == 0
+
+
+def test_peek_does_not_take_a_token():
+    limiter = backend.TokenBucketLimiter('test', '1/60')
+
+    assert limiter.peek('a') == 0
+    assert limiter.peek('a') == 0
+    assert limiter.acquire('a') == 0
+    assert limiter.peek('a') > 0
+
+
+def test_refund_returns_a_token():
+    limiter = backend.TokenBucketLimiter('test', '1/60')
+    limiter.acquire('a')
+
+    limiter.refund('a')
+
+    assert limiter.acquire('a') == 0
+
+
+def test_refused_request_is_not_charged_to_other_buckets():
+    client = backend.TokenBucketLimiter('client', '5/60')
+    employee = backend.TokenBucketLimiter('employee', '1/60')
+    employee.acquire('7')
+
+    refused = backend.take_tokens([('client', client, 'kiosk'), ('employee', employee, '7')])
+
+    assert refused[0] == 'employee'
+    assert [client.acquire('kiosk') for _ in range(5)] == [0] * 5
+
+
+def test_take_tokens_charges_every_bucket():
+    client = backend.TokenBucketLimiter('client', '1/60')
+    store = backend.TokenBucketLimiter('store', '1/60')
+
+    assert backend.take_tokens([('client', client, 'kiosk'), ('store', store, 'Store 1')]) is None
+    assert client.peek('kiosk') > 0 and store.peek('Store 1') > 0
+
+
+def test_rate_limited_answers_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(backend, 'client_limiter', backend.TokenBucketLimiter('client', '1/60'))
+    view = backend.rate_limited(lambda: 'ok')
+
+    with backend.app.test_request_context('/check_in', method='POST', headers={'X-Device-Id': 'kiosk'}):
+        assert view() == 'ok'
+        response = view()
+
+    assert response.status_code == 429
+    assert response.get_json()['reason'] == 'client'
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_compreface_busy_becomes_429(monkeypatch):
+    monkeypatch.setattr(backend, 'compreface_slots', threading.BoundedSemaphore(1))
+    monkeypatch.setattr(backend, 'COMPREFACE_SLOT_WAIT_SECONDS', 0.01)
+
+    def view():
+        with backend.compreface_slot():
+            with backend.compreface_slot():
+                return 'unreachable'
+
+    with backend.app.test_request_context('/check_in', method='POST', headers={'X-Device-Id': 'busy-kiosk'}):
+        response = backend.rate_limited(view)()
+
+    assert response.status_code == 429
+    assert response.get_json()['reason'] == 'compreface_busy'
+    assert backend._compreface_in_flight == 0
+
+
+def test_compreface_slot_is_not_held_outside_calls(monkeypatch):
+    monkeypatch.setattr(backend, 'compreface_slots', threading.BoundedSemaphore(1))
+    seen = []
+
+    def view():
+        seen.append(backend._compreface_in_flight)
+        with backend.compreface_slot():
+            seen.append(backend._compreface_in_flight)
+        return 'ok'
+
+    with backend.app.test_request_context('/check_in', method='POST', headers={'X-Device-Id': 'idle-kiosk'}):
+        assert backend.rate_limited(view)() == 'ok'
+
+    assert seen == [0, 1]
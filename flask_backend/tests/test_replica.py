@@ -0,0 +1,63 @@
+import pytest
+
+import backend
+
+
+@pytest.fixture(autouse=True)
+def clear_writers():
+    backend._recent_writers.clear()
+    yield
+    backend._recent_writers.clear()
+
+
+def wrote_recently(path, **kwargs):
+    with backend.app.test_request_context(path, **kwargs):
+        return backend._wrote_recently()
+
+
+def record_write(path, **kwargs):
+    with backend.app.test_request_context(path, **kwargs):
+        backend.remember_writers(backend.app.response_class(status=200))
+
+
+def test_admin_reads_its_own_edit_without_an_employee_id():
+    record_write('/api/update_attendance', method='PUT', json={'employee_id': 7},
+                 environ_base={'REMOTE_ADDR': '10.0.0.5'})
+
+    assert wrote_recently('/api/attendance', environ_base={'REMOTE_ADDR': '10.0.0.5'})
+    assert not wrote_recently('/api/attendance', environ_base={'REMOTE_ADDR': '10.0.0.6'})
+
+
+def test_employee_reads_follow_the_employee_across_devices():
+    record_write('/api/check_in', method='POST', data={'employee_id': '7'}, headers={'X-Device-Id': 'kiosk-1'})
+
+    assert wrote_recently('/api/employee_status/7', headers={'X-Device-Id': 'kiosk-2'}, query_string={'employee_id': 7})
+    assert not wrote_recently('/api/employee_status/8', headers={'X-Device-Id': 'kiosk-2'}, query_string={'employee_id': 8})
+
+
+def test_device_header_replaces_the_shared_address():
+    record_write('/api/check_in', method='POST', headers={'X-Device-Id': 'kiosk-1'},
+                 environ_base={'REMOTE_ADDR': '10.0.0.5'})
+
+    assert not wrote_recently('/api/attendance', headers={'X-Device-Id': 'kiosk-2'},
+                              environ_base={'REMOTE_ADDR': '10.0.0.5'})
+
+
+def test_failed_writes_are_not_recorded():
+    with backend.app.test_request_context('/api/check_in', method='POST', data={'employee_id': '7'}):
+        backend.remember_writers(backend.app.response_class(status=400))
+
+    assert backend._recent_writers == {}
+
+
+@pytest.mark.parametrize('status, lag', [
+    (None, None),
+    ({'Seconds_Behind_Source': None}, None),
+    ({'Seconds_Behind_Source': 3}, 3),
+    ({'Seconds_Behind_Master': 4}, 4),
+])
+def test_replica_lag(monkeypatch, fake_db, status, lag):
+    fake_db.responder = lambda statement, params: [status] if status else []
+    monkeypatch.setattr(backend, 'get_replica_pool', lambda: type('Pool', (), {'get_connection': lambda self: fake_db})())
+
+    assert backend._check_replica_lag() == lag
@@ -0,0 +1,38 @@
+from datetime import date
+
+
+def test_dynamic_monthly_records(client, fake_db):
+    fake_db.responder = lambda statement, params: [{
+        'employee_id': 1,
+        'name': 'Asha',
+        'permanent_location': 'Store 1',
+        'days_present': 3,
+        'late_days': 1,
+        'absent_days': 0,
+        'on_leave_days': 1,
+        'total_recorded_days': 5,
+    }]
+
+    response = client.post('/api/monthlyrecords/dynamic',
+                           json={'start_date': '2024-01-01', 'end_date': '2024-01-31'})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success'] is True
+    assert body['records'][0]['daysWorked'] == 4
+    assert body['period']['total_working_days'] == 23
+
+
+def test_dynamic_monthly_records_reads_archive_for_old_months(client, fake_db):
+    start = date(date.today().year - 3, 1, 1)
+    response = client.post('/api/monthlyrecords/dynamic',
+                           json={'start_date': start.isoformat(), 'end_date': start.replace(day=31).isoformat()})
+
+    assert response.status_code == 200
+    statement, _ = fake_db.executed[0]
+    assert 'FROM AttendanceAll' in statement
+
+
+def test_dynamic_monthly_records_requires_dates(client, fake_db):
+    response = client.post('/api/monthlyrecords/dynamic', json={'start_date': '2024-01-01'})
+    assert response.status_code == 400
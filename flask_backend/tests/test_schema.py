@@ -0,0 +1,40 @@
+from datetime import date
+
+import mysql.connector
+import pytest
+
+import backend
+
+
+def test_create_app_refuses_pending_migrations(fake_db):
+    applied = [{'name': name} for name, _ in backend.SCHEMA_MIGRATIONS[:5]]
+    fake_db.responder = lambda statement, params: applied
+
+    with pytest.raises(RuntimeError, match='0006_attendance_version'):
+        backend.create_app(start_scheduler=False)
+
+
+def test_pending_migrations_without_migrations_table(fake_db):
+    def responder(statement, params):
+        raise mysql.connector.Error(msg="Table 'SchemaMigrations' doesn't exist", errno=backend.ER_NO_SUCH_TABLE)
+    fake_db.responder = responder
+
+    assert backend.pending_schema_migrations() == [name for name, _ in backend.SCHEMA_MIGRATIONS]
+
+
+def test_create_app_with_current_schema(fake_db):
+    fake_db.responder = lambda statement, params: [{'name': name} for name, _ in backend.SCHEMA_MIGRATIONS]
+    assert backend.create_app(start_scheduler=False) is backend.app
+
+
+def test_attendance_upsert_bumps_version():
+    update = backend.HOT_QUERIES['upsert_attendance'].split('ON DUPLICATE KEY UPDATE', 1)[1]
+    assert 'version = version + 1' in update
+
+
+def test_leave_days_bump_version_of_converted_rows(fake_db):
+    cursor = fake_db.cursor(dictionary=True)
+    backend.record_leave_days(cursor, 7, date(2024, 5, 6), date(2024, 5, 7))
+
+    statement, _ = fake_db.executed[0]
+    assert "version = IF(status = 'Absent', version + 1, version)" in statement